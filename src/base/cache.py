@@ -0,0 +1,183 @@
+from collections import OrderedDict
+from typing import Any, Hashable
+
+
+class LRUCache:
+    """
+    A least-recently-used cache that is bounded by its number of entries and/or by the memory its values take up.
+
+    Keeps hit/miss counters so that callers can see how effective the cache is.
+    """
+
+    def __init__(self, max_entries: int | None = None, max_bytes: int | None = None) -> None:
+        """
+        :param max_entries:    maximum number of entries to keep, or ``None`` for no limit
+        :param max_bytes:      maximum total size of the cached values in bytes, or ``None`` for no limit
+        """
+        self._entries: OrderedDict[Hashable, tuple[Any, int]] = OrderedDict()
+        self._nbytes = 0
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        if key not in self._entries:
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return self._entries[key][0]
+
+    def put(self, key: Hashable, value: Any, size: int | None = None) -> bool:
+        """
+        Store *value* under *key*, evicting the least recently used entries if the cache is full.
+
+        :param size:    size of the value in bytes, defaults to ``value.nbytes``
+        :return:        whether the value was stored; values that are larger than the whole budget are not
+        """
+        if size is None:
+            size = getattr(value, "nbytes", 0)
+
+        if self.max_bytes is not None and size > self.max_bytes:
+            return False
+
+        self.discard(key)
+        self._entries[key] = (value, size)
+        self._nbytes += size
+        self._evict()
+        return True
+
+    def discard(self, key: Hashable) -> None:
+        if key in self._entries:
+            _, size = self._entries.pop(key)
+            self._nbytes -= size
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._nbytes = 0
+
+    def reset_statistics(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def nbytes(self) -> int:
+        return self._nbytes
+
+    def _evict(self) -> None:
+        while self._entries and (
+                (self.max_entries is not None and len(self._entries) > self.max_entries) or
+                (self.max_bytes is not None and self._nbytes > self.max_bytes)):
+            _, (_, size) = self._entries.popitem(last=False)
+            self._nbytes -= size
+            self.evictions += 1
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __str__(self):
+        return f"LRUCache[{len(self._entries)} entries, {self._nbytes} bytes, hits={self.hits}, misses={self.misses}]"
+
+
+class PrefixStateCache:
+    """
+    Intermediate states of a simulation, checkpointed at time steps (columns) of the circuit,
+    so that after an edit only the columns from the earliest changed one onwards have to be simulated again.
+
+    Checkpoints belong to one (number of qubits, input) *key* and to the signatures of the columns they were
+    computed from. A different key, such as after adding or removing a qubit, drops everything.
+    The checkpoints together never take up more than *max_bytes*.
+    """
+
+    MAX_CHECKPOINTS = 32
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self._key: Hashable | None = None
+        self._signatures: list[tuple] = []
+        # column index -> state before that column was applied
+        self._checkpoints: dict[int, Any] = {}
+        self._nbytes = 0
+        self._version: int | None = None
+        self._result: Any = None
+
+    def result_for(self, key: Hashable, version: int) -> Any:
+        """The final state of the last simulation, if it was for *key* and the same circuit *version*"""
+        if self._result is not None and self._key == key and self._version == version:
+            return self._result
+        return None
+
+    def resume_point(self, key: Hashable, signatures: list[tuple]) -> tuple[int, Any]:
+        """
+        Find the latest checkpoint that is unaffected by the differences between *signatures* and the
+        signatures the checkpoints were computed from, dropping every checkpoint after the earliest change.
+
+        :return:    the column to continue simulating from and the state before that column,
+                    or ``(0, None)`` if the simulation has to start over
+        """
+        if key != self._key:
+            self.clear()
+            self._key = key
+            return 0, None
+
+        first_change = 0
+        while (first_change < len(signatures) and first_change < len(self._signatures)
+               and signatures[first_change] == self._signatures[first_change]):
+            first_change += 1
+
+        for column in [column for column in self._checkpoints if column > first_change]:
+            self._drop(column)
+        self._signatures = signatures[:first_change]
+        self._result = None
+
+        if not self._checkpoints:
+            return 0, None
+        column = max(self._checkpoints)
+        return column, self._checkpoints[column]
+
+    def stride(self, num_columns: int, state_bytes: int) -> int:
+        """The number of columns between checkpoints that keeps the checkpoints within the memory budget"""
+        affordable = min(self.max_bytes // max(state_bytes, 1), PrefixStateCache.MAX_CHECKPOINTS)
+        if affordable <= 0:
+            return max(num_columns, 1)
+        return max(1, -(-num_columns // (affordable + 1)))
+
+    def store(self, column: int, state: Any) -> None:
+        self._drop(column)
+        size = state.nbytes
+        if self._nbytes + size > self.max_bytes:
+            return
+        self._checkpoints[column] = state
+        self._nbytes += size
+
+    def finish(self, signatures: list[tuple], version: int, result: Any) -> None:
+        self._signatures = signatures
+        self._version = version
+        self._result = result
+
+    def clear(self) -> None:
+        self._key = None
+        self._signatures = []
+        self._checkpoints.clear()
+        self._nbytes = 0
+        self._version = None
+        self._result = None
+
+    @property
+    def checkpoints(self) -> list[int]:
+        return sorted(self._checkpoints)
+
+    @property
+    def nbytes(self) -> int:
+        return self._nbytes
+
+    def _drop(self, column: int) -> None:
+        if column in self._checkpoints:
+            self._nbytes -= self._checkpoints.pop(column).nbytes
@@ -1,92 +1,62 @@
 from collections import deque
+from enum import Enum
 from typing import Callable
+import hashlib
 import numpy as np
+from base import near_clifford, sparse, stabilizer
+from base.decision_diagram import DecisionDiagram
+from base.factorization import ProductDistribution, SubsystemState, interaction_groups
+from base.hybrid import HybridCircuit, fuse_within_blocks
+from base.mps import MatrixProductState
+from base.path_sum import PathSum
+from base.reversible import BasisState, ReversibleCircuit
+from base.sparse_state import SparseState
+from base.tensor_network import TensorNetwork
+from base.cache import LRUCache, PrefixStateCache
+from base.fusion import FusionResult, accumulate_diagonal_gates, fuse_gates
+from base.kernels import GateInstruction, MultiQubitInstruction, SingleQubitInstruction, apply_controlled_not, \
+    apply_controlled_phase, apply_swap, complex_dtype
 from base.models import CircuitDefinition, MultiOperationType, OperationType, QuBitOperationBase, QuBitOperationMultiParam, QuBitOperationSingleParam
 
-# def _cnot(n: int, control: int, target: int):
-#     # Used this as a reference to generate this dynamically for arbitrary target & control qubits
-#     # https://quantumcomputing.stackexchange.com/a/5192
-
-#     cnot1 = np.array(1, dtype=complex)
-#     cnot2 = np.array(1, dtype=complex)
-
-#     # if the control-th qubit is 0, leave the target-th qubit alone
-#     # if the control-th qubit is 1, apply X to the target-th qubit
-
-#     for i in range(0, n):
-#         if i == control:
-#             cnot1 = np.kron(cnot1, (QuantumComputer.BRA_0 @ QuantumComputer.KET_0))
-#             cnot2 = np.kron(cnot2, (QuantumComputer.BRA_1 @ QuantumComputer.KET_1))
-#         elif i == target:
-#             cnot1 = np.kron(cnot1, QuantumComputer.IDENTITY)
-#             cnot2 = np.kron(cnot2, QuantumComputer.SINGLE_MAPPINGS[OperationType.X])
-#         else:
-#             cnot1 = np.kron(cnot1, QuantumComputer.IDENTITY)
-#             cnot2 = np.kron(cnot2, QuantumComputer.IDENTITY)
-    
-#     return cnot1 + cnot2
-
-# def _cz(n: int, control: int, target: int):
-#     # essentially based on the above pattern with _cnot
-#     cz1 = np.array(1, dtype=complex)
-#     cz2 = np.array(1, dtype=complex)
-
-#     # if the control-th qubit is 0, leave the target-th qubit alone
-#     # if the control-th qubit is 1, apply Z to the target-th qubit
-
-#     for i in range(0, n):
-#         if i == control:
-#             cz1 = np.kron(cz1, (QuantumComputer.BRA_0 @ QuantumComputer.KET_0))
-#             cz2 = np.kron(cz2, (QuantumComputer.BRA_1 @ QuantumComputer.KET_1))
-#         elif i == target:
-#             cz1 = np.kron(cz1, QuantumComputer.IDENTITY)
-#             cz2 = np.kron(cz2, QuantumComputer.SINGLE_MAPPINGS[OperationType.Z])
-#         else:
-#             cz1 = np.kron(cz1, QuantumComputer.IDENTITY)
-#             cz2 = np.kron(cz2, QuantumComputer.IDENTITY)
-    
-#     return cz1 + cz2
-
-def _produceGenericNotGateFn(singleGate):
-    """
-    Produce a callback to dynamically build the *conditional gate* of type *singleGate*
-    """
-
-    # Used this as a reference to generate this dynamically for arbitrary target & control qubits
-    # https://quantumcomputing.stackexchange.com/a/5192
+class SimulationBackend(Enum):
+    # dense state vectors, except for measurement probabilities and samples on a basis state input, which use
+    # the stabilizer tableau for Clifford circuits and the stabilizer sum for circuits with few T, T_dg and CS gates;
+    # circuits that only permute basis states (X, CNOT, SWAP and phase gates) run as bit operations on basis inputs,
+    # and basis inputs on many qubits start out as a sparse state (see :attr:`QuantumComputer.SPARSE_STATE_MIN_QUBITS`)
+    AUTO = 0
+    # gate kernels applied directly to the state tensor
+    DENSE = 1
+    # per-step operators in CSR form, applied as sparse matrix-vector products (requires scipy)
+    SPARSE = 2
+    # stabilizer tableau; only supports Clifford circuits, and only measurement probabilities and samples
+    STABILIZER = 3
+    # sum of stabilizer states, exponential in the number of T, T_dg and CS gates only;
+    # only supports measurement probabilities and samples
+    NEAR_CLIFFORD = 4
+    # matrix product state, with optional truncation of the bonds (see :class:`base.mps.MatrixProductState`)
+    MPS = 5
+    # decision diagram that shares repeated parts of the state (see :class:`base.decision_diagram.DecisionDiagram`)
+    DECISION_DIAGRAM = 6
+    # sorted arrays of the non-zero amplitudes (see :class:`base.sparse_state.SparseState`) while at most the fill ratio
+    # of the amplitudes is non-zero, and a dense state vector while more are; switches both ways after every time step
+    SPARSE_STATE = 7
 
-    def fn(n: int, control: int, target: int):
-        m1 = np.array(1, dtype=complex)
-        m2 = np.array(1, dtype=complex)
 
-        # if the control-th qubit is 0, leave the target-th qubit alone
-        # if the control-th qubit is 1, apply *singleGate* to the target-th qubit
+def _produceControlledPhaseFn(singleGate):
+    """
+    Produce a kernel for the *conditional gate* of the diagonal gate *singleGate*:
+    for a diagonal gate only the control=1/target=1 amplitudes pick up a phase
+    """
+    phase = singleGate[1][1]
+    # a real phase (the sign of CZ) keeps a real state real
+    phase = phase.real if phase.imag == 0 else phase
 
-        for i in range(0, n):
-            if i == control:
-                m1 = np.kron(m1, (QuantumComputer.BRA_0 @ QuantumComputer.KET_0))
-                m2 = np.kron(m2, (QuantumComputer.BRA_1 @ QuantumComputer.KET_1))
-            elif i == target:
-                m1 = np.kron(m1, QuantumComputer.IDENTITY)
-                m2 = np.kron(m2, singleGate)
-            else:
-                m1 = np.kron(m1, QuantumComputer.IDENTITY)
-                m2 = np.kron(m2, QuantumComputer.IDENTITY)
-    
-        return m1 + m2
+    def fn(state: np.ndarray, control: int, target: int):
+        return apply_controlled_phase(state, control, target, phase)
 
     return fn
 
 
-def _swap(n: int, control: int, target: int):
-    # Leveraged this idea: https://quantumcomputing.stackexchange.com/a/24051
-    # cnot1 = _cnot(n, control, target)
-    # cnot2 = _cnot(n, target, control)
-    cnot_callback = QuantumComputer.MULTI_MAPPINGS[MultiOperationType.CNOT]
-    cnot1 = cnot_callback(n, control, target)
-    cnot2 = cnot_callback(n, target, control)
-    return cnot1 @ cnot2 @ cnot1
-
 class QuantumComputer:
     """A computation simulator for a quantum circuit definition"""
 
@@ -128,70 +98,1026 @@ class QuantumComputer:
             [0, np.exp(np.pi * (1j) / 4)]
         ], dtype=complex)),
     }
-    MULTI_MAPPINGS : dict[MultiOperationType, Callable[[int, int, int], any]] = {
-        MultiOperationType.CNOT: _produceGenericNotGateFn(SINGLE_MAPPINGS[OperationType.X]), #_cnot,
-        MultiOperationType.CZ: _produceGenericNotGateFn(SINGLE_MAPPINGS[OperationType.Z]), #_cz,
-        MultiOperationType.CS: _produceGenericNotGateFn(SINGLE_MAPPINGS[OperationType.S]),
-        MultiOperationType.SWAP: _swap
+    # kernels (state, control, target) -> state that act on the state tensor directly
+    MULTI_MAPPINGS : dict[MultiOperationType, Callable[[np.ndarray, int, int], np.ndarray]] = {
+        MultiOperationType.CNOT: apply_controlled_not,
+        MultiOperationType.CZ: _produceControlledPhaseFn(SINGLE_MAPPINGS[OperationType.Z]),
+        MultiOperationType.CS: _produceControlledPhaseFn(SINGLE_MAPPINGS[OperationType.S]),
+        MultiOperationType.SWAP: apply_swap
     }
 
-    def __init__(self, circuit: CircuitDefinition) -> None:
+    # the single qubit gate that each controlled multi-operation applies to its target
+    MULTI_TARGET_GATES: dict[MultiOperationType, any] = {
+        MultiOperationType.CNOT: SINGLE_MAPPINGS[OperationType.X],
+        MultiOperationType.CZ: SINGLE_MAPPINGS[OperationType.Z],
+        MultiOperationType.CS: SINGLE_MAPPINGS[OperationType.S],
+        MultiOperationType.SWAP: None
+    }
+
+    # full circuit unitaries of recently simulated circuits, keyed by :func:`circuit_key`
+    UNITARY_CACHE = LRUCache(max_bytes=256 * 1024 * 1024)
+    # circuits up to this size are simulated through their (cached) unitary by :func:`compute`
+    UNITARY_CACHE_MAX_QUBITS = 10
+    # keys of circuits that :func:`compute` simulated once without building their unitary. Building it costs about
+    # 2^n state vector passes, which only pays off once the same circuit is simulated again: every edit in the
+    # designer gives a new key, and the first run after it should not cost more than a single pass
+    UNITARY_REQUESTS = LRUCache(max_entries=256)
+    # upper bound on the number of amplitudes simulated at once while building a unitary
+    UNITARY_BLOCK_AMPLITUDES = 2 ** 22
+
+    # compiled step operators (the phase vectors of runs of diagonal gates), keyed by (number of qubits, signature).
+    # Shared between all computers, so repeated layers within a circuit and across circuits are only built once.
+    STEP_CACHE = LRUCache(max_bytes=128 * 1024 * 1024)
+
+    # outcomes that are less likely than this are rounding errors of the simulation
+    ZERO_PROBABILITY = 1e-12
+
+    # The AUTO backend uses the stabilizer sum of :mod:`base.near_clifford` for circuits with at most this many
+    # T, T_dg and CS gates, if its estimated cost is below that of the dense state vector. The sum has 2^t terms that
+    # each cost O(n) per gate (O(n^2) for H), after which every term is evaluated on every basis state in the supports
+    # of the terms: that part grows with 2^(number of qubits in superposition), not just with t.
+    NEAR_CLIFFORD_MAX_GATES = 12
+    # Costs in units of updating one amplitude of a dense state vector, measured on the near-Clifford circuits of
+    # `benchmarks/compute_benchmarks.py` with H on 1, n/2 and n-1 qubits: applying a gate to one term of the sum,
+    # evaluating one term on one basis state (per qubit), and the fixed cost of a dense gate on top of its 2^n updates.
+    # With H on a single qubit the sum wins from about 14 qubits for t = 2 and 22 qubits for t = 8 (0.93 s against
+    # 9.8 s), with H on half of 20 qubits it still wins for t = 2 (0.15 s against 1.1 s), and with H on every qubit
+    # the state vector always wins, as the support of every term is (almost) all 2^n basis states anyway.
+    NEAR_CLIFFORD_GATE_COST = 2 ** 13
+    NEAR_CLIFFORD_AMPLITUDE_COST = 2 ** 5
+    DENSE_GATE_COST = 2 ** 13
+
+    # tensor network contractions (see :func:`amplitudes`) whose largest intermediate tensor would have more than
+    # 2^MAX_CONTRACTION_WIDTH entries are refused, as they would need more memory than simulating the state
+    MAX_CONTRACTION_WIDTH = 28
+
+    # Under AUTO, basis state inputs of at least this many qubits are simulated as a sparse state (see
+    # :class:`base.sparse_state.SparseState`) until more than the fill ratio of the amplitudes is non-zero, and as
+    # a dense state vector from then on. A branching gate costs about as much on a sparse state with 1/16 of the
+    # amplitudes non-zero as on the dense state vector; at 1/64 it takes 0.28 times as long on 18 qubits and 0.17 times
+    # on 22, while below 16 qubits the dense kernels are too fast for the sparse state to be worth it.
+    SPARSE_STATE_MIN_QUBITS = 16
+    SPARSE_STATE_FILL_RATIO = 1 / 32
+
+    # memory budget for the intermediate states kept by a computer that tracks prefix states
+    PREFIX_STATES_MAX_BYTES = 256 * 1024 * 1024
+
+    # the dtype of the real amplitudes of a state for every precision; complex amplitudes use the matching complex
+    # dtype (complex128 or complex64). Single precision halves the memory of the state for about 1e-7 relative error
+    # per gate, which adds up over deep circuits: :attr:`last_norm_drift` reports how far the norm moved
+    PRECISIONS = {"double": np.float64, "single": np.float32}
+
+    def __init__(self,
+                 circuit: CircuitDefinition,
+                 fuse_gates: bool = True,
+                 accumulate_phases: bool = True,
+                 step_cache: LRUCache | None = None,
+                 backend: SimulationBackend = SimulationBackend.AUTO,
+                 track_prefix_states: bool = False,
+                 max_bond_dimension: int | None = None,
+                 truncation_threshold: float = 0.0,
+                 sparse_fill_ratio: float | None = None,
+                 prune_threshold: float = 0.0,
+                 precision: str = "double") -> None:
+        """
+        :param circuit:              the circuit to simulate
+        :param fuse_gates:           whether to run the gate fusion pass (see :class:`base.fusion.GateFuser`) before simulating
+        :param accumulate_phases:    whether to collect runs of diagonal gates into phase vectors
+                                     (see :class:`base.fusion.DiagonalAccumulator`) before simulating
+        :param step_cache:           cache for compiled step operators, defaults to the shared :attr:`STEP_CACHE`.
+                                     Its ``max_bytes`` is the memory budget for the cached operators
+        :param backend:              the simulation backend to use
+        :param track_prefix_states:  keep the intermediate states of :func:`compute` between calls (see
+                                     :class:`base.cache.PrefixStateCache`), so that after editing the circuit only
+                                     the time steps from the earliest changed one are simulated again.
+                                     Such a computer never simulates through the unitary of the circuit
+        :param max_bond_dimension:   upper bound on the bond dimension of the MPS backend, or ``None`` for no limit
+        :param truncation_threshold: largest weight of singular values the MPS backend may drop after a two-qubit gate.
+                                     The total dropped weight is reported by :attr:`last_discarded_weight`
+        :param sparse_fill_ratio:    largest fraction of non-zero amplitudes for which a sparse state is used instead
+                                     of a dense one, defaults to :attr:`SPARSE_STATE_FILL_RATIO`
+        :param prune_threshold:      largest probability of an amplitude that a sparse state drops after a gate.
+                                     The total dropped weight is reported by :attr:`last_discarded_weight`
+        :param precision:            ``"double"`` or ``"single"`` (see :attr:`PRECISIONS`); single precision runs every
+                                     kernel in complex64 (float32 for real circuits) and is only supported by the
+                                     AUTO and DENSE backends
+        """
+        if backend == SimulationBackend.SPARSE and not sparse.is_available():
+            raise ImportError("The sparse simulation backend requires scipy to be installed")
+        if precision not in QuantumComputer.PRECISIONS:
+            raise ValueError(f"Unknown precision '{precision}', expected one of {', '.join(QuantumComputer.PRECISIONS)}")
+        if precision != "double" and backend not in (SimulationBackend.AUTO, SimulationBackend.DENSE):
+            raise ValueError(f"The {backend.name.lower().replace('_', '-')} backend only supports double precision")
+
         self._circuit = circuit
-    
-    def compute(self, start_vector: list[float]):
-        current = np.array(start_vector, dtype=complex)
+        self._fuse_gates = fuse_gates
+        self._accumulate_phases = accumulate_phases
+        self._step_cache = step_cache if step_cache is not None else QuantumComputer.STEP_CACHE
+        self._backend = backend
+        self._prefix_states = PrefixStateCache(QuantumComputer.PREFIX_STATES_MAX_BYTES) if track_prefix_states else None
+        self._last_resume_column: int | None = None
+        self._max_bond_dimension = max_bond_dimension
+        self._truncation_threshold = truncation_threshold
+        self._sparse_fill_ratio = sparse_fill_ratio if sparse_fill_ratio is not None else QuantumComputer.SPARSE_STATE_FILL_RATIO
+        self._prune_threshold = prune_threshold
+        self._precision = precision
+        self._real_dtype = QuantumComputer.PRECISIONS[precision]
+        self._last_norm_drift: float | None = None
+        self._last_discarded_weight: float | None = None
+        self._last_node_count: int | None = None
+        self._last_contraction_width: int | None = None
+        self._last_peak_subsystem_size: int | None = None
+
+    def compute(self, start_vector: list[float] | int) -> np.ndarray:
+        """
+        Run the circuit on an input state.
 
-        ordered_operations = self._convert_operations_list()
-        # we can ignore the last one as that one is always the single "measure" which is not handled in any special way for now
-        ordered_operations = ordered_operations[:-1]
+        Under AUTO, a computational basis state input is kept as a single index and phase for as long as only gates
+        that map basis states to basis states have run (see :class:`base.reversible.BasisState`), so the amplitudes
+        of all 2^n basis states are only allocated from the first gate that puts it into superposition.
+
+        :param start_vector:    the input state, either a state vector of length 2^n or the index of a computational basis state
+        :return:                the final state vector, in the precision of the computer
+        """
+        self._require_state_vector_backend()
+        result = self._compute_state(start_vector)
+        if self._precision == "double":
+            return result
+        result = result.astype(self._real_dtype if not np.iscomplexobj(result) else complex_dtype(self._real_dtype), copy=False)
+        self._last_norm_drift = abs(QuantumComputer._norm(result) - QuantumComputer._norm(start_vector))
+        return result
+
+    def _compute_state(self, start_vector: list[float] | int) -> np.ndarray:
         num_qubits = self._circuit.num_qubits
+        if self._backend == SimulationBackend.SPARSE:
+            columns = self._start_vector(start_vector).reshape(-1, 1)
+            return self._evolve_columns(columns, self.compile().gates)[:, 0]
+        if self._backend == SimulationBackend.MPS:
+            return self._simulate_mps(start_vector).to_state_vector()
+        if self._backend == SimulationBackend.DECISION_DIAGRAM:
+            return self._simulate_decision_diagram(start_vector).to_state_vector()
+        if self._backend == SimulationBackend.SPARSE_STATE:
+            return self._dense_state(self._simulate_sparse_state(start_vector)).reshape(-1)
 
-        # it may very well be possible to optimize this bit
-        for operations in ordered_operations: 
-            # from left to right on the circuit diagram
-            # needs to be converted into a tensor product. 
-            # Let's ignore the multi for now and focus on converting single...
-            multi_compositions = []
-            tensor_prod = np.array([[1]], dtype=complex)
-
-            # compose single gates via tensor product
-            for i in range(0, num_qubits):
-                if operations and operations[0][0] == i:
-                    (matrix, multi_matrix) = QuantumComputer._get_next_matrix(operations, num_qubits)
-                    if multi_matrix is not None:
-                        multi_compositions.append(multi_matrix) # this will be composed later as it's not super obvious what to do when there's a lot of operations on one line of time
-                else:
-                    matrix = QuantumComputer.IDENTITY
-                tensor_prod = np.kron(tensor_prod, matrix)
-            
-            final_matrix = tensor_prod
-            for extra_matrix in multi_compositions: # compose the multi-operations onto the tensor product of the single operations
-                # which is essentially the same as if the operations were defined at multiple different times
-                # so this is algebraically correct as far as the matrix product is concerned (going from right to left)
-                # but there might be a trick to count this inside of the above loop already that I am not aware of
-                final_matrix = extra_matrix @ final_matrix
-
-            # this final matrix is now applied for the given "step"
-            current = final_matrix @ current
-        
-        return current
+        columns = self._convert_operations_list()[:-1]
+        basis_prefix = self._basis_prefix(start_vector, columns) if self._backend == SimulationBackend.AUTO else None
+        if basis_prefix is not None and basis_prefix[0] == len(columns):
+            # the circuit never branches, so no amplitudes were needed at all
+            return basis_prefix[1].to_state_vector(self._real_dtype)
+
+        if self._prefix_states is not None:
+            return self._compute_incremental(start_vector, basis_prefix)
+
+        if self._backend == SimulationBackend.AUTO and num_qubits <= QuantumComputer.UNITARY_CACHE_MAX_QUBITS:
+            # small circuits that are simulated more than once are simulated once for all inputs, after which
+            # repeated runs and other inputs only cost a single matrix-vector product; an explicit DENSE backend
+            # always runs the gate kernels
+            unitary = self._repeated_unitary()
+            if unitary is not None:
+                if isinstance(start_vector, (int, np.integer)):
+                    return unitary[:, start_vector].copy()
+                return unitary @ np.asarray(start_vector, dtype=complex)
+
+        # the state is kept as a tensor with one axis per qubit (qubit 0 first, matching the order of the
+        # tensor product), so every gate only has to touch the axes of the qubits it acts on
+        if basis_prefix is not None and num_qubits >= QuantumComputer.SPARSE_STATE_MIN_QUBITS:
+            # only a few amplitudes are non-zero right after the first branching gate, so continue on a sparse state
+            column, basis_state = basis_prefix
+            sparse_state = SparseState.from_basis_state(num_qubits, basis_state.index, basis_state.amplitude, self._prune_threshold)
+            self._last_discarded_weight = 0.0
+            column, state = self._evolve_sparse_state(sparse_state, columns, column, switch_back=False)
+            if column < len(columns):
+                state = self._evolve(state, self._compile_columns(columns[column:]).gates)
+            return self._dense_state(state).reshape(-1)
+        if basis_prefix is not None and basis_prefix[0] > 0:
+            column, basis_state = basis_prefix
+            current = basis_state.to_state_vector(self._real_dtype).reshape((2,) * num_qubits)
+            return self._evolve(current, self._compile_columns(columns[column:]).gates).reshape(-1)
+        current = self._start_vector(start_vector).reshape((2,) * num_qubits)
+        return self._evolve(current).reshape(-1)
+
+    def _basis_prefix(self,
+                      start: list[float] | int,
+                      columns: list[deque[tuple[int, QuBitOperationBase]]]) -> tuple[int, BasisState] | None:
+        """
+        Run the columns of the circuit on *start* as a :class:`base.reversible.BasisState` up to the first column
+        with a gate that branches; ``None`` if *start* is not a computational basis state.
+
+        :return:    the first column that was not applied (``len(columns)`` if all were) and the state before it
+        """
+        index = QuantumComputer._basis_state_index(start)
+        if index is None:
+            return None
+        amplitude = 1 if isinstance(start, (int, np.integer)) else complex(start[index])
+        state = BasisState(self._circuit.num_qubits, index, amplitude)
+        for column, operations in enumerate(columns):
+            gates = QuantumComputer._lower_operations([operations])
+            if not ReversibleCircuit.is_reversible(gates):
+                return column, state
+            for gate in gates:
+                state.apply(gate)
+        return len(columns), state
+
+    def _simulate_sparse_state(self, start: list[float] | int) -> SparseState | np.ndarray:
+        """
+        Run the circuit on a :class:`base.sparse_state.SparseState`, switching to a dense state tensor after every
+        time step in which more than the fill ratio of the amplitudes became non-zero and back once they are fewer
+        again. The amplitudes dropped by pruning are reported by :attr:`last_discarded_weight`.
+
+        :return:    the final state, as a sparse state or as a dense tensor, whichever it ended up as
+        """
+        num_qubits = self._circuit.num_qubits
+        index = QuantumComputer._basis_state_index(start)
+        if isinstance(start, (int, np.integer)):
+            state = SparseState.from_basis_state(num_qubits, int(start), prune_threshold=self._prune_threshold)
+        elif index is not None:
+            state = SparseState.from_basis_state(num_qubits, index, complex(start[index]), self._prune_threshold)
+        else:
+            state = SparseState.from_state_vector(np.asarray(start, dtype=complex), self._prune_threshold)
+
+        self._last_discarded_weight = 0.0
+        _, state = self._evolve_sparse_state(state, self._convert_operations_list()[:-1], 0, switch_back=True)
+        return state
+
+    def _evolve_sparse_state(self,
+                             state: SparseState,
+                             columns: list[deque[tuple[int, QuBitOperationBase]]],
+                             column: int,
+                             switch_back: bool) -> tuple[int, SparseState | np.ndarray]:
+        """
+        Apply *columns* from *column* on to the sparse *state*, one column at a time, switching to a dense tensor once
+        more than the fill ratio of the amplitudes is non-zero. Without *switch_back*, stop right after switching.
+
+        :return:    the first column that was not applied and the state before it
+        """
+        num_qubits = self._circuit.num_qubits
+        # a dense state only switches back well below the fill ratio, so that a state around it does not flip every step
+        switch_back_size = self._sparse_fill_ratio / 2 * 2 ** num_qubits
+        while column < len(columns):
+            gates = self._lower_operations([columns[column]])
+            if isinstance(state, SparseState):
+                for position, gate in enumerate(gates):
+                    state.apply(gate)
+                    if state.fill_ratio > self._sparse_fill_ratio:
+                        # a layer of H gates fills the state within a single column, so switch right away
+                        self._last_discarded_weight = (self._last_discarded_weight or 0.0) + state.discarded_weight
+                        state = self._evolve(state.to_state_vector(self._real_dtype).reshape((2,) * num_qubits), gates[position + 1:])
+                        break
+                if not switch_back and not isinstance(state, SparseState):
+                    return column + 1, state
+            else:
+                state = self._evolve(state, self._compile_columns([columns[column]]).gates)
+                if np.count_nonzero(np.abs(state) > SparseState.ROUNDING_ERROR) <= switch_back_size:
+                    state = SparseState.from_state_vector(state, self._prune_threshold)
+            column += 1
+
+        if isinstance(state, SparseState):
+            self._last_discarded_weight = (self._last_discarded_weight or 0.0) + state.discarded_weight
+        return column, state
+
+    def _dense_state(self, state: SparseState | np.ndarray) -> np.ndarray:
+        """*state* as a dense state tensor (or vector, if it already was one)"""
+        if isinstance(state, SparseState):
+            return state.to_state_vector(self._real_dtype).reshape((2,) * self._circuit.num_qubits)
+        return state
+
+    def _start_vector(self, start: list[float] | int) -> np.ndarray:
+        """*start* as a state vector, building the basis state if it is given by its index (see :func:`_working_array`)"""
+        if isinstance(start, (int, np.integer)):
+            start_vector = np.zeros(2 ** self._circuit.num_qubits, dtype=self._real_dtype)
+            start_vector[start] = 1
+            return start_vector
+        return self._working_array(start)
+
+    def _working_array(self, values: list[float] | np.ndarray) -> np.ndarray:
+        """
+        A copy of *values* to simulate on, in the precision of the computer: real if every value is real, as
+        H, X, Z, CNOT, CZ and SWAP keep a real state real (see :attr:`base.kernels.GateInstruction.is_real`) at half
+        the memory and bandwidth of a complex one. The first gate with a complex matrix turns the state complex.
+        """
+        values = np.asarray(values)
+        if np.iscomplexobj(values):
+            if np.any(values.imag):
+                return np.array(values, dtype=complex_dtype(self._real_dtype))
+            values = values.real
+        return np.array(values, dtype=self._real_dtype)
+
+    @staticmethod
+    def _norm(state: list[float] | int | np.ndarray) -> float:
+        """The norm of a state vector (accumulated in double precision), or 1 for the index of a basis state"""
+        if isinstance(state, (int, np.integer)):
+            return 1.0
+        return float(np.sqrt(np.sum(np.abs(np.asarray(state)) ** 2, dtype=np.float64)))
+
+    def _repeated_unitary(self) -> np.ndarray | None:
+        """The unitary of the circuit if it is cached or the circuit was simulated before (see :attr:`UNITARY_REQUESTS`)"""
+        key = QuantumComputer.circuit_key(self._circuit)
+        if key not in QuantumComputer.UNITARY_CACHE and key not in QuantumComputer.UNITARY_REQUESTS:
+            QuantumComputer.UNITARY_REQUESTS.put(key, True, size=0)
+            return None
+
+        QuantumComputer.UNITARY_REQUESTS.discard(key)
+        return self.unitary()
+
+    def _compute_incremental(self,
+                             start: list[float] | int,
+                             basis_prefix: tuple[int, BasisState] | None = None) -> np.ndarray:
+        num_qubits = self._circuit.num_qubits
+        version = self._circuit.version
+        prefix_states = self._prefix_states
+        if isinstance(start, (int, np.integer)):
+            key = (num_qubits, int(start))
+        else:
+            start = np.array(start, dtype=complex)
+            key = (num_qubits, hashlib.sha256(start.tobytes()).hexdigest())
+
+        result = prefix_states.result_for(key, version)
+        if result is not None:
+            self._last_resume_column = None
+            return result.copy()
+
+        columns = self._convert_operations_list()[:-1]
+        signatures = [QuantumComputer._column_signature(operations) for operations in columns]
+        column, state = prefix_states.resume_point(key, signatures)
+        self._last_resume_column = column
+        if state is not None:
+            # the kernels work in place, so never hand them a stored checkpoint
+            state = state.copy()
+        elif basis_prefix is not None:
+            # the columns before the first branching one were already run on the basis state
+            column, basis_state = basis_prefix
+            state = basis_state.to_state_vector(self._real_dtype).reshape((2,) * num_qubits)
+        else:
+            state = self._start_vector(start).reshape((2,) * num_qubits)
+
+        # every chunk of columns between two checkpoints is compiled (and fused) on its own
+        stride = prefix_states.stride(len(columns), state.nbytes)
+        while column < len(columns):
+            end = min((column // stride + 1) * stride, len(columns))
+            state = self._evolve(state, self._compile_columns(columns[column:end]).gates)
+            column = end
+            if column < len(columns):
+                prefix_states.store(column, np.ascontiguousarray(state).copy())
+
+        result = state.reshape(-1)
+        prefix_states.finish(signatures, version, result.copy())
+        return result
+
+    @property
+    def last_resume_column(self) -> int | None:
+        """
+        The time step (column index) from which the last incremental :func:`compute` started simulating,
+        or ``None`` if it could reuse the previous result entirely
+        """
+        return self._last_resume_column
+
+    @property
+    def last_norm_drift(self) -> float | None:
+        """
+        How far the norm of the result of the last :func:`compute` or :func:`compute_batch` in single precision moved
+        away from the norm of its input (the largest over the batch), an estimate of the accuracy that was lost;
+        ``None`` if nothing was computed in single precision yet
+        """
+        return self._last_norm_drift
+
+    @property
+    def last_discarded_weight(self) -> float | None:
+        """
+        The total weight of the singular values that the last simulation on the MPS backend dropped, or of the
+        amplitudes that the last simulation on a sparse state pruned: an estimate of the infidelity of its result;
+        ``None`` if nothing was simulated on either yet
+        """
+        return self._last_discarded_weight
+
+    @property
+    def last_node_count(self) -> int | None:
+        """
+        The number of nodes of the final state of the last simulation on the decision diagram backend,
+        or ``None`` if nothing was simulated on that backend yet
+        """
+        return self._last_node_count
+
+    @property
+    def last_peak_subsystem_size(self) -> int | None:
+        """
+        The number of qubits in the largest subsystem of the last :func:`simulate_subsystems`, which bounds the memory
+        it used to 2^size amplitudes; ``None`` if nothing was simulated that way yet
+        """
+        return self._last_peak_subsystem_size
+
+    @property
+    def last_contraction_width(self) -> int | None:
+        """The contraction width of the last :func:`amplitudes` call, or ``None`` if there was none yet"""
+        return self._last_contraction_width
+
+    def amplitudes(self, outputs: list[int], start: int) -> np.ndarray:
+        """
+        The amplitudes ``<x|U|start>`` of the circuit ``U`` for every computational basis state *x* in *outputs*.
+
+        The circuit is turned into a tensor network (see :class:`base.tensor_network.TensorNetwork`) that is contracted
+        once for every output, so the memory needed is bounded by the contraction width instead of 2^n.
+        The contraction order is found once and shared by all outputs.
+
+        :param outputs:    indices of the computational basis states to get the amplitudes of
+        :param start:      index of the computational basis state to start from
+        :return:           the amplitude of every output, in the same order
+        """
+        gates = self._lower_operations(self._convert_operations_list()[:-1])
+        if self._fuse_gates:
+            gates = fuse_gates(gates).gates
+        network = TensorNetwork(self._circuit.num_qubits, gates)
+        plan = network.plan()
+        self._last_contraction_width = plan.width
+        if plan.width > QuantumComputer.MAX_CONTRACTION_WIDTH:
+            raise ValueError(f"The tensor network has a contraction width of {plan.width}, more than the maximum of {QuantumComputer.MAX_CONTRACTION_WIDTH}")
+
+        return np.array([network.amplitude(output, start, plan) for output in outputs], dtype=complex)
+
+    def amplitude(self, input_index: int, output_index: int, workers: int | None = None) -> complex:
+        """
+        The amplitude ``<output|U|input>`` of the circuit ``U``, as a Feynman path sum over the H gates
+        (see :class:`base.path_sum.PathSum`). The memory needed grows with the number of qubits and gates only,
+        so this works for very wide circuits as long as they have few H gates.
+
+        :param input_index:     index of the computational basis state to start from
+        :param output_index:    index of the computational basis state to get the amplitude of
+        :param workers:         number of processes to sum the paths with, defaults to the number of CPUs
+        """
+        gates = self._lower_operations(self._convert_operations_list()[:-1])
+        return PathSum(self._circuit.num_qubits, gates).amplitude(input_index, output_index, workers)
+
+    def hybrid_amplitudes(self,
+                          outputs: list[int],
+                          start: int,
+                          cut: int | None = None,
+                          workers: int | None = None) -> np.ndarray:
+        """
+        The amplitudes ``<x|U|start>`` of the circuit ``U`` for every computational basis state *x* in *outputs*,
+        by Schrödinger-Feynman simulation (see :class:`base.hybrid.HybridCircuit`): the qubits are cut into two blocks
+        that are simulated as separate state vectors once for every combination of terms of the gates across the cut.
+        This fits circuits that are too wide for a single state vector but have few two-qubit gates across the cut.
+
+        :param outputs:    indices of the computational basis states to get the amplitudes of
+        :param start:      index of the computational basis state to start from
+        :param cut:        the first qubit of the second block, defaults to the cut with the least work
+        :param workers:    number of processes to simulate the paths with, defaults to the number of CPUs
+        :return:           the amplitude of every output, in the same order
+        """
+        num_qubits = self._circuit.num_qubits
+        gates = self._lower_operations(self._convert_operations_list()[:-1])
+        if cut is None:
+            cut = HybridCircuit.best_cut(num_qubits, gates)
+        if self._fuse_gates and 0 < cut < num_qubits:
+            gates = fuse_within_blocks(gates, cut)
+        return HybridCircuit(num_qubits, gates, cut).amplitudes(outputs, start, workers)
+
+    def compute_batch(self, start_vectors: np.ndarray | list[int]) -> np.ndarray:
+        """
+        Compute the result of the circuit for many inputs in one vectorized pass.
+        The circuit is compiled once and every gate is applied to all inputs at the same time.
+
+        :param start_vectors:    either a 2-D block of input states, one state vector of length 2^n per row,
+                                 or a list of the indices of the computational basis states to use as input
+        :return:                 a 2-D array with the resulting state vector of every input on the matching row
+        """
+        self._require_state_vector_backend()
+        num_qubits = self._circuit.num_qubits
+        dimension = 2 ** num_qubits
+
+        start_vectors = np.asarray(start_vectors)
+        if start_vectors.ndim == 1:
+            # basis state indices; each input gets its own column
+            columns = np.zeros((dimension, len(start_vectors)), dtype=self._real_dtype)
+            columns[start_vectors, np.arange(len(start_vectors))] = 1
+        elif start_vectors.ndim == 2 and start_vectors.shape[1] == dimension:
+            columns = self._working_array(start_vectors.T)
+        else:
+            raise ValueError(f"Expected a list of basis state indices or a 2-D block of state vectors of length {dimension}, but got shape {start_vectors.shape}")
+
+        if self._backend in (SimulationBackend.MPS, SimulationBackend.DECISION_DIAGRAM, SimulationBackend.SPARSE_STATE):
+            return np.array([self.compute(column) for column in columns.T])
+        if self._backend == SimulationBackend.AUTO and start_vectors.ndim == 1:
+            circuit = self._reversible_circuit()
+            if circuit is not None and num_qubits <= ReversibleCircuit.MAX_VECTORIZED_QUBITS:
+                outputs, phases = circuit.evaluate(start_vectors)
+                results = np.zeros((len(start_vectors), dimension), dtype=complex_dtype(self._real_dtype))
+                results[np.arange(len(start_vectors)), outputs] = ReversibleCircuit.phase(phases)
+                return results
+        results = self._evolve_columns(columns, self.compile().gates).T
+        if self._precision != "double":
+            self._last_norm_drift = max(
+                abs(QuantumComputer._norm(result) - QuantumComputer._norm(column)) for result, column in zip(results, columns.T)
+            )
+        return results
 
+    def measured_qubits(self) -> list[int]:
+        """The qubits that have a measure gate in the last time step of the circuit, in ascending order"""
+        columns = self._convert_operations_list()
+        if not columns:
+            return []
+        return sorted(
+            qubit for qubit, operation in columns[-1]
+            if isinstance(operation, QuBitOperationSingleParam) and operation.get_type() == OperationType.MEASURE
+        )
+
+    def probabilities(self, start: list[float] | int) -> dict[str, float]:
+        """
+        The probability of every outcome of measuring the :func:`measured_qubits` of the final state.
+
+        Clifford circuits that start in a computational basis state are simulated on a stabilizer tableau
+        (see :class:`base.stabilizer.StabilizerTableau`) unless a state vector backend was chosen explicitly,
+        which works for hundreds of qubits as long as the measurement itself does not have too many outcomes
+        (beyond that, AUTO lists them from the state vector and only the STABILIZER backend refuses).
+        Circuits with only a few T, T_dg and CS gates are simulated as a sum of stabilizer states
+        (see :class:`base.near_clifford.StabilizerSum` and :attr:`NEAR_CLIFFORD_MAX_GATES`) when that is estimated to be faster.
+        Otherwise AUTO simulates every group of qubits that do not interact with the rest on its own
+        (see :func:`factorized_probabilities`).
+
+        :param start:    the input state, either a state vector as for :func:`compute` or the index of a computational basis state
+        :return:         the probability of every possible outcome, keyed by the bit string of the measured qubits
+                         (lowest qubit first). Outcomes that cannot occur are left out
+        """
+        measured = self._require_measured_qubits()
+        outcome = self._reversible_outcome(start, measured)
+        if outcome is not None:
+            return {outcome: 1.0}
+        tableau = self._stabilizer_tableau(start)
+        if tableau is not None:
+            distribution = tableau.measurement_distribution(measured)
+            # under AUTO, outcomes that are too many to list from the tableau are listed from the state vector instead
+            if self._backend == SimulationBackend.STABILIZER or \
+                    distribution.num_random_bits <= stabilizer.OutcomeDistribution.MAX_ENUMERATED_BITS:
+                return distribution.probabilities()
+        probabilities = self._stabilizer_sum_probabilities(start, measured)
+        if probabilities is not None:
+            return probabilities
+        product_distribution = self._product_distribution(start, measured)
+        if product_distribution is not None:
+            return product_distribution.probabilities(QuantumComputer.ZERO_PROBABILITY)
+        if self._backend == SimulationBackend.MPS:
+            return {
+                outcome: probability
+                for outcome, probability in self._simulate_mps(start).measurement_probabilities(measured).items()
+                if probability > QuantumComputer.ZERO_PROBABILITY
+            }
+        if self._backend == SimulationBackend.DECISION_DIAGRAM:
+            return self._decision_diagram_probabilities(start, measured)
+        if self._backend == SimulationBackend.SPARSE_STATE:
+            return self._sparse_state_probabilities(start, measured)
+
+        marginal = self._marginal_probabilities(start, measured)
+        return {
+            format(outcome, f"0{len(measured)}b"): float(marginal[outcome])
+            for outcome in np.flatnonzero(marginal > QuantumComputer.ZERO_PROBABILITY)
+        }
+
+    def sample(self, start: list[float] | int, shots: int, seed: int | None = None) -> dict[str, int]:
+        """
+        Simulate measuring the :func:`measured_qubits` of the final state *shots* times.
+
+        All shots are drawn at once, by searching uniform random numbers in the cumulative distribution
+        of the measured qubits, or from the stabilizer tableau or sum as for :func:`probabilities`.
+        The MPS backend draws the shots from the matrix product state one qubit at a time instead.
+
+        :param start:    the input state, either a state vector as for :func:`compute` or the index of a computational basis state
+        :param shots:    number of measurements to draw
+        :param seed:     seed for the random number generator, to make the samples reproducible
+        :return:         the number of times each outcome was drawn, keyed by the bit string of the measured
+                         qubits (lowest qubit first). Outcomes that were never drawn are left out
+        """
+        if shots < 0:
+            raise ValueError(f"The number of shots must not be negative, but got {shots}")
+        measured = self._require_measured_qubits()
+        rng = np.random.default_rng(seed)
+        outcome = self._reversible_outcome(start, measured)
+        if outcome is not None:
+            return {outcome: shots} if shots > 0 else {}
+        tableau = self._stabilizer_tableau(start)
+        if tableau is not None:
+            return tableau.measurement_distribution(measured).sample(shots, rng)
+        if self._backend == SimulationBackend.DECISION_DIAGRAM:
+            probabilities = self._decision_diagram_probabilities(start, measured)
+        elif self._backend == SimulationBackend.SPARSE_STATE:
+            probabilities = self._sparse_state_probabilities(start, measured)
+        else:
+            probabilities = self._stabilizer_sum_probabilities(start, measured)
+        if probabilities is not None:
+            counts = QuantumComputer._draw(np.array(list(probabilities.values())), shots, rng)
+            return {outcome: int(count) for outcome, count in zip(probabilities, counts) if count > 0}
+        product_distribution = self._product_distribution(start, measured)
+        if product_distribution is not None:
+            return product_distribution.sample(shots, rng)
+        if self._backend == SimulationBackend.MPS:
+            return self._simulate_mps(start).sample(measured, shots, rng)
+
+        counts = QuantumComputer._draw(self._marginal_probabilities(start, measured), shots, rng)
+        return {
+            format(outcome, f"0{len(measured)}b"): int(count)
+            for outcome, count in enumerate(counts) if count > 0
+        }
+
+    def factorized_probabilities(self, start: int) -> ProductDistribution:
+        """
+        The distribution of the outcomes of measuring the :func:`measured_qubits`, as a product of the distributions
+        of the groups of qubits that never share a multi-qubit gate (see :func:`base.factorization.interaction_groups`).
+        The groups with a measured qubit are simulated as a :class:`base.factorization.SubsystemState`, so the cost is
+        the sum of 2^k over the sizes k of the subsystems instead of 2^n; the other groups are not simulated at all.
+
+        :param start:    the index of the computational basis state to start from
+        """
+        measured = self._require_measured_qubits()
+        gates = self._lower_operations(self._convert_operations_list()[:-1])
+        needed = {
+            qubit
+            for group in interaction_groups(self._circuit.num_qubits, gates) if any(qubit in measured for qubit in group)
+            for qubit in group
+        }
+        state = self.simulate_subsystems(start, [gate for gate in gates if gate.qubits[0] in needed])
+        return ProductDistribution(measured, [
+            (qubits, np.where(probabilities > QuantumComputer.ZERO_PROBABILITY, probabilities, 0))
+            for qubits, probabilities in state.marginals(measured)
+        ])
+
+    def simulate_subsystems(self, start: int, gates: list[GateInstruction] | None = None) -> SubsystemState:
+        """
+        Simulate the circuit with every qubit in a subsystem of its own, merging subsystems only at the first
+        multi-qubit gate between them (see :class:`base.factorization.SubsystemState`). The largest subsystem is
+        reported by :attr:`last_peak_subsystem_size`.
+
+        :param start:    the index of the computational basis state to start from
+        :param gates:    the lowered gates to apply, defaults to those of the whole circuit
+        :return:         the final state, from which every subsystem or the joint state vector can be taken
+        """
+        if gates is None:
+            gates = self._lower_operations(self._convert_operations_list()[:-1])
+        if self._fuse_gates:
+            gates = fuse_gates(gates).gates
+        state = SubsystemState(self._circuit.num_qubits, start)
+        for gate in gates:
+            state.apply(gate)
+        self._last_peak_subsystem_size = state.peak_size
+        return state
+
+    def truth_table(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        The output of a circuit that only permutes the computational basis states and changes their phases
+        (X, Y, Z, S, T, T_dg, CNOT, CZ, CS and SWAP gates, see :class:`base.reversible.ReversibleCircuit`)
+        for every one of the 2^n basis state inputs, evaluated with bit operations on all inputs at once.
+
+        :return:    the index of the output basis state for every input index, and the amplitude (a phase) it gets
+        """
+        gates = self._lower_operations(self._convert_operations_list()[:-1])
+        if not ReversibleCircuit.is_reversible(gates):
+            raise ValueError("The circuit has gates that put basis states into superposition, so it has no truth table")
+        outputs, phases = ReversibleCircuit(self._circuit.num_qubits, gates).truth_table()
+        return outputs, ReversibleCircuit.phase(phases)
+
+    def _reversible_circuit(self) -> ReversibleCircuit | None:
+        """The circuit as a :class:`base.reversible.ReversibleCircuit` if all its gates allow it, otherwise ``None``"""
+        gates = self._lower_operations(self._convert_operations_list()[:-1])
+        if not ReversibleCircuit.is_reversible(gates):
+            return None
+        return ReversibleCircuit(self._circuit.num_qubits, gates)
+
+    def _reversible_outcome(self, start: list[float] | int, measured: list[int]) -> str | None:
+        """
+        Under AUTO, the only outcome of measuring *measured* if the circuit maps the basis state *start* to a single
+        basis state (see :func:`_reversible_circuit`); ``None`` if the outcome has to be simulated
+        """
+        if self._backend != SimulationBackend.AUTO:
+            return None
+        index = QuantumComputer._basis_state_index(start)
+        circuit = self._reversible_circuit() if index is not None else None
+        if circuit is None:
+            return None
+        output, _ = circuit.evaluate_index(index)
+        num_qubits = self._circuit.num_qubits
+        return ''.join(str((output >> (num_qubits - 1 - qubit)) & 1) for qubit in measured)
+
+    def _product_distribution(self, start: list[float] | int, measured: list[int]) -> ProductDistribution | None:
+        """
+        The :func:`factorized_probabilities` under AUTO if *start* is a computational basis state and the circuit
+        splits into smaller groups; ``None`` if the whole state vector has to be used instead
+        """
+        if self._backend != SimulationBackend.AUTO:
+            return None
+        index = QuantumComputer._basis_state_index(start)
+        if index is None:
+            return None
+        groups = interaction_groups(self._circuit.num_qubits, self._lower_operations(self._convert_operations_list()[:-1]))
+        if len(groups) == 1:
+            return None
+        return self.factorized_probabilities(index)
 
     @staticmethod
-    def _get_next_matrix(operations: list[tuple[int, QuBitOperationBase]], n: int) -> tuple[object, object]:
-        qubit, operation = operations.popleft()
+    def _draw(probabilities: np.ndarray, shots: int, rng: np.random.Generator) -> np.ndarray:
+        """Draw *shots* indices into *probabilities*, returning how often each index was drawn"""
+        cumulative = np.cumsum(probabilities)
+        # normalise away the rounding errors of the simulation, so every draw lands on an outcome
+        cumulative /= cumulative[-1]
+        outcomes = np.minimum(np.searchsorted(cumulative, rng.random(shots), side="right"), len(probabilities) - 1)
+        return np.bincount(outcomes, minlength=len(probabilities))
+
+    def _require_state_vector_backend(self) -> None:
+        if self._backend in (SimulationBackend.STABILIZER, SimulationBackend.NEAR_CLIFFORD):
+            raise ValueError(f"The {self._backend.name.lower().replace('_', '-')} backend does not produce state vectors, use probabilities() or sample() instead")
+
+    def _require_measured_qubits(self) -> list[int]:
+        measured = self.measured_qubits()
+        if not measured:
+            raise ValueError("The circuit has no measure gates in its last time step; nothing to measure")
+        return measured
+
+    def _marginal_probabilities(self, start: list[float] | int, measured: list[int]) -> np.ndarray:
+        """The probabilities of the outcomes of measuring *measured*, indexed by the outcome as a binary number"""
+        return self._marginal(self.compute(start), measured)
+
+    def _marginal(self, state: np.ndarray, measured: list[int]) -> np.ndarray:
+        """:func:`_marginal_probabilities` of a final *state* vector or tensor"""
+        num_qubits = self._circuit.num_qubits
+        probabilities = np.abs(state) ** 2
+        unmeasured = tuple(qubit for qubit in range(num_qubits) if qubit not in measured)
+        # add up in double precision, also for a single precision state
+        return probabilities.reshape((2,) * num_qubits).sum(axis=unmeasured, dtype=np.float64).reshape(-1)
+
+    def _sparse_state_probabilities(self, start: list[float] | int, measured: list[int]) -> dict[str, float]:
+        """The outcome probabilities of :func:`probabilities` from :func:`_simulate_sparse_state`"""
+        state = self._simulate_sparse_state(start)
+        if isinstance(state, SparseState):
+            probabilities = state.measurement_probabilities(measured)
+        else:
+            marginal = self._marginal(state, measured)
+            probabilities = {format(outcome, f"0{len(measured)}b"): float(marginal[outcome]) for outcome in np.flatnonzero(marginal)}
+        return {
+            outcome: probability
+            for outcome, probability in probabilities.items() if probability > QuantumComputer.ZERO_PROBABILITY
+        }
+
+    def _stabilizer_tableau(self, start: list[float] | int) -> stabilizer.StabilizerTableau | None:
+        """
+        Simulate the circuit on a stabilizer tableau if the backend allows it, the circuit only has Clifford gates
+        and *start* is a computational basis state; ``None`` if the state vector has to be used instead
+        """
+        if self._backend not in (SimulationBackend.AUTO, SimulationBackend.STABILIZER):
+            return None
+
+        gates = self._lower_operations(self._convert_operations_list()[:-1])
+        index = QuantumComputer._basis_state_index(start)
+        if not stabilizer.is_clifford(gates) or index is None:
+            if self._backend == SimulationBackend.STABILIZER:
+                raise ValueError("The stabilizer backend only supports Clifford circuits (no T, T_dg or CS gates) on a computational basis state input")
+            return None
+
+        tableau = stabilizer.StabilizerTableau.from_basis_state(self._circuit.num_qubits, index)
+        for gate in gates:
+            tableau.apply(gate)
+        return tableau
+
+    def _simulate_mps(self, start: list[float] | int) -> MatrixProductState:
+        """Run the circuit on a matrix product state, with the gates fused if enabled (but not into phase vectors)"""
+        options = {"max_bond_dimension": self._max_bond_dimension, "truncation_threshold": self._truncation_threshold}
+        if isinstance(start, (int, np.integer)):
+            state = MatrixProductState.from_basis_state(self._circuit.num_qubits, int(start), **options)
+        else:
+            state = MatrixProductState.from_state_vector(np.asarray(start, dtype=complex), **options)
+
+        gates = self._lower_operations(self._convert_operations_list()[:-1])
+        if self._fuse_gates:
+            gates = fuse_gates(gates).gates
+        for gate in gates:
+            state.apply(gate)
+        self._last_discarded_weight = state.discarded_weight
+        return state
+
+    def _simulate_decision_diagram(self, start: list[float] | int) -> DecisionDiagram:
+        if isinstance(start, (int, np.integer)):
+            diagram = DecisionDiagram.from_basis_state(self._circuit.num_qubits, int(start))
+        else:
+            diagram = DecisionDiagram.from_state_vector(np.asarray(start, dtype=complex))
+
+        for gate in self._lower_operations(self._convert_operations_list()[:-1]):
+            diagram.apply(gate)
+        self._last_node_count = diagram.node_count
+        return diagram
+
+    def _decision_diagram_probabilities(self, start: list[float] | int, measured: list[int]) -> dict[str, float]:
+        return {
+            outcome: probability
+            for outcome, probability in self._simulate_decision_diagram(start).measurement_probabilities(measured).items()
+            if probability > QuantumComputer.ZERO_PROBABILITY
+        }
+
+    def _stabilizer_sum_probabilities(self, start: list[float] | int, measured: list[int]) -> dict[str, float] | None:
+        """
+        The outcome probabilities of :func:`probabilities` computed from a sum of stabilizer states, if the backend
+        allows it, *start* is a computational basis state and (for AUTO) the sum is estimated to be cheaper than
+        the state vector (see :attr:`NEAR_CLIFFORD_GATE_COST`); ``None`` if the state vector has to be used instead
+        """
+        if self._backend not in (SimulationBackend.AUTO, SimulationBackend.NEAR_CLIFFORD):
+            return None
+
+        num_qubits = self._circuit.num_qubits
+        gates = self._lower_operations(self._convert_operations_list()[:-1])
+        index = QuantumComputer._basis_state_index(start)
+        if index is None:
+            if self._backend == SimulationBackend.NEAR_CLIFFORD:
+                raise ValueError("The near-Clifford backend only supports a computational basis state input")
+            return None
+
+        num_terms = 2 ** near_clifford.count_non_clifford(gates)
+        if self._backend == SimulationBackend.AUTO:
+            dense_cost = QuantumComputer.dense_cost(num_qubits, len(gates))
+            if num_terms > 2 ** QuantumComputer.NEAR_CLIFFORD_MAX_GATES or \
+                    QuantumComputer._near_clifford_cost(num_qubits, len(gates), num_terms, 1) > dense_cost:
+                return None
+            # every term has about as many qubits in superposition as the Clifford part of the circuit,
+            # so this is a lower bound on the cost that is known before simulating the whole sum
+            support = 2 ** near_clifford.superposition_size(num_qubits, index, gates)
+            if QuantumComputer._near_clifford_cost(num_qubits, len(gates), num_terms, support) > dense_cost:
+                return None
+
+        stabilizer_sum = near_clifford.StabilizerSum(num_qubits, index)
+        for gate in gates:
+            stabilizer_sum.apply(gate)
+        if self._backend == SimulationBackend.AUTO:
+            # the sizes of the supports of the terms are known now, so check again with their sum
+            support = stabilizer_sum.support_size
+            if support > near_clifford.StabilizerSum.MAX_SUPPORT_SIZE or \
+                    QuantumComputer._near_clifford_cost(num_qubits, len(gates), num_terms, support) > dense_cost:
+                return None
+
+        return {
+            outcome: probability
+            for outcome, probability in stabilizer_sum.measurement_probabilities(measured).items()
+            if probability > QuantumComputer.ZERO_PROBABILITY
+        }
+
+    @staticmethod
+    def _near_clifford_cost(num_qubits: int, num_gates: int, num_terms: int, support: int) -> int:
+        """The estimated cost of listing the outcomes of a stabilizer sum, see :attr:`NEAR_CLIFFORD_GATE_COST`"""
+        return num_terms * (num_gates * QuantumComputer.NEAR_CLIFFORD_GATE_COST
+                            + support * num_qubits * QuantumComputer.NEAR_CLIFFORD_AMPLITUDE_COST)
+
+    @staticmethod
+    def dense_cost(num_qubits: int, num_gates: int) -> int:
+        """
+        The estimated cost of simulating the dense state vector, in amplitude updates (see
+        :attr:`NEAR_CLIFFORD_GATE_COST`); callers can scale it to seconds with a measured rate
+        """
+        return num_gates * (2 ** num_qubits + QuantumComputer.DENSE_GATE_COST)
+
+    @staticmethod
+    def _basis_state_index(start: list[float] | int) -> int | None:
+        """The index of the computational basis state *start* is (up to a global phase), or ``None`` if it is a superposition"""
+        if isinstance(start, (int, np.integer)):
+            return int(start)
+        non_zero = np.flatnonzero(np.asarray(start))
+        if len(non_zero) != 1:
+            return None
+        return int(non_zero[0])
+
+    def unitary(self) -> np.ndarray:
+        """
+        Build the unitary matrix of the whole circuit, by running the gate kernels on blocks of columns of the identity.
+
+        The result is cached (see :attr:`UNITARY_CACHE`) under the :func:`circuit_key` of the circuit,
+        and is returned read-only as it is shared between all computers simulating the same circuit.
+        """
+        self._require_state_vector_backend()
+        key = QuantumComputer.circuit_key(self._circuit)
+        unitary = QuantumComputer.UNITARY_CACHE.get(key)
+        if unitary is not None:
+            return unitary
+
+        dimension = 2 ** self._circuit.num_qubits
+        gates = self.compile().gates
+        block_size = max(1, QuantumComputer.UNITARY_BLOCK_AMPLITUDES // dimension)
+
+        unitary = np.empty((dimension, dimension), dtype=complex)
+        for start in range(0, dimension, block_size):
+            end = min(start + block_size, dimension)
+            identity_block = np.zeros((dimension, end - start), dtype=complex)
+            identity_block[np.arange(start, end), np.arange(end - start)] = 1
+            unitary[:, start:end] = self._evolve_columns(identity_block, gates)
+
+        unitary.flags.writeable = False
+        QuantumComputer.UNITARY_CACHE.put(key, unitary)
+        return unitary
+
+    @staticmethod
+    def lower_circuit(circuit: CircuitDefinition) -> list[list[GateInstruction]]:
+        """
+        The gate instructions of every time step of *circuit* before its measure step, as the computer applies them
+        (before fusion and phase accumulation). Lets callers inspect a circuit without simulating it.
+        """
+        return [
+            QuantumComputer._lower_operations([operations])
+            for operations in QuantumComputer._ordered_operations(circuit)[:-1]
+        ]
+
+    @staticmethod
+    def circuit_key(circuit: CircuitDefinition) -> str:
+        """
+        A canonical hash of the gates of *circuit* that are simulated.
+        Circuits that only differ in unused time steps or in their final measure step get the same key.
+        """
+        signatures = [
+            QuantumComputer._column_signature(operations)
+            for operations in QuantumComputer._ordered_operations(circuit)[:-1]
+        ]
+        return hashlib.sha256(repr((circuit.num_qubits, signatures)).encode()).hexdigest()
+
+    @staticmethod
+    def clear_caches() -> None:
+        for cache in [QuantumComputer.UNITARY_CACHE, QuantumComputer.UNITARY_REQUESTS, QuantumComputer.STEP_CACHE]:
+            cache.clear()
+            cache.reset_statistics()
+
+    def _evolve_columns(self, columns: np.ndarray, gates: list[GateInstruction]) -> np.ndarray:
+        """Apply *gates* to every column of *columns*, a 2-D block of state vectors"""
+        num_qubits = self._circuit.num_qubits
+        if self._backend == SimulationBackend.SPARSE:
+            for operator in sparse.step_operators(gates, num_qubits, self._step_cache):
+                columns = operator @ columns
+            return columns
+
+        # the inputs are kept on an extra trailing axis, which the gate kernels leave alone
+        batch = columns.reshape((2,) * num_qubits + (columns.shape[1],))
+        return self._evolve(batch, gates).reshape(columns.shape)
+
+    def _evolve(self, state: np.ndarray, gates: list[GateInstruction] | None = None) -> np.ndarray:
+        for gate in (gates if gates is not None else self.compile().gates):
+            state = gate.apply(state)
+        return state
+
+    def compile(self) -> FusionResult:
+        """
+        Lower the circuit into the list of gate instructions that :func:`compute` applies, fused and with
+        diagonal runs collected into phase vectors if enabled.
+        The returned result reports how many gate applications these passes removed.
+        """
+        # we can ignore the last time step as that one is always the single "measure" which is not handled in any special way for now
+        return self._compile_columns(self._convert_operations_list()[:-1])
+
+    def _compile_columns(self, columns: list[deque[tuple[int, QuBitOperationBase]]]) -> FusionResult:
+        gates = self._lower_operations(columns)
+        result = fuse_gates(gates) if self._fuse_gates else FusionResult(gates, len(gates))
+        if self._accumulate_phases:
+            gates = accumulate_diagonal_gates(result.gates, self._circuit.num_qubits, self._step_cache)
+            result = FusionResult(gates, result.original_count)
+        return result
+
+    @staticmethod
+    def _lower_operations(columns: list[deque[tuple[int, QuBitOperationBase]]]) -> list[GateInstruction]:
+        gates = []
+        for operations in columns:
+            # from left to right on the circuit diagram.
+            # every qubit holds at most one operation per time step, so all operations of a step act on
+            # different qubits and can be applied one after the other in any order
+            for qubit, operation in operations:
+                gate = QuantumComputer._lower_operation(qubit, operation)
+                if gate is not None:
+                    gates.append(gate)
+        return gates
+
+    @staticmethod
+    def _lower_operation(qubit: int, operation: QuBitOperationBase) -> GateInstruction | None:
         if isinstance(operation, QuBitOperationSingleParam):
-            return (QuantumComputer.SINGLE_MAPPINGS[operation.get_type()], None)
+            operation_type = operation.get_type()
+            return SingleQubitInstruction(qubit, QuantumComputer.SINGLE_MAPPINGS[operation_type], operation_type)
         elif isinstance(operation, QuBitOperationMultiParam):
-            return (QuantumComputer.IDENTITY, QuantumComputer.MULTI_MAPPINGS[operation.get_type()](n, operation.get_applies_to(), operation.get_applied_by()))
+            operation_type = operation.get_type()
+            return MultiQubitInstruction(
+                operation_type,
+                operation.get_applies_to(),
+                operation.get_applied_by(),
+                QuantumComputer.MULTI_MAPPINGS[operation_type],
+                QuantumComputer.MULTI_TARGET_GATES[operation_type]
+            )
         else:
-            return (QuantumComputer.IDENTITY, None)
+            # references to multi-operations are applied by the qubit that owns the operation
+            return None
+
+    @staticmethod
+    def _column_signature(operations: deque[tuple[int, QuBitOperationBase]]) -> tuple:
+        """A hashable description of the operations in a single time step"""
+        signature = []
+        for qubit, operation in operations:
+            if isinstance(operation, QuBitOperationSingleParam):
+                signature.append((operation.get_type_name(), qubit))
+            elif isinstance(operation, QuBitOperationMultiParam):
+                signature.append((operation.get_type_name(), operation.get_applies_to(), operation.get_applied_by()))
+        return tuple(sorted(signature))
 
     def _convert_operations_list(self):
+        return QuantumComputer._ordered_operations(self._circuit)
+
+    @staticmethod
+    def _ordered_operations(circuit: CircuitDefinition) -> list[deque[tuple[int, QuBitOperationBase]]]:
         # [time, (qubit, operation)]
         result: dict[int, deque[tuple[int, QuBitOperationBase]]] = {}
 
-        for qubit, timeline in enumerate(self._circuit.operation_schedules):
+        for qubit, timeline in enumerate(circuit.operation_schedules):
             for time, op in timeline.operations.items():
                 if time not in result:
                     result[time] = deque()
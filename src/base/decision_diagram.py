@@ -0,0 +1,260 @@
+import numpy as np
+
+from base.kernels import GateInstruction, MultiQubitInstruction, SingleQubitInstruction
+
+
+class DDNode:
+    """
+    A node of a decision diagram on the qubit *level* (qubit 0 at the top). Its two *edges* lead to the parts
+    of the state where that qubit is 0 and 1, as ``(weight, node)`` pairs. The terminal node has no edges.
+    """
+
+    __slots__ = ("level", "edges")
+
+    def __init__(self, level: int, edges: tuple) -> None:
+        self.level = level
+        self.edges = edges
+
+
+# an edge is a weight and the node it points to; the state it stands for is the state of the node times the weight
+Edge = tuple[complex, DDNode]
+
+
+class DecisionDiagram:
+    """
+    A state of *num_qubits* qubits stored as a decision diagram in the style of QMDDs (Miller and Thornton, 2006;
+    Zulehner and Wille, 2019): the state vector is split on qubit 0, then on qubit 1 and so on, and parts of the
+    vector that are equal up to a factor are stored only once, as the same node reached through edges with
+    different weights. States with a lot of repeated structure, like the basis states and uniform superpositions
+    that classical arithmetic and oracles produce, need only a few nodes per qubit instead of 2^n amplitudes.
+
+    Nodes are normalised (their sub-state has norm 1 and their first non-zero edge weight is real and positive)
+    and created through a unique table, so equal sub-states are always the same node. The results of adding sub-states and applying gates to them are kept in
+    compute tables, so shared nodes are only processed once.
+    """
+
+    # weights closer than this to each other are the same, and closer than this to zero are zero
+    TOLERANCE = 1e-12
+    # the unique table is cleaned up once it holds this many nodes and more than twice as many as are in use
+    GARBAGE_COLLECTION_SIZE = 100_000
+
+    def __init__(self, num_qubits: int) -> None:
+        """Create the all-zero state ``|0...0>``"""
+        self.num_qubits = num_qubits
+        self.terminal = DDNode(num_qubits, ())
+        self._unique: dict[tuple, DDNode] = {}
+        self._add_cache: dict[tuple, Edge] = {}
+        self.root: Edge = self._basis_state_edge(0)
+
+    @staticmethod
+    def from_basis_state(num_qubits: int, index: int) -> 'DecisionDiagram':
+        """Create the computational basis state with the given *index* (qubit 0 is the most significant bit)"""
+        diagram = DecisionDiagram(num_qubits)
+        diagram.root = diagram._basis_state_edge(index)
+        return diagram
+
+    @staticmethod
+    def from_state_vector(state: np.ndarray) -> 'DecisionDiagram':
+        num_qubits = int(np.log2(len(state)))
+        diagram = DecisionDiagram(num_qubits)
+        diagram.root = diagram._vector_edge(np.asarray(state, dtype=complex), 0)
+        return diagram
+
+    @property
+    def zero(self) -> Edge:
+        return 0j, self.terminal
+
+    @property
+    def node_count(self) -> int:
+        """The number of nodes (without the terminal) that the state uses"""
+        return len(self._live_nodes())
+
+    def apply(self, gate: GateInstruction) -> None:
+        """Apply a gate as lowered from a circuit (before fusion)"""
+        if isinstance(gate, SingleQubitInstruction):
+            self.root = self._apply_single(self.root, gate.matrix, gate.qubit, {})
+        elif isinstance(gate, MultiQubitInstruction) and gate.target_gate is None:
+            # SWAP as three CNOT gates
+            x = np.array([[0, 1], [1, 0]], dtype=complex)
+            for control, target in [(gate.control, gate.target), (gate.target, gate.control), (gate.control, gate.target)]:
+                self.root = self._apply_controlled(self.root, x, control, target)
+        elif isinstance(gate, MultiQubitInstruction):
+            self.root = self._apply_controlled(self.root, gate.target_gate, gate.control, gate.target)
+        else:
+            raise ValueError(f"Gate {gate} cannot be applied to a decision diagram")
+
+        if len(self._unique) > DecisionDiagram.GARBAGE_COLLECTION_SIZE:
+            self._collect_garbage()
+
+    def to_state_vector(self) -> np.ndarray:
+        vectors: dict[DDNode, np.ndarray] = {self.terminal: np.ones(1, dtype=complex)}
+
+        def vector(node: DDNode) -> np.ndarray:
+            if node not in vectors:
+                size = 2 ** (self.num_qubits - node.level - 1)
+                parts = [weight * vector(child) if weight != 0 else np.zeros(size, dtype=complex)
+                         for weight, child in node.edges]
+                vectors[node] = np.concatenate(parts)
+            return vectors[node]
+
+        weight, node = self.root
+        return weight * vector(node)
+
+    def measurement_probabilities(self, qubits: list[int]) -> dict[str, float]:
+        """
+        The probability of every outcome of measuring *qubits*, keyed by its bit string; outcomes that cannot occur
+        are left out.
+
+        The diagram is walked from the top, keeping the probability weight that reaches each node for every
+        partial outcome. Paths that only differ in qubits that are not measured end up at the same node
+        and are merged there, so the work grows with the number of nodes rather than the number of paths.
+        """
+        measured = set(qubits)
+        weight, node = self.root
+        reached: dict[tuple[str, DDNode], float] = {("", node): abs(weight) ** 2}
+        for level in range(self.num_qubits):
+            next_reached: dict[tuple[str, DDNode], float] = {}
+            for (bits, node), probability in reached.items():
+                for bit, (edge_weight, child) in enumerate(node.edges):
+                    # every node has norm 1, so this is the probability of the partial outcome through this child
+                    child_probability = probability * abs(edge_weight) ** 2
+                    if child_probability <= DecisionDiagram.TOLERANCE ** 2:
+                        continue
+                    key = (bits + str(bit) if level in measured else bits, child)
+                    next_reached[key] = next_reached.get(key, 0.0) + child_probability
+            reached = next_reached
+
+        probabilities: dict[str, float] = {}
+        for (bits, _), probability in reached.items():
+            probabilities[bits] = probabilities.get(bits, 0.0) + float(probability)
+        return probabilities
+
+    def _basis_state_edge(self, index: int) -> Edge:
+        edge: Edge = (1 + 0j, self.terminal)
+        for level in reversed(range(self.num_qubits)):
+            if (index >> (self.num_qubits - 1 - level)) & 1:
+                edge = self._make_node(level, self.zero, edge)
+            else:
+                edge = self._make_node(level, edge, self.zero)
+        return edge
+
+    def _vector_edge(self, state: np.ndarray, level: int) -> Edge:
+        if level == self.num_qubits:
+            return (complex(state[0]), self.terminal) if abs(state[0]) > DecisionDiagram.TOLERANCE else self.zero
+        half = len(state) // 2
+        return self._make_node(level, self._vector_edge(state[:half], level + 1), self._vector_edge(state[half:], level + 1))
+
+    def _make_node(self, level: int, edge_0: Edge, edge_1: Edge) -> Edge:
+        """The edge to the (unique) node with the given edges, normalised as described for the class"""
+        edges = [edge if abs(edge[0]) > DecisionDiagram.TOLERANCE else self.zero for edge in (edge_0, edge_1)]
+        first = edges[0][0] if edges[0][0] != 0 else edges[1][0]
+        if first == 0:
+            return self.zero
+
+        # the child nodes have norm 1, so the norm of the new node only depends on the edge weights
+        factor = np.sqrt(abs(edges[0][0]) ** 2 + abs(edges[1][0]) ** 2) * first / abs(first)
+
+        normalised = tuple((weight / factor, child) for weight, child in edges)
+        key = (level,) + tuple((DecisionDiagram._rounded(weight), id(child)) for weight, child in normalised)
+        node = self._unique.get(key)
+        if node is None:
+            node = DDNode(level, normalised)
+            self._unique[key] = node
+        return factor, node
+
+    def _add(self, a: Edge, b: Edge) -> Edge:
+        if a[0] == 0:
+            return b
+        if b[0] == 0:
+            return a
+        if a[1] is b[1]:
+            weight = a[0] + b[0]
+            return (weight, a[1]) if abs(weight) > DecisionDiagram.TOLERANCE else self.zero
+
+        # a + b = a.weight * (a.node + ratio * b.node), so the compute table only needs the ratio
+        ratio = b[0] / a[0]
+        key = (id(a[1]), id(b[1]), DecisionDiagram._rounded(ratio))
+        result = self._add_cache.get(key)
+        if result is None:
+            node_a, node_b = a[1], b[1]
+            result = self._make_node(node_a.level, *(
+                self._add(edge_a, (ratio * edge_b[0], edge_b[1]))
+                for edge_a, edge_b in zip(node_a.edges, node_b.edges)
+            ))
+            self._add_cache[key] = result
+        return a[0] * result[0], result[1]
+
+    def _apply_single(self, edge: Edge, gate: np.ndarray, qubit: int, cache: dict[int, Edge]) -> Edge:
+        """Apply the 2x2 *gate* to *qubit*; *cache* is the compute table of this gate application"""
+        weight, node = edge
+        if weight == 0:
+            return edge
+        result = cache.get(id(node))
+        if result is None:
+            if node.level < qubit:
+                result = self._make_node(node.level, *(
+                    self._apply_single((child_weight, child), gate, qubit, cache)
+                    for child_weight, child in node.edges
+                ))
+            else:
+                (weight_0, child_0), (weight_1, child_1) = node.edges
+                result = self._make_node(node.level, *(
+                    self._add((gate[row, 0] * weight_0, child_0), (gate[row, 1] * weight_1, child_1))
+                    for row in range(2)
+                ))
+            cache[id(node)] = result
+        return self._scaled(result, weight)
+
+    def _apply_controlled(self, edge: Edge, gate: np.ndarray, control: int, target: int) -> Edge:
+        """Apply *gate* to *target* on the part of the state where *control* is 1"""
+        unchanged = self._project(edge, control, 0, {})
+        changed = self._apply_single(self._project(edge, control, 1, {}), gate, target, {})
+        return self._add(unchanged, changed)
+
+    def _project(self, edge: Edge, qubit: int, bit: int, cache: dict[int, Edge]) -> Edge:
+        """The part of the state where *qubit* is *bit*"""
+        weight, node = edge
+        if weight == 0:
+            return edge
+        result = cache.get(id(node))
+        if result is None:
+            if node.level < qubit:
+                result = self._make_node(node.level, *(
+                    self._project((child_weight, child), qubit, bit, cache)
+                    for child_weight, child in node.edges
+                ))
+            else:
+                edges = [self.zero, self.zero]
+                edges[bit] = node.edges[bit]
+                result = self._make_node(node.level, *edges)
+            cache[id(node)] = result
+        return self._scaled(result, weight)
+
+    def _scaled(self, edge: Edge, factor: complex) -> Edge:
+        weight = edge[0] * factor
+        return (weight, edge[1]) if abs(weight) > DecisionDiagram.TOLERANCE else self.zero
+
+    def _live_nodes(self) -> set[DDNode]:
+        live = set()
+        pending = [self.root[1]]
+        while pending:
+            node = pending.pop()
+            if node is self.terminal or node in live:
+                continue
+            live.add(node)
+            pending.extend(child for _, child in node.edges)
+        return live
+
+    def _collect_garbage(self) -> None:
+        """Drop the nodes that are no longer in use from the unique table, once there are many of them"""
+        live = self._live_nodes()
+        if len(self._unique) <= 2 * len(live):
+            return
+        self._unique = {key: node for key, node in self._unique.items() if node in live}
+        # the compute tables refer to nodes by id, which may be reused once a node is gone
+        self._add_cache.clear()
+
+    @staticmethod
+    def _rounded(weight: complex) -> tuple[float, float]:
+        digits = int(-np.log10(DecisionDiagram.TOLERANCE)) - 2
+        return round(weight.real, digits), round(weight.imag, digits)
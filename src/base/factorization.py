@@ -0,0 +1,192 @@
+from itertools import product
+
+import numpy as np
+
+from base.kernels import GateInstruction, MatrixInstruction, apply_single_qubit_gate, apply_two_qubit_gate
+
+
+def interaction_groups(num_qubits: int, gates: list[GateInstruction]) -> list[list[int]]:
+    """
+    Split the qubits into the connected components of their interaction graph: two qubits are in the same group
+    if a chain of multi-qubit gates connects them. The state of the circuit on a product input is the tensor product
+    of the states of the groups, so every group can be simulated on its own.
+
+    :return:    the groups, each as an ascending list of qubits, ordered by their lowest qubit
+    """
+    parents = list(range(num_qubits))
+
+    def root(qubit: int) -> int:
+        while parents[qubit] != qubit:
+            # halve the path on the way up, so the trees stay shallow
+            parents[qubit] = parents[parents[qubit]]
+            qubit = parents[qubit]
+        return qubit
+
+    for gate in gates:
+        first = root(gate.qubits[0])
+        for qubit in gate.qubits[1:]:
+            other = root(qubit)
+            if other != first:
+                parents[other] = first
+
+    groups: dict[int, list[int]] = {}
+    for qubit in range(num_qubits):
+        groups.setdefault(root(qubit), []).append(qubit)
+    return list(groups.values())
+
+
+class SubsystemState:
+    """
+    A state that is kept as a tensor product of independent subsystems: every qubit starts in a subsystem of its own,
+    and two subsystems are only merged (by their tensor product) when the first multi-qubit gate between them
+    is applied. Circuits whose qubits only interact late, or in small groups, never hold more than the largest
+    subsystem they need; :attr:`peak_size` reports that size as a measure of the memory used.
+    """
+
+    def __init__(self, num_qubits: int, index: int = 0) -> None:
+        """Create the computational basis state with the given *index* (qubit 0 is the most significant bit)"""
+        self.num_qubits = num_qubits
+        # every subsystem is its qubits, in the order of the axes of its tensor of shape (2,) * len(qubits)
+        self.subsystems: list[tuple[list[int], np.ndarray]] = []
+        # the position in :attr:`subsystems` of the subsystem that holds every qubit
+        self.owners: list[int] = []
+        for qubit in range(num_qubits):
+            state = np.zeros(2, dtype=complex)
+            state[(index >> (num_qubits - 1 - qubit)) & 1] = 1
+            self.subsystems.append(([qubit], state))
+            self.owners.append(qubit)
+        self.peak_size = 1
+
+    def apply(self, gate: GateInstruction) -> None:
+        """Apply a gate with a matrix (see :class:`base.kernels.MatrixInstruction`), merging subsystems if needed"""
+        if not isinstance(gate, MatrixInstruction):
+            raise ValueError(f"Gate {gate} cannot be applied to a subsystem state")
+        if len(gate.qubits) == 1:
+            qubits, state = self.subsystems[self.owners[gate.qubits[0]]]
+            state = apply_single_qubit_gate(state, gate.matrix, qubits.index(gate.qubits[0]))
+        else:
+            qubits, state = self._merge(self.owners[gate.qubits[0]], self.owners[gate.qubits[1]])
+            state = apply_two_qubit_gate(state, gate.matrix, qubits.index(gate.qubits[0]), qubits.index(gate.qubits[1]))
+        self.subsystems[self.owners[gate.qubits[0]]] = (qubits, state)
+
+    def to_state_vector(self) -> np.ndarray:
+        """The joint state of all qubits as a state vector of length 2^n"""
+        qubits: list[int] = []
+        state = np.ones((), dtype=complex)
+        for subsystem_qubits, subsystem_state in self.subsystems:
+            qubits += subsystem_qubits
+            state = np.tensordot(state, subsystem_state, axes=0)
+        # put the axes back in the order of the qubits
+        return np.transpose(state, np.argsort(qubits)).reshape(-1)
+
+    def marginals(self, qubits: list[int]) -> list[tuple[list[int], np.ndarray]]:
+        """
+        The distribution of the outcomes of measuring *qubits*, as the factors of a :class:`ProductDistribution`:
+        for every subsystem with a measured qubit, those qubits (ascending) and the probability of every outcome
+        of measuring them, indexed by the outcome as a binary number (lowest qubit first)
+        """
+        measured = set(qubits)
+        factors = []
+        for subsystem_qubits, state in self.subsystems:
+            kept = sorted(qubit for qubit in subsystem_qubits if qubit in measured)
+            if not kept:
+                continue
+            unmeasured = tuple(axis for axis, qubit in enumerate(subsystem_qubits) if qubit not in measured)
+            marginal = (np.abs(state) ** 2).sum(axis=unmeasured)
+            # the remaining axes are still in the order of the subsystem, sort them by qubit
+            order = np.argsort([qubit for qubit in subsystem_qubits if qubit in measured])
+            factors.append((kept, np.transpose(marginal, order).reshape(-1)))
+        return factors
+
+    def _merge(self, first: int, second: int) -> tuple[list[int], np.ndarray]:
+        """Merge the subsystem at position *second* into the one at position *first*, returning the result"""
+        if first == second:
+            return self.subsystems[first]
+
+        qubits, state = self.subsystems[first]
+        other_qubits, other_state = self.subsystems[second]
+        merged = (qubits + other_qubits, np.tensordot(state, other_state, axes=0))
+        self.subsystems[first] = merged
+        self.subsystems.pop(second)
+        # every subsystem after the removed one moves up by one
+        merged_position = first - int(first > second)
+        self.owners = [merged_position if owner == second else owner - int(owner > second) for owner in self.owners]
+        self.peak_size = max(self.peak_size, len(merged[0]))
+        return merged
+
+
+class ProductDistribution:
+    """
+    The distribution of the outcomes of measuring several groups of qubits that never interact (see
+    :func:`interaction_groups` and :class:`SubsystemState`): the product of one independent distribution per group. Only the factors are stored,
+    so ten groups of 4 qubits take 10 * 2^4 probabilities instead of 2^40; the joint distribution is only produced
+    on request, one outcome at a time.
+
+    Outcomes are bit strings over all measured qubits in ascending order (lowest qubit first), as for
+    :func:`base.compute.QuantumComputer.probabilities`.
+    """
+
+    # listing the outcomes with :func:`probabilities` is refused beyond this many
+    MAX_LISTED_OUTCOMES = 2 ** 20
+
+    def __init__(self, measured: list[int], factors: list[tuple[list[int], np.ndarray]]) -> None:
+        """
+        :param measured:    all measured qubits, in ascending order
+        :param factors:     for every group, its measured qubits (ascending) and the probability of every outcome
+                            of measuring them, indexed by the outcome as a binary number (lowest qubit first)
+        """
+        self.measured = measured
+        positions = {qubit: position for position, qubit in enumerate(measured)}
+        # for every factor: the positions of its bits in the joint outcome, and its possible outcomes
+        self.factors: list[tuple[list[int], list[tuple[str, float]]]] = []
+        for qubits, probabilities in factors:
+            outcomes = [
+                (format(outcome, f"0{len(qubits)}b"), float(probabilities[outcome]))
+                for outcome in np.flatnonzero(probabilities > 0)
+            ]
+            self.factors.append(([positions[qubit] for qubit in qubits], outcomes))
+
+    def __len__(self) -> int:
+        """The number of outcomes that can occur"""
+        count = 1
+        for _, outcomes in self.factors:
+            count *= len(outcomes)
+        return count
+
+    def probability(self, outcome: str) -> float:
+        """The probability of a single *outcome*, without listing any of the others"""
+        result = 1.0
+        for positions, outcomes in self.factors:
+            bits = ''.join(outcome[position] for position in positions)
+            result *= dict(outcomes).get(bits, 0.0)
+        return result
+
+    def items(self):
+        """Every outcome that can occur together with its probability, produced one at a time"""
+        for combination in product(*(outcomes for _, outcomes in self.factors)):
+            bits = ['0'] * len(self.measured)
+            probability = 1.0
+            for (positions, _), (factor_bits, factor_probability) in zip(self.factors, combination):
+                for position, bit in zip(positions, factor_bits):
+                    bits[position] = bit
+                probability *= factor_probability
+            yield ''.join(bits), probability
+
+    def probabilities(self, min_probability: float = 0.0) -> dict[str, float]:
+        """The probability of every outcome that is more likely than *min_probability*, keyed by its bit string"""
+        if len(self) > ProductDistribution.MAX_LISTED_OUTCOMES:
+            raise ValueError(f"The measurement has {len(self)} possible outcomes, which is too many to list")
+        return {outcome: probability for outcome, probability in self.items() if probability > min_probability}
+
+    def sample(self, shots: int, rng: np.random.Generator) -> dict[str, int]:
+        """Draw *shots* outcomes, one independent draw per group, returning how often each outcome was drawn"""
+        bits = np.zeros((shots, len(self.measured)), dtype='<U1')
+        for positions, outcomes in self.factors:
+            cumulative = np.cumsum([probability for _, probability in outcomes])
+            # normalise away the rounding errors of the simulation, so every draw lands on an outcome
+            cumulative /= cumulative[-1]
+            drawn = np.minimum(np.searchsorted(cumulative, rng.random(shots), side="right"), len(outcomes) - 1)
+            bits[:, positions] = np.array([list(factor_bits) for factor_bits, _ in outcomes], dtype='<U1')[drawn]
+
+        outcomes, counts = np.unique([''.join(row) for row in bits], return_counts=True)
+        return {str(outcome): int(count) for outcome, count in zip(outcomes, counts)}
@@ -0,0 +1,160 @@
+import numpy as np
+
+from base.fusion import fuse_gates
+from base.kernels import GateInstruction, MatrixInstruction, apply_single_qubit_gate, apply_two_qubit_gate
+from base.parallel import parallel_sum
+
+
+# terms of the decomposition of a gate across the cut with a smaller singular value than this are rounding errors
+ZERO_TERM = 1e-12
+
+
+def split_gate(matrix: np.ndarray) -> list[tuple[np.ndarray, np.ndarray]]:
+    """
+    Write a 4x4 gate in the basis ``|a b>`` as a sum of products ``sum_k A_k (x) B_k`` of 2x2 matrices on *a* and *b*.
+
+    This is the operator Schmidt decomposition: the singular value decomposition of the gate with its indices regrouped
+    per qubit. It has as few terms as possible, 2 for controlled gates like CNOT, CZ and CS and 4 for SWAP.
+    """
+    # [a_out, b_out, a_in, b_in] -> [(a_out, a_in), (b_out, b_in)]
+    regrouped = matrix.reshape(2, 2, 2, 2).transpose(0, 2, 1, 3).reshape(4, 4)
+    left, singular_values, right = np.linalg.svd(regrouped)
+    return [
+        (left[:, k].reshape(2, 2) * singular_values[k], right[k].reshape(2, 2))
+        for k in range(4) if singular_values[k] > ZERO_TERM
+    ]
+
+
+def fuse_within_blocks(gates: list[GateInstruction], cut: int) -> list[GateInstruction]:
+    """
+    Fuse the gates (see :func:`base.fusion.fuse_gates`) between every two gates across *cut*, leaving those
+    themselves alone: fused into a 4x4 block, a controlled gate across the cut would split into up to 4 terms instead of 2
+    """
+    fused: list[GateInstruction] = []
+    segment: list[GateInstruction] = []
+    for gate in gates:
+        if len({qubit >= cut for qubit in gate.qubits}) == 2:
+            fused += fuse_gates(segment).gates if segment else []
+            fused.append(gate)
+            segment = []
+        else:
+            segment.append(gate)
+    return fused + (fuse_gates(segment).gates if segment else [])
+
+
+class HybridCircuit:
+    """
+    A circuit cut into two blocks of qubits, ``[0, cut)`` and ``[cut, n)``, for Schrödinger-Feynman simulation:
+    every gate that acts across the cut is split into a sum of products of gates on either block (see :func:`split_gate`),
+    so the circuit becomes a sum over *paths* that each pick one term of every such gate.
+    On a single path the blocks never interact, so both are simulated as a state vector of their own and
+    the amplitudes of the whole circuit are the sum over all paths of the products of the amplitudes of the blocks.
+
+    This needs ``2^cut + 2^(n - cut)`` amplitudes of memory per path instead of 2^n, at the price of one simulation
+    of both blocks for each of the paths, whose number grows exponentially with the number of gates across the cut.
+    The paths are split into ranges that are simulated in parallel by a pool of processes.
+    """
+
+    # below this many paths they are simulated in the calling process, as starting the pool would take longer
+    PARALLEL_MIN_PATHS = 16
+
+    def __init__(self, num_qubits: int, gates: list[GateInstruction], cut: int | None = None) -> None:
+        """
+        :param num_qubits:    number of qubits of the circuit
+        :param gates:         the gates of the circuit, which must have a matrix (see :class:`base.kernels.MatrixInstruction`)
+        :param cut:           the first qubit of the second block, defaults to :func:`best_cut`
+        """
+        for gate in gates:
+            if not isinstance(gate, MatrixInstruction):
+                raise ValueError(f"Gate {gate} cannot be split across the cut")
+        if cut is None:
+            cut = HybridCircuit.best_cut(num_qubits, gates)
+        if not 0 < cut < num_qubits:
+            raise ValueError(f"The cut must leave at least one qubit on either side, but got {cut} for {num_qubits} qubits")
+
+        self.num_qubits = num_qubits
+        self.cut = cut
+        # every step is either a gate that stays within one block, as (block, qubits within the block, matrix),
+        # or the terms of a gate across the cut, as a list of (qubit, matrix) pairs that act on each block
+        self.steps: list[tuple[int, tuple[int, ...], np.ndarray] | list[tuple[tuple[int, np.ndarray], tuple[int, np.ndarray]]]] = []
+        for gate in gates:
+            blocks = {qubit >= cut for qubit in gate.qubits}
+            if len(blocks) == 1:
+                block = int(blocks.pop())
+                self.steps.append((block, tuple(qubit - block * cut for qubit in gate.qubits), gate.matrix))
+            else:
+                a, b = gate.qubits
+                self.steps.append([((a, left), (b, right)) for left, right in split_gate(gate.matrix)])
+
+    @staticmethod
+    def best_cut(num_qubits: int, gates: list[GateInstruction]) -> int:
+        """The cut for which simulating every path of both blocks needs the fewest amplitude updates"""
+        def cost(cut: int) -> float:
+            paths = 1
+            for gate in gates:
+                if len({qubit >= cut for qubit in gate.qubits}) == 2:
+                    paths *= len(split_gate(gate.matrix))
+            return paths * (2.0 ** cut + 2.0 ** (num_qubits - cut))
+
+        return min(range(1, num_qubits), key=cost)
+
+    @property
+    def num_paths(self) -> int:
+        """The number of paths, the product of the number of terms of every gate across the cut"""
+        paths = 1
+        for step in self.steps:
+            if isinstance(step, list):
+                paths *= len(step)
+        return paths
+
+    def amplitudes(self, outputs: list[int], start: int, workers: int | None = None) -> np.ndarray:
+        """
+        :param outputs:    indices of the computational basis states to get the amplitudes of (qubit 0 is the most significant bit)
+        :param start:      index of the computational basis state to start from
+        :param workers:    number of processes to simulate the paths with, defaults to the number of CPUs
+        :return:           the amplitude of every output, in the same order
+        """
+        return parallel_sum(_sum_paths, (self, outputs, start), self.num_paths, workers,
+                            HybridCircuit.PARALLEL_MIN_PATHS)
+
+    def simulate_path(self, path: int, start: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        The state vectors of both blocks at the end of a single path, where the path picks term
+        ``(path // prod(terms of the earlier gates)) % terms`` of every gate across the cut
+        """
+        sizes = (self.cut, self.num_qubits - self.cut)
+        states = []
+        for block, size in enumerate(sizes):
+            index = (start >> (sizes[1] if block == 0 else 0)) & (2 ** size - 1)
+            state = np.zeros(2 ** size, dtype=complex)
+            state[index] = 1
+            states.append(state.reshape((2,) * size))
+
+        for step in self.steps:
+            if isinstance(step, list):
+                path, term = divmod(path, len(step))
+                for qubit, matrix in step[term]:
+                    block = int(qubit >= self.cut)
+                    states[block] = apply_single_qubit_gate(states[block], matrix, qubit - block * self.cut)
+                continue
+
+            block, qubits, matrix = step
+            if len(qubits) == 1:
+                states[block] = apply_single_qubit_gate(states[block], matrix, qubits[0])
+            else:
+                states[block] = apply_two_qubit_gate(states[block], matrix, qubits[0], qubits[1])
+        return states[0].reshape(-1), states[1].reshape(-1)
+
+
+def _sum_paths(circuit: HybridCircuit, outputs: list[int], start: int, first: int, last: int) -> np.ndarray:
+    """The sum of the amplitudes of *outputs* over the paths *first* to *last* (exclusive) of *circuit*"""
+    low_qubits = circuit.num_qubits - circuit.cut
+    # the indices of wide circuits do not fit in a numpy integer, but those within a block do
+    high = np.array([output >> low_qubits for output in outputs], dtype=np.int64)
+    low = np.array([output & (2 ** low_qubits - 1) for output in outputs], dtype=np.int64)
+
+    total = np.zeros(len(outputs), dtype=complex)
+    for path in range(first, last):
+        first_block, second_block = circuit.simulate_path(path, start)
+        total += first_block[high] * second_block[low]
+    return total
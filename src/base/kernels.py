@@ -0,0 +1,375 @@
+from abc import ABC, abstractmethod
+from typing import Callable
+
+import numpy as np
+
+from base.cache import LRUCache
+from base.models import MultiOperationType, OperationType
+
+
+def apply_single_qubit_gate(state: np.ndarray, gate: np.ndarray, qubit: int) -> np.ndarray:
+    """
+    Apply the 2x2 matrix *gate* to *qubit* of *state*.
+
+    *state* is the state vector reshaped into a tensor with one axis of size 2 per qubit (``(2,) * n``),
+    with qubit 0 on the first axis. The gate is only contracted against the axis of *qubit*,
+    which costs time linear in the size of the state instead of building a 2^n x 2^n operator.
+
+    :param state:    state tensor of shape ``(2,) * n``
+    :param gate:     2x2 matrix to apply
+    :param qubit:    qubit (axis) the gate acts on
+    """
+    return np.moveaxis(np.tensordot(gate, state, axes=([1], [qubit])), 0, qubit)
+
+
+def apply_two_qubit_gate(state: np.ndarray, gate: np.ndarray, qubit_a: int, qubit_b: int) -> np.ndarray:
+    """
+    Apply the 4x4 matrix *gate*, written in the basis ``|qubit_a qubit_b>``, to the axes of *qubit_a* and *qubit_b* of *state*.
+
+    :param state:      state tensor of shape ``(2,) * n``
+    :param gate:       4x4 matrix to apply
+    :param qubit_a:    qubit corresponding to the most significant bit of *gate*
+    :param qubit_b:    qubit corresponding to the least significant bit of *gate*
+    """
+    contracted = np.tensordot(gate.reshape(2, 2, 2, 2), state, axes=([2, 3], [qubit_a, qubit_b]))
+    return np.moveaxis(contracted, [0, 1], [qubit_a, qubit_b])
+
+
+def apply_phases(state: np.ndarray, phases: np.ndarray) -> np.ndarray:
+    """
+    Multiply every amplitude of *state* by its entry in *phases*, a tensor of shape ``(2,) * n`` holding
+    the combined phase of a diagonal operator for each computational basis state.
+
+    The state is updated in place.
+    """
+    state *= phases.reshape(phases.shape + (1,) * (state.ndim - phases.ndim))
+    return state
+
+
+def _index(ndim: int, fixed_axes: dict[int, int]) -> tuple:
+    """
+    Build an index into a state tensor that fixes the axes in *fixed_axes* to the given bit value
+    and leaves every other axis (including any trailing non-qubit axes) whole
+    """
+    index = [slice(None)] * ndim
+    for axis, bit in fixed_axes.items():
+        index[axis] = bit
+    return tuple(index)
+
+
+def apply_controlled_not(state: np.ndarray, control: int, target: int) -> np.ndarray:
+    """
+    Apply CNOT by exchanging the target=0 and target=1 amplitudes on the control=1 slice of *state*.
+
+    The state is updated in place.
+    """
+    zero = _index(state.ndim, {control: 1, target: 0})
+    one = _index(state.ndim, {control: 1, target: 1})
+    flipped = state[zero].copy()
+    state[zero] = state[one]
+    state[one] = flipped
+    return state
+
+
+def apply_controlled_phase(state: np.ndarray, control: int, target: int, phase: complex) -> np.ndarray:
+    """
+    Apply a controlled phase gate (e.g. CZ, CS) by multiplying *phase* onto the control=1/target=1 slice of *state*.
+
+    The state is updated in place.
+    """
+    state[_index(state.ndim, {control: 1, target: 1})] *= phase
+    return state
+
+
+def apply_swap(state: np.ndarray, qubit_a: int, qubit_b: int) -> np.ndarray:
+    """
+    Apply SWAP by exchanging the axes of *qubit_a* and *qubit_b*. This does not move any amplitudes around.
+    """
+    return np.swapaxes(state, qubit_a, qubit_b)
+
+
+def complex_dtype(dtype: np.dtype) -> np.dtype:
+    """The complex dtype of the same precision as *dtype*: complex64 for float32 and complex64, otherwise complex128"""
+    return np.result_type(dtype, np.complex64)
+
+
+SWAP_MATRIX = np.array([
+    [1, 0, 0, 0],
+    [0, 0, 1, 0],
+    [0, 1, 0, 0],
+    [0, 0, 0, 1]
+], dtype=complex)
+
+
+def controlled_matrix(gate: np.ndarray) -> np.ndarray:
+    """The 4x4 matrix (basis ``|control target>``) that applies the 2x2 *gate* to the target if the control is 1"""
+    matrix = np.eye(4, dtype=complex)
+    matrix[2:, 2:] = gate
+    return matrix
+
+
+class GateInstruction(ABC):
+    """
+    A single gate application on the state tensor, as lowered from the operations of a circuit definition.
+
+    *gate_count* is the number of gates of the original circuit that this instruction stands in for.
+    """
+
+    def __init__(self, qubits: tuple[int, ...], gate_count: int = 1):
+        self.qubits = qubits
+        self.gate_count = gate_count
+
+    @abstractmethod
+    def apply(self, state: np.ndarray) -> np.ndarray:
+        ...
+
+    @property
+    @abstractmethod
+    def is_diagonal(self) -> bool:
+        """Whether the gate only changes the phases of the computational basis states"""
+        ...
+
+    @property
+    @abstractmethod
+    def is_real(self) -> bool:
+        """
+        Whether the gate only has real matrix entries. Applying it to a real (float64) state keeps the state real;
+        applying any other gate to a real state turns it complex.
+        """
+        ...
+
+    @property
+    @abstractmethod
+    def signature(self) -> tuple:
+        """A hashable description of the gate; instructions with equal signatures have the same effect"""
+        ...
+
+
+class MatrixInstruction(GateInstruction, ABC):
+    """An instruction on one or two qubits that can be written as a (small) matrix"""
+
+    @property
+    @abstractmethod
+    def matrix(self) -> np.ndarray:
+        """The matrix of the gate in the basis of :attr:`qubits` (2x2 or 4x4)"""
+        ...
+
+    @property
+    def is_diagonal(self) -> bool:
+        matrix = self.matrix
+        return not np.any(matrix - np.diag(np.diagonal(matrix)))
+
+    @property
+    def is_real(self) -> bool:
+        return not np.any(self.matrix.imag)
+
+    def _matrix_for(self, state: np.ndarray) -> np.ndarray:
+        """
+        The matrix to contract with *state*, in the precision of *state* (so that a complex64 state stays complex64)
+        and real if both are real, so that the result stays real
+        """
+        if not np.iscomplexobj(state) and self.is_real:
+            return self.matrix.real.astype(state.dtype, copy=False)
+        return self.matrix.astype(complex_dtype(state.dtype), copy=False)
+
+
+class SingleQubitInstruction(MatrixInstruction):
+    def __init__(self, qubit: int, matrix: np.ndarray, operation_type: OperationType | None = None, gate_count: int = 1):
+        super().__init__((qubit,), gate_count)
+        self._matrix = matrix
+        self.operation_type = operation_type
+
+    @property
+    def qubit(self) -> int:
+        return self.qubits[0]
+
+    @property
+    def matrix(self) -> np.ndarray:
+        return self._matrix
+
+    @property
+    def signature(self) -> tuple:
+        if self.operation_type is not None:
+            return (self.operation_type.name, self.qubit)
+        return ("FUSED", self.qubit, self._matrix.tobytes())
+
+    def apply(self, state: np.ndarray) -> np.ndarray:
+        return apply_single_qubit_gate(state, self._matrix_for(state), self.qubit)
+
+    def __str__(self):
+        name = self.operation_type.name if self.operation_type is not None else f"FUSED[{self.gate_count}]"
+        return f"{name}(q{self.qubit})"
+
+
+class MultiQubitInstruction(MatrixInstruction):
+    """
+    A two-qubit gate of the circuit that is applied by its dedicated matrix-free *kernel*.
+
+    For controlled gates *target_gate* is the 2x2 gate applied to the target, for SWAP it is ``None``.
+    """
+
+    def __init__(self,
+                 operation_type: MultiOperationType,
+                 control: int,
+                 target: int,
+                 kernel: Callable[[np.ndarray, int, int], np.ndarray],
+                 target_gate: np.ndarray | None):
+        super().__init__((control, target))
+        self.operation_type = operation_type
+        self._kernel = kernel
+        self._target_gate = target_gate
+
+    @property
+    def control(self) -> int:
+        return self.qubits[0]
+
+    @property
+    def target(self) -> int:
+        return self.qubits[1]
+
+    @property
+    def target_gate(self) -> np.ndarray | None:
+        return self._target_gate
+
+    @property
+    def matrix(self) -> np.ndarray:
+        if self._target_gate is None:
+            return SWAP_MATRIX
+        return controlled_matrix(self._target_gate)
+
+    @property
+    def is_real(self) -> bool:
+        return self._target_gate is None or not np.any(self._target_gate.imag)
+
+    @property
+    def signature(self) -> tuple:
+        return (self.operation_type.name, self.control, self.target)
+
+    def apply(self, state: np.ndarray) -> np.ndarray:
+        if not np.iscomplexobj(state) and not self.is_real:
+            # the kernels work in place, so the state has to be able to hold the complex phase first
+            state = state.astype(complex_dtype(state.dtype))
+        return self._kernel(state, self.control, self.target)
+
+    def __str__(self):
+        return f"{self.operation_type.name}(control=q{self.control},target=q{self.target})"
+
+
+class TwoQubitBlockInstruction(MatrixInstruction):
+    """A dense 4x4 block, produced by fusing several gates acting on the same pair of qubits"""
+
+    def __init__(self, qubit_a: int, qubit_b: int, matrix: np.ndarray, gate_count: int):
+        super().__init__((qubit_a, qubit_b), gate_count)
+        self._matrix = matrix
+
+    @property
+    def matrix(self) -> np.ndarray:
+        return self._matrix
+
+    @property
+    def signature(self) -> tuple:
+        return ("FUSED", self.qubits, self._matrix.tobytes())
+
+    def apply(self, state: np.ndarray) -> np.ndarray:
+        return apply_two_qubit_gate(state, self._matrix_for(state), self.qubits[0], self.qubits[1])
+
+    def __str__(self):
+        return f"FUSED[{self.gate_count}](q{self.qubits[0]},q{self.qubits[1]})"
+
+
+class PhaseInstruction(GateInstruction):
+    """
+    A run of diagonal gates (e.g. Z, S, T, T_dg, CZ, CS) that is applied as a single elementwise multiplication
+    with a precomputed phase vector of length 2^n, instead of one pass over the state per gate.
+
+    If a *cache* is given, phase vectors are shared through it between all runs with the same signature,
+    across circuits and across calls.
+    """
+
+    def __init__(self, num_qubits: int, gates: list[MatrixInstruction], cache: LRUCache | None = None):
+        qubits = sorted(set(qubit for gate in gates for qubit in gate.qubits))
+        super().__init__(tuple(qubits), sum(gate.gate_count for gate in gates))
+        self.num_qubits = num_qubits
+        self.gates = gates
+        self._cache = cache
+        self._phases: dict[np.dtype, np.ndarray] = {}
+        self._is_real = all(gate.is_real for gate in gates)
+
+    @property
+    def is_diagonal(self) -> bool:
+        return True
+
+    @property
+    def is_real(self) -> bool:
+        return self._is_real
+
+    @property
+    def signature(self) -> tuple:
+        return (self.num_qubits, tuple(gate.signature for gate in self.gates))
+
+    @property
+    def phases(self) -> np.ndarray:
+        """The phase of every computational basis state, as a read-only complex128 tensor of shape ``(2,) * n``"""
+        return self._phases_in(np.dtype(complex))
+
+    def apply(self, state: np.ndarray) -> np.ndarray:
+        if not np.iscomplexobj(state) and not self._is_real:
+            # the phases are multiplied in place, so a real state only stays real for signs
+            state = state.astype(complex_dtype(state.dtype))
+        return apply_phases(state, self._phases_for(state))
+
+    def _phases_for(self, state: np.ndarray) -> np.ndarray:
+        """
+        The phases to multiply *state* with, in the precision of *state* (so that a complex64 state does not need
+        a complex128 vector) and real if both are real
+        """
+        if not np.iscomplexobj(state) and self._is_real:
+            return self._phases_in(state.dtype)
+        return self._phases_in(complex_dtype(state.dtype))
+
+    def _phases_in(self, dtype: np.dtype) -> np.ndarray:
+        if dtype in self._phases:
+            return self._phases[dtype]
+
+        # the vectors of every precision are cached separately, so a single precision run never gets double precision phases
+        key = (self.signature, dtype.str)
+        phases = self._cache.get(key) if self._cache is not None else None
+        if phases is None:
+            phases = self._build_phases(dtype)
+            phases.flags.writeable = False
+            if self._cache is not None:
+                self._cache.put(key, phases)
+        self._phases[dtype] = phases
+        return phases
+
+    def _build_phases(self, dtype: np.dtype) -> np.ndarray:
+        # combine the gates per qubit and per pair of qubits first,
+        # so the full vector only needs one multiplication for each of those
+        single_factors: dict[int, np.ndarray] = {}
+        pair_factors: dict[tuple[int, int], np.ndarray] = {}
+        for gate in self.gates:
+            diagonal = np.diagonal(gate.matrix)
+            if len(gate.qubits) == 1:
+                qubit = gate.qubits[0]
+                single_factors[qubit] = single_factors.get(qubit, 1) * diagonal
+            else:
+                a, b = gate.qubits
+                factor = diagonal.reshape(2, 2)
+                if a > b:
+                    a, b, factor = b, a, factor.T
+                pair_factors[(a, b)] = pair_factors.get((a, b), 1) * factor
+
+        # the factors are combined in double precision, only the full vector is built in *dtype*
+        phases = np.ones((2,) * self.num_qubits, dtype=dtype)
+        part = np.real if not np.iscomplexobj(phases) else np.asarray
+        for qubit, factor in single_factors.items():
+            phases *= part(factor).reshape(self._broadcast_shape(qubit))
+        for (a, b), factor in pair_factors.items():
+            phases *= part(factor).reshape(self._broadcast_shape(a, b))
+        return phases
+
+    def _broadcast_shape(self, *qubits: int) -> tuple[int, ...]:
+        return tuple(2 if qubit in qubits else 1 for qubit in range(self.num_qubits))
+
+    def __str__(self):
+        return f"PHASES[{self.gate_count}]({', '.join(str(gate) for gate in self.gates)})"
@@ -181,6 +181,8 @@ class CircuitDefinition:
             raise ValueError(f"Inappropriate number of qubits defined '{num_qubits}' but must be >= 1")
 
         self._operation_schedules = [QuBitOperations(i) for i in range(num_qubits)]
+        # incremented on every change made through this definition, so simulations can tell whether their results are stale
+        self._version = 0
 
     def __str__(self):
         return f"ScheduleDefinition[{len(self._operation_schedules)}]"
@@ -188,6 +190,7 @@ class CircuitDefinition:
     def add_qubit(self) -> int:
         new_qubit_number = len(self._operation_schedules)
         self._operation_schedules.append(QuBitOperations(new_qubit_number))
+        self._version += 1
         return new_qubit_number
 
     def remove_qubit(self, qubit_to_be_deleted: int):
@@ -219,6 +222,7 @@ class CircuitDefinition:
 
         # remove the deleted schedule
         self._operation_schedules.pop(qubit_to_be_deleted)
+        self._version += 1
 
     def set_operation(self, qubit: int, time: int, operation: OperationType) -> QuBitOperationSingleParam:
         """
@@ -231,6 +235,7 @@ class CircuitDefinition:
         self._validate_qubit(qubit)
         CircuitDefinition._validate_time(time)
         (new_op, _) = self._operation_schedules[qubit].add_operation(operation, time)
+        self._version += 1
         return new_op
 
     def next_operation(self, qubit: int, operation: OperationType) -> None:
@@ -241,6 +246,7 @@ class CircuitDefinition:
         """
         self._validate_qubit(qubit)
         self._operation_schedules[qubit].add_operation(operation)
+        self._version += 1
 
     def next_nop(self, qubit: int, time_slots: int = 1) -> None:
         """
@@ -258,6 +264,7 @@ class CircuitDefinition:
             return
 
         self._operation_schedules[qubit].append_nop(time_slots)
+        self._version += 1
 
     def next_multi_operation(self, qubit: int, qubit_other: int, operation: MultiOperationType) -> None:
         """
@@ -271,6 +278,7 @@ class CircuitDefinition:
 
         (new_op, time) = self._operation_schedules[qubit].add_multi_operation(operation, qubit_other)
         self._operation_schedules[qubit_other].add_participation(new_op, time)
+        self._version += 1
 
     def set_multi_operation(self,
                             qubit: int,
@@ -292,10 +300,12 @@ class CircuitDefinition:
 
         (new_op, _) = self._operation_schedules[qubit].add_multi_operation(operation, qubit_other, time)
         self._operation_schedules[qubit_other].add_participation(new_op, time)
+        self._version += 1
         return new_op
 
     def add_some_operation(self, qbit: int, time: int, operation: QuBitOperationBase):
         self._operation_schedules[qbit].add_some_operation(operation, time)
+        self._version += 1
 
     def drop_operation(self, qbit: int, time: int):
         self._validate_qubit(qbit)
@@ -310,6 +320,8 @@ class CircuitDefinition:
             other = dropped_op.refers_to().get_applied_by()
             self._operation_schedules[other].drop_operation(time)
 
+        self._version += 1
+
     def is_nop(self, qubit: int, time: int):
         self._validate_qubit(qubit)
         CircuitDefinition._validate_time(time)
@@ -349,6 +361,10 @@ class CircuitDefinition:
     def num_qubits(self):
         return len(self._operation_schedules)
 
+    @property
+    def version(self):
+        return self._version
+
     @property
     def max_time(self):
         if self.num_qubits == 0:
@@ -0,0 +1,214 @@
+import numpy as np
+
+from base.kernels import GateInstruction, MatrixInstruction, SWAP_MATRIX
+
+
+class MatrixProductState:
+    """
+    A state of *num_qubits* qubits stored as a matrix product state: one tensor of shape ``(left bond, 2, right bond)``
+    per qubit, qubit 0 first. The memory grows with the entanglement of the state rather than with 2^n,
+    so shallow circuits that create little entanglement can be simulated on many qubits.
+
+    The tensors are kept in mixed canonical form around an orthogonality center, so a two-qubit gate can be truncated
+    optimally: after every two-qubit gate the singular values of the bond are cut to at most *max_bond_dimension*, and
+    the smallest ones are dropped for as long as their total weight stays below *truncation_threshold*.
+    The weight that was dropped is added up in :attr:`discarded_weight`.
+    """
+
+    # singular values with a relative weight below this are rounding errors and always dropped
+    ZERO_WEIGHT = 1e-15
+    # listing the outcomes of a measurement is refused beyond this many outcomes with a non-zero probability
+    MAX_ENUMERATED_OUTCOMES = 2 ** 20
+
+    def __init__(self, tensors: list[np.ndarray], max_bond_dimension: int | None = None, truncation_threshold: float = 0.0) -> None:
+        """
+        :param tensors:                 the tensors of the state, which must be right canonical (or the state a product state)
+        :param max_bond_dimension:      upper bound on the size of every bond, or ``None`` for no limit
+        :param truncation_threshold:    largest total weight of singular values that may be dropped after a two-qubit gate
+        """
+        if max_bond_dimension is not None and max_bond_dimension < 1:
+            raise ValueError(f"The maximum bond dimension must be at least 1, but got {max_bond_dimension}")
+        self.tensors = tensors
+        self.max_bond_dimension = max_bond_dimension
+        self.truncation_threshold = truncation_threshold
+        self.discarded_weight = 0.0
+        self._center = 0
+
+    @staticmethod
+    def from_basis_state(num_qubits: int, index: int, **kwargs) -> 'MatrixProductState':
+        """Create the computational basis state with the given *index* (qubit 0 is the most significant bit)"""
+        tensors = []
+        for qubit in range(num_qubits):
+            tensor = np.zeros((1, 2, 1), dtype=complex)
+            tensor[0, (index >> (num_qubits - 1 - qubit)) & 1, 0] = 1
+            tensors.append(tensor)
+        return MatrixProductState(tensors, **kwargs)
+
+    @staticmethod
+    def from_state_vector(state: np.ndarray, **kwargs) -> 'MatrixProductState':
+        """Split a state vector of length 2^n into a (right canonical) matrix product state"""
+        num_qubits = int(np.log2(len(state)))
+        tensors = []
+        rest = np.asarray(state, dtype=complex).reshape(-1, 1)
+        for qubit in reversed(range(num_qubits)):
+            rest = rest.reshape(-1, 2 * rest.shape[1])
+            u, s, vh = np.linalg.svd(rest, full_matrices=False)
+            keep = max(1, int(np.count_nonzero(s ** 2 > MatrixProductState.ZERO_WEIGHT * np.sum(s ** 2))))
+            tensors.append(vh[:keep].reshape(keep, 2, -1))
+            rest = u[:, :keep] * s[:keep]
+        tensors[-1] = tensors[-1] * rest[0, 0]
+        return MatrixProductState(list(reversed(tensors)), **kwargs)
+
+    @property
+    def num_qubits(self) -> int:
+        return len(self.tensors)
+
+    @property
+    def bond_dimensions(self) -> list[int]:
+        """The size of every bond between two neighbouring qubits"""
+        return [tensor.shape[2] for tensor in self.tensors[:-1]]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(tensor.nbytes for tensor in self.tensors)
+
+    def apply(self, gate: GateInstruction) -> None:
+        """Apply a one- or two-qubit *gate* that has a matrix (see :class:`base.kernels.MatrixInstruction`)"""
+        if not isinstance(gate, MatrixInstruction):
+            raise ValueError(f"Gate {gate} cannot be applied to a matrix product state")
+        if len(gate.qubits) == 1:
+            self.apply_single_qubit_gate(gate.matrix, gate.qubits[0])
+        else:
+            self.apply_two_qubit_gate(gate.matrix, gate.qubits[0], gate.qubits[1])
+
+    def apply_single_qubit_gate(self, gate: np.ndarray, qubit: int) -> None:
+        self.tensors[qubit] = np.einsum('st,atb->asb', gate, self.tensors[qubit])
+
+    def apply_two_qubit_gate(self, gate: np.ndarray, qubit_a: int, qubit_b: int) -> None:
+        """
+        Apply the 4x4 matrix *gate*, written in the basis ``|qubit_a qubit_b>``.
+
+        Qubits that are not neighbours are first brought next to each other by a network of SWAP gates
+        on neighbouring qubits, which are undone again afterwards.
+        """
+        if qubit_a > qubit_b:
+            # write the gate in the basis |qubit_b qubit_a>
+            gate = gate.reshape(2, 2, 2, 2).transpose(1, 0, 3, 2).reshape(4, 4)
+            qubit_a, qubit_b = qubit_b, qubit_a
+
+        for site in range(qubit_b - 1, qubit_a, -1):
+            self._apply_neighbouring(SWAP_MATRIX, site)
+        self._apply_neighbouring(gate, qubit_a)
+        for site in range(qubit_a + 1, qubit_b):
+            self._apply_neighbouring(SWAP_MATRIX, site)
+
+    def to_state_vector(self) -> np.ndarray:
+        state = np.ones((1, 1), dtype=complex)
+        for tensor in self.tensors:
+            state = np.einsum('xa,asb->xsb', state, tensor).reshape(-1, tensor.shape[2])
+        return state.reshape(-1)
+
+    def measurement_probabilities(self, qubits: list[int]) -> dict[str, float]:
+        """
+        The probability of every outcome of measuring *qubits*, keyed by its bit string; outcomes that cannot occur
+        are left out.
+
+        The outcomes are built up one qubit at a time from qubit 0, keeping the reduced environment of every partial
+        outcome with a non-zero probability, with the qubits that are not measured traced out.
+        """
+        self._move_center(0)
+        measured = set(qubits)
+        # every partial outcome (as the bits of the measured qubits so far) with its left environment
+        branches: list[tuple[str, np.ndarray]] = [("", np.ones((1, 1), dtype=complex))]
+        for qubit, tensor in enumerate(self.tensors):
+            if qubit not in measured:
+                branches = [(bits, np.einsum('xy,xsa,ysb->ab', environment, tensor.conj(), tensor))
+                            for bits, environment in branches]
+                continue
+
+            extended = []
+            for bits, environment in branches:
+                for bit in range(2):
+                    part = tensor[:, bit, :]
+                    next_environment = part.conj().T @ environment @ part
+                    # the tensors to the right are right canonical, so the trace is the probability of the partial outcome
+                    if np.real(np.trace(next_environment)) > MatrixProductState.ZERO_WEIGHT:
+                        extended.append((bits + str(bit), next_environment))
+            if len(extended) > MatrixProductState.MAX_ENUMERATED_OUTCOMES:
+                raise ValueError(f"The measurement has more than {MatrixProductState.MAX_ENUMERATED_OUTCOMES} possible outcomes, which is too many to list")
+            branches = extended
+
+        return {bits: float(np.real(np.trace(environment))) for bits, environment in branches}
+
+    def sample(self, qubits: list[int], shots: int, rng: np.random.Generator) -> dict[str, int]:
+        """
+        Draw *shots* outcomes of measuring *qubits*, returning how often each outcome was drawn keyed by its bit string.
+
+        Every shot measures all qubits one after the other from qubit 0, with the conditional probabilities given
+        by the partial outcome so far; the bits of the qubits that are not in *qubits* are dropped afterwards.
+        All shots are drawn together.
+        """
+        self._move_center(0)
+        left = np.ones((shots, 1), dtype=complex)
+        bits = np.zeros((shots, self.num_qubits), dtype=bool)
+        for qubit, tensor in enumerate(self.tensors):
+            zero = left @ tensor[:, 0, :]
+            one = left @ tensor[:, 1, :]
+            weight_zero = np.sum(np.abs(zero) ** 2, axis=1)
+            weight_one = np.sum(np.abs(one) ** 2, axis=1)
+            bits[:, qubit] = rng.random(shots) * (weight_zero + weight_one) >= weight_zero
+            left = np.where(bits[:, qubit, None], one, zero)
+            # keep the partial states normalised, so long chains do not underflow
+            left /= np.linalg.norm(left, axis=1, keepdims=True)
+
+        outcomes, counts = np.unique(bits[:, qubits], axis=0, return_counts=True)
+        return {
+            ''.join('1' if bit else '0' for bit in outcome): int(count)
+            for outcome, count in zip(outcomes, counts)
+        }
+
+    def _apply_neighbouring(self, gate: np.ndarray, site: int) -> None:
+        """Apply the 4x4 *gate* to the neighbouring qubits *site* and *site + 1*, and truncate the bond between them"""
+        self._move_center(site)
+        left, right = self.tensors[site], self.tensors[site + 1]
+        pair = np.einsum('asb,btc->astc', left, right)
+        pair = np.einsum('stuv,auvc->astc', gate.reshape(2, 2, 2, 2), pair)
+        left_bond, right_bond = pair.shape[0], pair.shape[3]
+
+        u, s, vh = np.linalg.svd(pair.reshape(left_bond * 2, 2 * right_bond), full_matrices=False)
+        keep = self._truncated_size(s)
+        kept = s[:keep] / np.linalg.norm(s[:keep])
+        self.tensors[site] = u[:, :keep].reshape(left_bond, 2, keep)
+        self.tensors[site + 1] = (kept[:, None] * vh[:keep]).reshape(keep, 2, right_bond)
+        self._center = site + 1
+
+    def _truncated_size(self, singular_values: np.ndarray) -> int:
+        """The number of singular values to keep, adding the weight of the others to :attr:`discarded_weight`"""
+        weights = singular_values ** 2
+        weights = weights / np.sum(weights)
+        # tail[i] is the weight of all values from i on
+        tail = np.cumsum(weights[::-1])[::-1]
+        allowed = max(self.truncation_threshold, MatrixProductState.ZERO_WEIGHT)
+        keep = max(1, int(np.count_nonzero(tail > allowed)))
+        if self.max_bond_dimension is not None:
+            keep = min(keep, self.max_bond_dimension)
+        self.discarded_weight += float(np.sum(weights[keep:]))
+        return keep
+
+    def _move_center(self, site: int) -> None:
+        """Move the orthogonality center to *site* by QR decompositions of the tensors in between"""
+        while self._center < site:
+            tensor = self.tensors[self._center]
+            left_bond, _, right_bond = tensor.shape
+            q, r = np.linalg.qr(tensor.reshape(left_bond * 2, right_bond))
+            self.tensors[self._center] = q.reshape(left_bond, 2, -1)
+            self.tensors[self._center + 1] = np.einsum('ab,bsc->asc', r, self.tensors[self._center + 1])
+            self._center += 1
+        while self._center > site:
+            tensor = self.tensors[self._center]
+            left_bond, _, right_bond = tensor.shape
+            q, r = np.linalg.qr(tensor.reshape(left_bond, 2 * right_bond).T)
+            self.tensors[self._center] = q.T.reshape(-1, 2, right_bond)
+            self.tensors[self._center - 1] = np.einsum('asb,cb->asc', self.tensors[self._center - 1], r)
+            self._center -= 1
+
@@ -0,0 +1,308 @@
+import numpy as np
+
+from base.kernels import GateInstruction, MultiQubitInstruction, SingleQubitInstruction
+from base.models import MultiOperationType, OperationType
+from base.stabilizer import OutcomeDistribution, bit_strings
+
+
+_EIGHTH_ROOT = np.exp(np.pi * 1j / 4)
+
+# every non-Clifford gate is written as a * (identity) + b * (a Clifford gate), keyed by gate type:
+#   T = diag(1, w) = (1 + w)/2 I + (1 - w)/2 Z  with w = e^(i pi/4), T_dg the same with w conjugated
+#   CS = diag(1, 1, 1, i) = (1 + i)/2 I + (1 - i)/2 CZ
+NON_CLIFFORD_DECOMPOSITIONS = {
+    OperationType.T: ((1 + _EIGHTH_ROOT) / 2, (1 - _EIGHTH_ROOT) / 2),
+    OperationType.T_dg: ((1 + np.conjugate(_EIGHTH_ROOT)) / 2, (1 - np.conjugate(_EIGHTH_ROOT)) / 2),
+    MultiOperationType.CS: ((1 + 1j) / 2, (1 - 1j) / 2),
+}
+
+
+def superposition_size(num_qubits: int, index: int, gates: list[GateInstruction]) -> int:
+    """
+    The number of qubits in superposition at the end of the Clifford part of *gates* (the T, T_dg and CS gates left out)
+    on the basis state *index*: that state has a support of 2^k basis states, which estimates the support of every term
+    of the :class:`StabilizerSum` of the whole circuit at the cost of simulating a single term
+    """
+    state = CHForm.from_basis_state(num_qubits, index)
+    for gate in gates:
+        if not isinstance(gate, (SingleQubitInstruction, MultiQubitInstruction)) or gate.operation_type not in NON_CLIFFORD_DECOMPOSITIONS:
+            state.apply(gate)
+    return int(np.count_nonzero(state.v))
+
+
+def count_non_clifford(gates: list[GateInstruction]) -> int:
+    """The number of T, T_dg and CS gates among *gates* (as lowered from a circuit, before fusion)"""
+    return sum(
+        1 for gate in gates
+        if isinstance(gate, (SingleQubitInstruction, MultiQubitInstruction)) and gate.operation_type in NON_CLIFFORD_DECOMPOSITIONS
+    )
+
+
+class CHForm:
+    """
+    A stabilizer state of *num_qubits* qubits including its global phase, in the CH-form of Bravyi et al.
+    ("Simulation of quantum circuits by low-rank stabilizer decompositions", 2019):
+    ``omega * U_C * U_H |s>``, where ``U_H`` applies H to the qubits in *v* and ``U_C`` is a Clifford circuit
+    of S, CZ and CNOT gates that is stored as the binary matrices *F*, *G*, *M* and the phase exponents *gamma*.
+
+    Unlike :class:`base.stabilizer.StabilizerTableau` the phase is kept, so several of these states can be added up.
+    Every gate is applied in ``O(n)`` time, except H which takes ``O(n^2)``.
+    """
+
+    def __init__(self, num_qubits: int) -> None:
+        """Create the all-zero state ``|0...0>``"""
+        self.num_qubits = num_qubits
+        self.f = np.eye(num_qubits, dtype=bool)
+        self.g = np.eye(num_qubits, dtype=bool)
+        self.m = np.zeros((num_qubits, num_qubits), dtype=bool)
+        self.gamma = np.zeros(num_qubits, dtype=np.int64)
+        self.v = np.zeros(num_qubits, dtype=bool)
+        self.s = np.zeros(num_qubits, dtype=bool)
+        self.omega: complex = 1
+
+    @staticmethod
+    def from_basis_state(num_qubits: int, index: int) -> 'CHForm':
+        """Create the computational basis state with the given *index* (qubit 0 is the most significant bit)"""
+        state = CHForm(num_qubits)
+        for qubit in range(num_qubits):
+            state.s[qubit] = (index >> (num_qubits - 1 - qubit)) & 1
+        return state
+
+    def copy(self) -> 'CHForm':
+        state = CHForm.__new__(CHForm)
+        state.num_qubits = self.num_qubits
+        state.f, state.g, state.m = self.f.copy(), self.g.copy(), self.m.copy()
+        state.gamma, state.v, state.s = self.gamma.copy(), self.v.copy(), self.s.copy()
+        state.omega = self.omega
+        return state
+
+    def apply(self, gate: GateInstruction) -> None:
+        """Apply a Clifford *gate*"""
+        if isinstance(gate, SingleQubitInstruction):
+            CHForm._SINGLE_GATES[gate.operation_type](self, gate.qubit)
+        elif isinstance(gate, MultiQubitInstruction):
+            CHForm._MULTI_GATES[gate.operation_type](self, gate.control, gate.target)
+        else:
+            raise ValueError(f"Gate {gate} cannot be applied to a CH-form")
+
+    def apply_s(self, qubit: int) -> None:
+        self.m[qubit] ^= self.g[qubit]
+        self.gamma[qubit] = (self.gamma[qubit] - 1) % 4
+
+    def apply_z(self, qubit: int) -> None:
+        self.apply_s(qubit)
+        self.apply_s(qubit)
+
+    def apply_x(self, qubit: int) -> None:
+        self.apply_h(qubit)
+        self.apply_z(qubit)
+        self.apply_h(qubit)
+
+    def apply_y(self, qubit: int) -> None:
+        # Y = iXZ
+        self.apply_z(qubit)
+        self.apply_x(qubit)
+        self.omega *= 1j
+
+    def apply_identity(self, qubit: int) -> None:
+        pass
+
+    def apply_cz(self, control: int, target: int) -> None:
+        self.m[control] ^= self.g[target]
+        self.m[target] ^= self.g[control]
+
+    def apply_cnot(self, control: int, target: int) -> None:
+        overlap = np.count_nonzero(self.m[control] & self.f[target]) % 2
+        self.gamma[control] = (self.gamma[control] + self.gamma[target] + 2 * overlap) % 4
+        self.g[target] ^= self.g[control]
+        self.f[control] ^= self.f[target]
+        self.m[control] ^= self.m[target]
+
+    def apply_swap(self, qubit_a: int, qubit_b: int) -> None:
+        self.apply_cnot(qubit_a, qubit_b)
+        self.apply_cnot(qubit_b, qubit_a)
+        self.apply_cnot(qubit_a, qubit_b)
+
+    def apply_h(self, qubit: int) -> None:
+        f, g, m, v, s = self.f[qubit], self.g[qubit], self.m[qubit], self.v, self.s
+        t = s ^ (g & v)
+        u = s ^ (f & ~v) ^ (m & v)
+        alpha = np.count_nonzero(g & ~v & s) % 2
+        beta = (np.count_nonzero(m & ~v & s) + np.count_nonzero(f & v & m) + np.count_nonzero(f & v & s)) % 2
+        delta = (self.gamma[qubit] + 2 * (alpha + beta)) % 4
+        self._update_sum(t, u, delta, alpha)
+
+    def amplitudes(self, bits: np.ndarray) -> np.ndarray:
+        """
+        The amplitudes ``<x|state>`` of the computational basis states *x* given as rows of bits
+        (qubit 0 first) in *bits*, a bool array of shape ``(count, n)``
+        """
+        bits = np.asarray(bits, dtype=bool)
+        mu = bits.astype(np.int64) @ self.gamma
+        u = np.zeros(bits.shape, dtype=bool)
+        for qubit in range(self.num_qubits):
+            u ^= bits[:, qubit, None] & self.f[qubit]
+            mu += 2 * (bits[:, qubit] & (np.count_nonzero(u & self.m[qubit], axis=1) % 2 == 1))
+
+        in_support = np.all(self.v | (u == self.s), axis=1)
+        signs = 1 - 2 * (np.count_nonzero(self.v & u & self.s, axis=1) % 2)
+        scale = self.omega * 2 ** (-np.count_nonzero(self.v) / 2)
+        return np.where(in_support, scale * signs * 1j ** (mu % 4), 0)
+
+    def support(self) -> OutcomeDistribution:
+        """
+        The computational basis states with a non-zero amplitude, as an affine subspace of bit strings of size ``2^|v|``:
+        ``<x|state>`` is only non-zero where the bits of ``F^T x`` match *s* on every qubit without H
+        """
+        return OutcomeDistribution.solve(self.f.T[~self.v], self.s[~self.v])
+
+    def _update_sum(self, t: np.ndarray, u: np.ndarray, delta: int, alpha: int) -> None:
+        """
+        Rewrite ``i^alpha U_H (|t> + i^delta |u>)`` as a single ``omega U_C U_H |s>``, updating ``U_C`` by
+        right multiplication (Proposition 4 of Bravyi et al.)
+        """
+        if np.array_equal(t, u):
+            self.s = t
+            self.omega *= (-1) ** alpha * (1 + 1j ** delta) / np.sqrt(2)
+            return
+
+        differ = t ^ u
+        set0 = np.flatnonzero(~self.v & differ)
+        set1 = np.flatnonzero(self.v & differ)
+        if len(set0) > 0:
+            q = set0[0]
+            for i in set0[1:]:
+                self._right_cnot(q, i)
+            for i in set1:
+                self._right_cz(q, i)
+        else:
+            q = set1[0]
+            for i in set1[1:]:
+                self._right_cnot(i, q)
+
+        if t[q]:
+            y, z = u.copy(), u.copy()
+            y[q] = not y[q]
+        else:
+            y, z = t.copy(), t.copy()
+            z[q] = not z[q]
+
+        omega, a, b, c = CHForm._decompose_single(self.v[q], y[q], delta)
+        self.s = y
+        self.s[q] = c
+        self.omega *= (-1) ** alpha * omega
+        if a:
+            self._right_s(q)
+        self.v[q] = b
+
+    @staticmethod
+    def _decompose_single(v: bool, y: bool, delta: int) -> tuple[complex, bool, bool, bool]:
+        """Solve ``H^v (|y> + i^delta |1 - y>) = omega S^a H^b |c>`` for a single qubit"""
+        if not v:
+            omega = 1j ** (delta * int(y))
+            delta = ((-1) ** int(y) * delta) % 4
+            return omega, bool(delta & 1), True, bool(delta >> 1)
+        if delta % 2 == 0:
+            c = bool(delta >> 1)
+            return (-1) ** int(c and y), False, False, c
+        return (1 + 1j ** delta) / np.sqrt(2), True, True, not (bool(delta >> 1) ^ bool(y))
+
+    def _right_s(self, qubit: int) -> None:
+        self.m[:, qubit] ^= self.f[:, qubit]
+        self.gamma = (self.gamma - self.f[:, qubit]) % 4
+
+    def _right_cz(self, qubit_a: int, qubit_b: int) -> None:
+        self.m[:, qubit_a] ^= self.f[:, qubit_b]
+        self.m[:, qubit_b] ^= self.f[:, qubit_a]
+        self.gamma = (self.gamma + 2 * (self.f[:, qubit_a] & self.f[:, qubit_b])) % 4
+
+    def _right_cnot(self, control: int, target: int) -> None:
+        self.g[:, control] ^= self.g[:, target]
+        self.f[:, target] ^= self.f[:, control]
+        self.m[:, control] ^= self.m[:, target]
+
+    _SINGLE_GATES = {
+        OperationType.MEASURE: apply_identity,
+        OperationType.X: apply_x,
+        OperationType.Y: apply_y,
+        OperationType.Z: apply_z,
+        OperationType.H: apply_h,
+        OperationType.S: apply_s,
+    }
+    _MULTI_GATES = {
+        MultiOperationType.CNOT: apply_cnot,
+        MultiOperationType.CZ: apply_cz,
+        MultiOperationType.SWAP: apply_swap,
+    }
+
+
+class StabilizerSum:
+    """
+    A state written as a weighted sum of stabilizer states (see :class:`CHForm`).
+
+    Clifford gates are applied to every term. A T, T_dg or CS gate is a sum of the identity and a Clifford gate
+    (see :data:`NON_CLIFFORD_DECOMPOSITIONS`), so it splits every term in two. A circuit with *t* of those gates
+    ends up with ``2^t`` terms: the cost is exponential in *t* only, and polynomial in the number of qubits.
+    """
+
+    # listing the outcomes is refused beyond this many basis states in the supports of all terms together
+    MAX_SUPPORT_SIZE = 2 ** 20
+
+    def __init__(self, num_qubits: int, index: int = 0) -> None:
+        """Create the sum with the single term of the computational basis state with the given *index*"""
+        self.num_qubits = num_qubits
+        self.coefficients: list[complex] = [1]
+        self.terms: list[CHForm] = [CHForm.from_basis_state(num_qubits, index)]
+
+    def apply(self, gate: GateInstruction) -> None:
+        if not isinstance(gate, (SingleQubitInstruction, MultiQubitInstruction)):
+            raise ValueError(f"Gate {gate} cannot be applied to a stabilizer sum")
+        if gate.operation_type not in NON_CLIFFORD_DECOMPOSITIONS:
+            for term in self.terms:
+                term.apply(gate)
+            return
+
+        identity_weight, clifford_weight = NON_CLIFFORD_DECOMPOSITIONS[gate.operation_type]
+        branches = [term.copy() for term in self.terms]
+        for branch in branches:
+            if isinstance(gate, SingleQubitInstruction):
+                branch.apply_z(gate.qubit)
+            else:
+                branch.apply_cz(gate.control, gate.target)
+        self.coefficients = ([coefficient * identity_weight for coefficient in self.coefficients]
+                             + [coefficient * clifford_weight for coefficient in self.coefficients])
+        self.terms += branches
+
+    @property
+    def support_size(self) -> int:
+        """An upper bound on the number of basis states with a non-zero amplitude"""
+        return min(2 ** self.num_qubits, sum(2 ** int(np.count_nonzero(term.v)) for term in self.terms))
+
+    def amplitudes(self, bits: np.ndarray) -> np.ndarray:
+        """The amplitudes of the computational basis states given as rows of bits (qubit 0 first) in *bits*"""
+        result = np.zeros(len(bits), dtype=complex)
+        for coefficient, term in zip(self.coefficients, self.terms):
+            result += coefficient * term.amplitudes(bits)
+        return result
+
+    def measurement_probabilities(self, qubits: list[int]) -> dict[str, float]:
+        """
+        The probability of every outcome of measuring *qubits*, keyed by its bit string.
+
+        Only the basis states in the support of some term can have a non-zero amplitude, so those are the only ones
+        whose amplitudes are computed and added up per outcome. Outcomes that cannot occur are left out.
+        """
+        support_size = self.support_size
+        if support_size > StabilizerSum.MAX_SUPPORT_SIZE:
+            raise ValueError(f"The state has up to {support_size} basis states with a non-zero amplitude, which is too many to list")
+
+        if support_size == 2 ** self.num_qubits:
+            # the supports may cover every basis state, so listing them one term at a time would only add duplicates
+            bits = (np.arange(support_size)[:, None] >> np.arange(self.num_qubits - 1, -1, -1)) & 1 == 1
+        else:
+            bits = np.unique(np.vstack([term.support().outcomes() for term in self.terms]), axis=0)
+
+        probabilities = np.abs(self.amplitudes(bits)) ** 2
+        outcomes, inverse = np.unique(bits[:, qubits], axis=0, return_inverse=True)
+        totals = np.bincount(inverse.reshape(-1), weights=probabilities, minlength=len(outcomes))
+        return {outcome: float(total) for outcome, total in zip(bit_strings(outcomes), totals)}
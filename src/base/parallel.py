@@ -0,0 +1,29 @@
+from concurrent.futures import ProcessPoolExecutor
+import os
+from typing import Any, Callable
+
+import numpy as np
+
+
+def parallel_sum(func: Callable[..., Any], args: tuple, num_items: int, workers: int | None = None,
+                 min_items: int = 0) -> Any:
+    """
+    The sum of ``func(*args, first, last)`` over ranges ``[first, last)`` that together cover ``range(num_items)``,
+    computed by a pool of processes. *func* and *args* must be picklable.
+
+    :param func:         function that takes *args* followed by the range of items to sum
+    :param args:         the leading arguments of every call of *func*
+    :param num_items:    number of items to sum
+    :param workers:      number of processes, defaults to the number of CPUs
+    :param min_items:    below this many items *func* is called once in the calling process, as starting the pool
+                         would take longer
+    """
+    workers = workers if workers is not None else os.cpu_count() or 1
+    if workers <= 1 or num_items < min_items:
+        return func(*args, 0, num_items)
+
+    # a few ranges per worker, so workers that finish early can pick up more
+    bounds = np.linspace(0, num_items, 4 * workers + 1).astype(np.int64)
+    ranges = [(int(first), int(last)) for first, last in zip(bounds[:-1], bounds[1:]) if last > first]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return sum(pool.map(func, *zip(*[args + item_range for item_range in ranges])))
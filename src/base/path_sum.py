@@ -0,0 +1,121 @@
+import numpy as np
+
+from base.kernels import GateInstruction, MultiQubitInstruction, SingleQubitInstruction
+from base.parallel import parallel_sum
+
+
+# how every gate moves a path along, see :func:`_classify`
+DIAGONAL = "diagonal"
+ANTI_DIAGONAL = "anti_diagonal"
+BRANCH = "branch"
+SWAP = "swap"
+
+
+def _classify(matrix: np.ndarray) -> str:
+    """
+    Single-qubit gates that are diagonal only change the phase of a path and anti-diagonal ones flip its bit as well;
+    any other gate (like H) sends a path on to both values of the bit, so that is where paths branch
+    """
+    if not matrix[0, 1] and not matrix[1, 0]:
+        return DIAGONAL
+    if not matrix[0, 0] and not matrix[1, 1]:
+        return ANTI_DIAGONAL
+    return BRANCH
+
+
+class PathSum:
+    """
+    Computes single amplitudes ``<x|U|y>`` of a circuit as a Feynman path sum: a path follows one computational basis
+    state through the circuit, and every gate that is neither diagonal nor a permutation (in our gate set, only H)
+    splits it into two. The amplitude is the sum over all ``2^h`` paths that end in *x* of the product of the matrix
+    entries along the path, where *h* is the number of branching gates.
+
+    Only the bits of a batch of paths are held at a time, so the memory does not depend on 2^n but the time grows
+    with 2^h. The paths are split into ranges that are summed in parallel by a pool of processes.
+    """
+
+    # number of paths that are followed together as one vectorised batch
+    BATCH_SIZE = 2 ** 14
+    # below this many paths the sum is done in the calling process, as starting the pool would take longer
+    PARALLEL_MIN_PATHS = 2 ** 16
+
+    def __init__(self, num_qubits: int, gates: list[GateInstruction]) -> None:
+        """
+        :param num_qubits:    number of qubits of the circuit
+        :param gates:         the gates of the circuit as lowered from its definition (before fusion)
+        """
+        self.num_qubits = num_qubits
+        # every step is (kind, qubits, 2x2 matrix of the single-qubit gate or of the target of a controlled gate)
+        self.steps: list[tuple[str, tuple[int, ...], np.ndarray | None]] = []
+        for gate in gates:
+            if isinstance(gate, SingleQubitInstruction):
+                self.steps.append((_classify(gate.matrix), gate.qubits, gate.matrix))
+            elif isinstance(gate, MultiQubitInstruction) and gate.target_gate is None:
+                self.steps.append((SWAP, gate.qubits, None))
+            elif isinstance(gate, MultiQubitInstruction) and _classify(gate.target_gate) != BRANCH:
+                self.steps.append((_classify(gate.target_gate), gate.qubits, gate.target_gate))
+            else:
+                raise ValueError(f"Gate {gate} cannot be followed by a path sum")
+
+    @property
+    def num_branches(self) -> int:
+        """The number of gates at which the paths branch"""
+        return sum(1 for kind, _, _ in self.steps if kind == BRANCH)
+
+    def amplitude(self, start: int, output: int, workers: int | None = None) -> complex:
+        """
+        :param start:      index of the computational basis state *y* at the start (qubit 0 is the most significant bit)
+        :param output:     index of the computational basis state *x* at the end
+        :param workers:    number of processes to sum the paths with, defaults to the number of CPUs
+        """
+        return complex(parallel_sum(_sum_paths, (self.steps, self.num_qubits, start, output), 2 ** self.num_branches,
+                                    workers, PathSum.PARALLEL_MIN_PATHS))
+
+
+def _sum_paths(steps: list[tuple[str, tuple[int, ...], np.ndarray | None]],
+               num_qubits: int,
+               start: int,
+               output: int,
+               first: int,
+               last: int) -> complex:
+    """
+    The sum over the paths *first* to *last* (exclusive) of :class:`PathSum`, where bit *k* of the number
+    of a path is the value it takes at the *k*-th branching gate
+    """
+    # the indices of wide circuits do not fit in a numpy integer
+    start_bits = np.array([(start >> (num_qubits - 1 - qubit)) & 1 for qubit in range(num_qubits)], dtype=bool)
+    output_bits = np.array([(output >> (num_qubits - 1 - qubit)) & 1 for qubit in range(num_qubits)], dtype=bool)
+
+    total = 0j
+    for batch_start in range(first, last, PathSum.BATCH_SIZE):
+        paths = np.arange(batch_start, min(batch_start + PathSum.BATCH_SIZE, last), dtype=np.int64)
+        bits = np.tile(start_bits, (len(paths), 1))
+        amplitudes = np.ones(len(paths), dtype=complex)
+        branch = 0
+        for kind, qubits, matrix in steps:
+            if kind == SWAP:
+                bits[:, list(qubits)] = bits[:, list(reversed(qubits))]
+                continue
+
+            qubit = qubits[-1]
+            old = bits[:, qubit]
+            if kind == DIAGONAL:
+                factors, new = np.diagonal(matrix)[old.astype(np.int64)], old
+            elif kind == ANTI_DIAGONAL:
+                new = ~old
+                factors = matrix[new.astype(np.int64), old.astype(np.int64)]
+            else:
+                new = ((paths >> branch) & 1).astype(bool)
+                factors = matrix[new.astype(np.int64), old.astype(np.int64)]
+                branch += 1
+
+            if len(qubits) == 2:
+                # a controlled gate only acts on the paths where the control is 1
+                control = bits[:, qubits[0]]
+                factors = np.where(control, factors, 1)
+                new = np.where(control, new, old)
+            amplitudes *= factors
+            bits[:, qubit] = new
+
+        total += amplitudes[np.all(bits == output_bits, axis=1)].sum()
+    return complex(total)
@@ -0,0 +1,377 @@
+import numpy as np
+
+from base import sparse
+from base.compute import QuantumComputer, SimulationBackend
+from base.fusion import accumulate_diagonal_gates, fuse_gates
+from base.kernels import GateInstruction, MultiQubitInstruction, PhaseInstruction
+from base.models import CircuitDefinition
+from base.reversible import ReversibleCircuit
+
+
+def _count_phase_vectors(gates: list[GateInstruction], num_qubits: int) -> int:
+    """The number of phase vectors that *gates* are compiled into, fused as by default"""
+    return sum(
+        1 for gate in accumulate_diagonal_gates(fuse_gates(gates).gates, num_qubits) if isinstance(gate, PhaseInstruction)
+    )
+
+
+class CircuitProfile:
+    """
+    What the cost of simulating a circuit depends on: its qubit count, depth and gate mix. Everything here is read
+    from the lowered gates of the circuit, without allocating anything that grows with 2^n.
+    """
+
+    def __init__(self, circuit: CircuitDefinition) -> None:
+        columns = QuantumComputer.lower_circuit(circuit)
+        gates = [gate for column in columns for gate in column]
+
+        self.num_qubits: int = circuit.num_qubits
+        # the number of time steps before the measure step
+        self.depth: int = len(columns)
+        self.num_gates: int = len(gates)
+        self.num_two_qubit_gates: int = sum(1 for gate in gates if len(gate.qubits) == 2)
+        # the gates on neighbouring qubits that a matrix product state applies for them, with a SWAP gate before
+        # and after for every qubit in between
+        self.num_neighbouring_gates: int = sum(
+            2 * abs(gate.qubits[0] - gate.qubits[1]) - 1 for gate in gates if len(gate.qubits) == 2
+        )
+        self.is_reversible: bool = ReversibleCircuit.is_reversible(gates)
+        self.is_real: bool = all(gate.is_real for gate in gates)
+        # the phase vectors of 2^n amplitudes that the dense kernels keep when the whole circuit is compiled at once,
+        # and when it is compiled one time step at a time (they are only built when first applied, so this only
+        # counts them)
+        self.num_phase_vectors: int = _count_phase_vectors(gates, circuit.num_qubits)
+        self.num_column_phase_vectors: int = sum(
+            _count_phase_vectors(column, circuit.num_qubits) for column in columns
+        )
+        self._gates = gates
+
+    def bond_dimensions(self, max_bond_dimension: int | None = None) -> tuple[list[int], list[int]]:
+        """
+        Upper bounds on the bond dimensions of a matrix product state of the circuit: a two-qubit gate multiplies
+        the bonds it crosses by at most its Schmidt rank (2 for a controlled gate, 4 for SWAP), and no bond can be
+        larger than the smaller side of its cut or *max_bond_dimension*.
+
+        :return:    the bound at every cut between neighbouring qubits at the end of the circuit, and the bound on
+                    the bond that every two-qubit gate is applied across, in the order of the gates
+        """
+        # the bonds as powers of two, the cut after qubit k having k + 1 qubits on one side and n - k - 1 on the other
+        exponents = [0] * (self.num_qubits - 1)
+        largest = [min(cut + 1, self.num_qubits - cut - 1) for cut in range(self.num_qubits - 1)]
+
+        def bond(exponent: int) -> int:
+            return min(2 ** exponent, max_bond_dimension) if max_bond_dimension is not None else 2 ** exponent
+
+        gate_bonds = []
+        for gate in self._gates:
+            if len(gate.qubits) != 2:
+                continue
+            rank_exponent = 2 if isinstance(gate, MultiQubitInstruction) and gate.target_gate is None else 1
+            cuts = range(min(gate.qubits), max(gate.qubits))
+            for cut in cuts:
+                exponents[cut] = min(exponents[cut] + rank_exponent, largest[cut])
+            gate_bonds.append(bond(max(exponents[cut] for cut in cuts)))
+        return [bond(exponent) for exponent in exponents], gate_bonds
+
+
+class ResourceEstimate:
+    """The predicted peak memory and runtime of :func:`base.compute.QuantumComputer.compute` on one backend"""
+
+    def __init__(self,
+                 backend: SimulationBackend,
+                 precision: str,
+                 peak_bytes: int | None,
+                 seconds: float | None,
+                 reason: str | None = None) -> None:
+        """
+        :param backend:       the simulation backend
+        :param precision:     the precision of the state (see :attr:`base.compute.QuantumComputer.PRECISIONS`)
+        :param peak_bytes:    the predicted peak memory, or ``None`` if the backend cannot run the circuit
+        :param seconds:       the predicted runtime, or ``None`` if the backend cannot run the circuit
+        :param reason:        why the backend cannot run the circuit, ``None`` if it can
+        """
+        self.backend = backend
+        self.precision = precision
+        self.peak_bytes = peak_bytes
+        self.seconds = seconds
+        self.reason = reason
+
+    @property
+    def supported(self) -> bool:
+        return self.reason is None
+
+    def fits(self, max_bytes: int, max_seconds: float) -> bool:
+        return self.supported and self.peak_bytes <= max_bytes and self.seconds <= max_seconds
+
+    def __str__(self) -> str:
+        name = f"{self.backend.name.lower().replace('_', '-')} ({self.precision})"
+        if not self.supported:
+            return f"{name}: {self.reason}"
+        return f"{name}: {format_bytes(self.peak_bytes)}, {format_seconds(self.seconds)}"
+
+
+class ExecutionPlan:
+    """The estimates for a run, and the backend and precision it should use within the budget, if any"""
+
+    def __init__(self,
+                 requested: ResourceEstimate,
+                 chosen: ResourceEstimate | None,
+                 estimates: list[ResourceEstimate],
+                 max_bytes: int,
+                 max_seconds: float,
+                 requested_prefix_states: bool = False) -> None:
+        self.requested = requested
+        self.chosen = chosen
+        self.estimates = estimates
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.requested_prefix_states = requested_prefix_states
+
+    @property
+    def allowed(self) -> bool:
+        return self.chosen is not None
+
+    @property
+    def downgraded(self) -> bool:
+        return self.chosen is not None and self.chosen is not self.requested
+
+    @property
+    def backend(self) -> SimulationBackend | None:
+        return self.chosen.backend if self.chosen is not None else None
+
+    @property
+    def precision(self) -> str | None:
+        return self.chosen.precision if self.chosen is not None else None
+
+    @property
+    def track_prefix_states(self) -> bool:
+        """Whether the run keeps its intermediate states; a downgraded run never does, see :func:`ExecutionPlanner.plan`"""
+        return self.requested_prefix_states and self.allowed and not self.downgraded
+
+    @property
+    def message(self) -> str:
+        budget = f"{format_bytes(self.max_bytes)} and {format_seconds(self.max_seconds)}"
+        problem = f"the {self.requested}" if not self.requested.supported else \
+            f"estimated {self.requested}, which exceeds the budget of {budget}"
+        if not self.allowed:
+            return f"Refused to simulate: {problem}"
+        if self.downgraded:
+            without = " without keeping intermediate states" if self.requested_prefix_states else ""
+            return f"Simulating on {self.chosen}{without} instead: {problem}"
+        return f"Estimated {self.chosen}"
+
+
+class ExecutionPlanner:
+    """
+    Predicts the peak memory and runtime of simulating a circuit on every backend from its :class:`CircuitProfile`,
+    before anything is allocated, and refuses runs that exceed a budget or downgrades them to a backend or precision
+    that fits it. The estimates are for :func:`base.compute.QuantumComputer.compute` on a computational basis state,
+    so they include the 2^n amplitudes of the result; backends that only compute measurement probabilities and samples
+    (STABILIZER and NEAR_CLIFFORD) are listed as unsupported.
+
+    Backends whose cost depends on the structure of the state rather than on the circuit alone are estimated for the
+    worst case: SPARSE_STATE as if the state became dense, DECISION_DIAGRAM with 2^n nodes, and MPS with the largest
+    bonds the two-qubit gates of the circuit allow (see :func:`CircuitProfile.bond_dimensions`).
+    """
+
+    DEFAULT_MAX_BYTES = 4 * 1024 ** 3
+    DEFAULT_MAX_SECONDS = 120.0
+
+    # Amplitude updates per second of the dense kernels (in units of :func:`QuantumComputer.dense_cost`), measured on
+    # random circuits of 16 to 22 qubits: double precision runs at 4.2e8 on 16 qubits down to 2.4e8 on 22, where the
+    # state no longer fits in the caches, and single precision at 1.6 to 2.5 times that
+    DENSE_UPDATES_PER_SECOND = {"double": 2.4e8, "single": 3.9e8}
+    # Peak memory of the dense kernels in copies of the state, on top of the phase vectors (which are built in the
+    # dtype of the state): measured with tracemalloc at 3.5 copies with phase accumulation disabled, on 14 to 20 qubits
+    DENSE_STATE_COPIES = 3.5
+    # The SPARSE backend keeps a CSR operator of up to 8 non-zeros per row for every time step: measured at 47 to 80
+    # bytes per amplitude and time step, and 14 times the runtime of the dense kernels, on 12 to 18 qubits
+    SPARSE_BYTES_PER_AMPLITUDE_AND_STEP = 96
+    SPARSE_SLOWDOWN = 14
+    # A decision diagram of a state without repeated structure has up to 2^n nodes, and every gate visits each of them
+    # and adds entries to the compute tables: measured at 4e-6 s and 80 bytes per node and gate on random circuits
+    # of 10 to 12 qubits, whose diagrams have the most nodes for their size
+    DECISION_DIAGRAM_SECONDS_PER_NODE = 4e-6
+    DECISION_DIAGRAM_BYTES_PER_NODE = 80
+    # multiply-adds per second of the SVDs of the MPS backend (reached on 12 qubits, where the bonds do grow as large
+    # as the gates allow), and the copies of the tensors of a bond that it keeps during one (the contracted pair,
+    # its factors and the new tensors)
+    MPS_OPERATIONS_PER_SECOND = 2e9
+    MPS_TENSOR_COPIES = 4
+    # bytes per amplitude of a complex128 state vector, as returned by the MPS and decision diagram backends
+    COMPLEX_BYTES = 16
+    # bytes per non-zero amplitude of a sparse state: the complex128 amplitude and its int64 index
+    SPARSE_STATE_ENTRY_BYTES = 24
+
+    def __init__(self,
+                 max_bytes: int = DEFAULT_MAX_BYTES,
+                 max_seconds: float = DEFAULT_MAX_SECONDS,
+                 allow_downgrade: bool = True) -> None:
+        """
+        :param max_bytes:          the largest predicted peak memory a run may need
+        :param max_seconds:        the largest predicted runtime a run may take
+        :param allow_downgrade:    whether a run that exceeds the budget may use another backend or single precision
+                                   instead (see :func:`plan`); if not, it is refused
+        """
+        if max_bytes <= 0 or max_seconds <= 0:
+            raise ValueError(f"The budget must be positive, but got {max_bytes} bytes and {max_seconds} seconds")
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.allow_downgrade = allow_downgrade
+
+    def estimate(self,
+                 circuit: CircuitDefinition | CircuitProfile,
+                 backend: SimulationBackend = SimulationBackend.AUTO,
+                 precision: str = "double",
+                 track_prefix_states: bool = False,
+                 max_bond_dimension: int | None = None) -> ResourceEstimate:
+        """
+        Predict the peak memory and runtime of :func:`base.compute.QuantumComputer.compute` on a computational basis
+        state, for a computer created with these options.
+
+        :param circuit:                the circuit, or its profile when estimating more than one backend
+        :param backend:                the simulation backend
+        :param precision:              ``"double"`` or ``"single"``
+        :param track_prefix_states:    whether the computer keeps its intermediate states between runs
+        :param max_bond_dimension:     upper bound on the bond dimension of the MPS backend
+        """
+        profile = circuit if isinstance(circuit, CircuitProfile) else CircuitProfile(circuit)
+        if precision not in QuantumComputer.PRECISIONS:
+            raise ValueError(f"Unknown precision '{precision}', expected one of {', '.join(QuantumComputer.PRECISIONS)}")
+        if precision != "double" and backend not in (SimulationBackend.AUTO, SimulationBackend.DENSE):
+            return ResourceEstimate(backend, precision, None, None, "only supports double precision")
+        if backend in (SimulationBackend.STABILIZER, SimulationBackend.NEAR_CLIFFORD):
+            return ResourceEstimate(backend, precision, None, None, "only computes measurement probabilities and samples")
+        if backend == SimulationBackend.SPARSE and not sparse.is_available():
+            return ResourceEstimate(backend, precision, None, None, "requires scipy to be installed")
+
+        amplitudes = 2 ** profile.num_qubits
+        vector_bytes = amplitudes * ExecutionPlanner.COMPLEX_BYTES
+        real_dtype = np.dtype(QuantumComputer.PRECISIONS[precision])
+        state_bytes = amplitudes * real_dtype.itemsize * (1 if profile.is_real else 2)
+        # a phase vector has the dtype of the state, as both are real only if the whole circuit is
+        phase_bytes = state_bytes
+        dense_bytes = int(ExecutionPlanner.DENSE_STATE_COPIES * state_bytes) + profile.num_phase_vectors * phase_bytes
+        dense_seconds = QuantumComputer.dense_cost(profile.num_qubits, profile.num_gates) \
+            / ExecutionPlanner.DENSE_UPDATES_PER_SECOND[precision]
+
+        if backend == SimulationBackend.AUTO and profile.is_reversible:
+            # the circuit runs as bit operations on the index of the input (see :class:`base.reversible.BasisState`),
+            # so only the result is allocated
+            return ResourceEstimate(backend, precision, state_bytes, amplitudes / ExecutionPlanner.DENSE_UPDATES_PER_SECOND[precision])
+        # the computer only keeps its intermediate states on the backends that simulate the state vector directly
+        track_prefix_states = track_prefix_states and backend in (SimulationBackend.AUTO, SimulationBackend.DENSE)
+        if track_prefix_states or backend == SimulationBackend.SPARSE_STATE:
+            # the circuit is compiled a chunk of time steps at a time (one time step at a time for the SPARSE_STATE
+            # backend), and the phase vectors of earlier chunks are only kept by the step cache
+            column_phase_bytes = min(profile.num_column_phase_vectors * phase_bytes, QuantumComputer.STEP_CACHE.max_bytes)
+            dense_bytes = int(ExecutionPlanner.DENSE_STATE_COPIES * state_bytes) + column_phase_bytes \
+                + (phase_bytes if profile.num_column_phase_vectors else 0)
+        if track_prefix_states:
+            # a checkpoint of the state after every chunk, and a copy of the result
+            dense_bytes += min(QuantumComputer.PREFIX_STATES_MAX_BYTES, profile.depth * state_bytes) + state_bytes
+        elif backend == SimulationBackend.AUTO and profile.num_qubits <= QuantumComputer.UNITARY_CACHE_MAX_QUBITS:
+            # a circuit that is run more than once is simulated once for all inputs
+            dense_bytes += amplitudes * vector_bytes
+        if backend in (SimulationBackend.AUTO, SimulationBackend.DENSE):
+            return ResourceEstimate(backend, precision, dense_bytes, dense_seconds)
+        if backend == SimulationBackend.SPARSE_STATE:
+            # at worst the state becomes dense right after reaching the fill ratio
+            sparse_bytes = int(QuantumComputer.SPARSE_STATE_FILL_RATIO * amplitudes * ExecutionPlanner.SPARSE_STATE_ENTRY_BYTES)
+            return ResourceEstimate(backend, precision, dense_bytes + sparse_bytes, dense_seconds)
+        if backend == SimulationBackend.SPARSE:
+            operator_bytes = amplitudes * max(1, profile.depth) * ExecutionPlanner.SPARSE_BYTES_PER_AMPLITUDE_AND_STEP
+            return ResourceEstimate(backend, precision, 2 * state_bytes + operator_bytes,
+                                    ExecutionPlanner.SPARSE_SLOWDOWN * dense_seconds)
+        if backend == SimulationBackend.DECISION_DIAGRAM:
+            node_gates = amplitudes * max(1, profile.num_gates)
+            return ResourceEstimate(backend, precision,
+                                    node_gates * ExecutionPlanner.DECISION_DIAGRAM_BYTES_PER_NODE + vector_bytes,
+                                    node_gates * ExecutionPlanner.DECISION_DIAGRAM_SECONDS_PER_NODE)
+        if backend == SimulationBackend.MPS:
+            return self._estimate_mps(profile, precision, max_bond_dimension)
+        raise ValueError(f"Unknown backend {backend}")
+
+    def estimates(self,
+                  circuit: CircuitDefinition | CircuitProfile,
+                  track_prefix_states: bool = False,
+                  max_bond_dimension: int | None = None) -> list[ResourceEstimate]:
+        """:func:`estimate` for every backend, in double precision and, where supported, in single precision"""
+        profile = circuit if isinstance(circuit, CircuitProfile) else CircuitProfile(circuit)
+        return [
+            self.estimate(profile, backend, precision, track_prefix_states, max_bond_dimension)
+            for backend in SimulationBackend
+            for precision in QuantumComputer.PRECISIONS
+            if precision == "double" or backend in (SimulationBackend.AUTO, SimulationBackend.DENSE)
+        ]
+
+    def plan(self,
+             circuit: CircuitDefinition,
+             backend: SimulationBackend = SimulationBackend.AUTO,
+             precision: str = "double",
+             track_prefix_states: bool = False,
+             max_bond_dimension: int | None = None) -> ExecutionPlan:
+        """
+        Decide how to run :func:`base.compute.QuantumComputer.compute` within the budget. A run that fits it keeps
+        its backend and precision. Otherwise, if downgrades are allowed, the run is tried without keeping its
+        intermediate states (which are what a run close to the budget can least afford), first on the same backend
+        and precision, then on the same backend in the other precision, which keeps the result closest to what was
+        asked for, and then on the fastest other backend that fits; if none does, the run is refused.
+
+        :param circuit:     the circuit to run, with the options of the computer as for :func:`estimate`
+        :param backend:     the requested backend
+        :param precision:   the requested precision
+        :return:            the plan, whose :attr:`ExecutionPlan.message` describes the estimate to the user
+        """
+        profile = CircuitProfile(circuit)
+        estimates = self.estimates(profile, track_prefix_states, max_bond_dimension)
+        requested = next(
+            (estimate for estimate in estimates if estimate.backend == backend and estimate.precision == precision),
+            None
+        ) or self.estimate(profile, backend, precision, track_prefix_states, max_bond_dimension)
+
+        if requested.fits(self.max_bytes, self.max_seconds):
+            chosen = requested
+        elif not self.allow_downgrade:
+            chosen = None
+        else:
+            if track_prefix_states:
+                estimates = self.estimates(profile, False, max_bond_dimension)
+            candidates = [estimate for estimate in estimates if estimate.fits(self.max_bytes, self.max_seconds)]
+            same_backend = [estimate for estimate in candidates if estimate.backend == backend]
+            same_precision = [estimate for estimate in same_backend if estimate.precision == precision]
+            chosen = min(same_precision or same_backend or candidates, key=lambda estimate: estimate.seconds, default=None)
+        return ExecutionPlan(requested, chosen, estimates, self.max_bytes, self.max_seconds, track_prefix_states)
+
+    @staticmethod
+    def _estimate_mps(profile: CircuitProfile, precision: str, max_bond_dimension: int | None) -> ResourceEstimate:
+        bonds, gate_bonds = profile.bond_dimensions(max_bond_dimension)
+        bonds = [1] + bonds + [1]
+        # one tensor of shape (left bond, 2, right bond) per qubit
+        tensor_sizes = [2 * left * right for left, right in zip(bonds, bonds[1:])]
+        largest_pair = max((a + b for a, b in zip(tensor_sizes, tensor_sizes[1:])), default=tensor_sizes[0])
+        peak_bytes = (sum(tensor_sizes) + ExecutionPlanner.MPS_TENSOR_COPIES * largest_pair + 2 ** profile.num_qubits) \
+            * ExecutionPlanner.COMPLEX_BYTES
+
+        # every gate on neighbouring qubits is an SVD of a (2 bond) x (2 bond) matrix, and a gate on qubits that are
+        # not neighbours needs a SWAP gate for every qubit in between, before and after it
+        operations = sum(8 * bond ** 3 for bond in gate_bonds) * profile.num_neighbouring_gates / max(1, profile.num_two_qubit_gates)
+        seconds = (operations + 2 ** profile.num_qubits) / ExecutionPlanner.MPS_OPERATIONS_PER_SECOND
+        return ResourceEstimate(SimulationBackend.MPS, precision, peak_bytes, seconds)
+
+
+def format_bytes(num_bytes: int) -> str:
+    for unit in ["B", "KiB", "MiB", "GiB", "TiB"]:
+        if num_bytes < 1024 or unit == "TiB":
+            return f"{num_bytes:.0f} {unit}" if unit == "B" else f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
+
+
+def format_seconds(seconds: float) -> str:
+    if seconds < 1:
+        return "under a second"
+    if seconds < 120:
+        return f"about {seconds:.0f} s"
+    if seconds < 2 * 3600:
+        return f"about {seconds / 60:.0f} min"
+    return f"about {seconds / 3600:.0f} h"
@@ -0,0 +1,175 @@
+import numpy as np
+
+from base.kernels import GateInstruction, MultiQubitInstruction, SingleQubitInstruction, complex_dtype
+
+
+# phases are kept as whole multiples of an eighth of a turn, e^(i pi k / 4), which covers every gate we have
+PHASE_STEPS = 8
+# e^(i pi k / 4) for every step k, exact where the phase is real or imaginary (e^(i pi) is -1, not -1 + 1.2e-16j)
+PHASES = np.array([1, (1 + 1j) / np.sqrt(2), 1j, (-1 + 1j) / np.sqrt(2), -1, (-1 - 1j) / np.sqrt(2), -1j, (1 - 1j) / np.sqrt(2)])
+
+
+def _phase_step(value: complex) -> int | None:
+    """The *k* with ``value = e^(i pi k / 4)``, or ``None`` if *value* is not such a phase"""
+    if not np.isclose(abs(value), 1):
+        return None
+    step = np.angle(value) / (2 * np.pi / PHASE_STEPS)
+    if not np.isclose(step, round(step)):
+        return None
+    return int(round(step)) % PHASE_STEPS
+
+
+def _classify(matrix: np.ndarray) -> tuple[bool, tuple[int, int]] | None:
+    """
+    Whether the 2x2 *matrix* flips the bit it acts on (X, Y) or not (Z, S, T, T_dg), and the phase steps it adds
+    to an input bit of 0 and of 1; ``None`` if it sends a basis state into a superposition (like H)
+    """
+    if not matrix[0, 1] and not matrix[1, 0]:
+        flip, phases = False, (_phase_step(matrix[0, 0]), _phase_step(matrix[1, 1]))
+    elif not matrix[0, 0] and not matrix[1, 1]:
+        flip, phases = True, (_phase_step(matrix[1, 0]), _phase_step(matrix[0, 1]))
+    else:
+        return None
+    if None in phases:
+        return None
+    return flip, phases
+
+
+# a gate as (shifts of the bits of its qubits in the index, whether it flips the target, phase steps for a target
+# bit of 0 and of 1), with ``None`` instead of the flip for SWAP
+Step = tuple[tuple[int, ...], bool | None, tuple[int, int]]
+
+
+def reversible_step(num_qubits: int, gate: GateInstruction) -> Step | None:
+    """*gate* as a step on basis state indices, or ``None`` if it puts basis states into superposition"""
+    shifts = tuple(num_qubits - 1 - qubit for qubit in gate.qubits)
+    if isinstance(gate, SingleQubitInstruction):
+        classified = _classify(gate.matrix)
+    elif isinstance(gate, MultiQubitInstruction):
+        if gate.target_gate is None:
+            return shifts, None, (0, 0)
+        classified = _classify(gate.target_gate)
+    else:
+        return None
+    return (shifts, *classified) if classified is not None else None
+
+
+def apply_step(step: Step, index: int) -> tuple[int, int]:
+    """The index that the basis state *index* is mapped to by *step*, and the phase step it gets"""
+    shifts, flip, (phase_0, phase_1) = step
+    if flip is None:
+        a, b = shifts
+        differ = ((index >> a) ^ (index >> b)) & 1
+        return index ^ ((differ << a) | (differ << b)), 0
+
+    target = shifts[-1]
+    if len(shifts) == 2 and not (index >> shifts[0]) & 1:
+        return index, 0
+    phase = phase_1 if (index >> target) & 1 else phase_0
+    return (index ^ (1 << target) if flip else index), phase
+
+
+class ReversibleCircuit:
+    """
+    A circuit that maps every computational basis state to a single basis state times a phase: the classical reversible
+    gates X, CNOT and SWAP permute the basis states, and Y, Z, S, T, T_dg, CZ and CS add a phase on top of that.
+    Such a circuit is evaluated with integer bit operations on the basis index instead of on complex amplitudes,
+    for a whole array of inputs at once.
+    """
+
+    # :func:`evaluate` keeps the indices in 64-bit integers, so wider circuits need :func:`evaluate_index`
+    MAX_VECTORIZED_QUBITS = 62
+
+    def __init__(self, num_qubits: int, gates: list[GateInstruction]) -> None:
+        """
+        :param num_qubits:    number of qubits of the circuit
+        :param gates:         the gates of the circuit as lowered from its definition (before fusion)
+        """
+        self.num_qubits = num_qubits
+        self.steps: list[Step] = []
+        for gate in gates:
+            step = reversible_step(num_qubits, gate)
+            if step is None:
+                raise ValueError(f"Gate {gate} does not map basis states to basis states")
+            self.steps.append(step)
+
+    @staticmethod
+    def is_reversible(gates: list[GateInstruction]) -> bool:
+        """Whether every gate maps basis states to basis states (see :class:`ReversibleCircuit`)"""
+        return all(reversible_step(1 + max(gate.qubits), gate) is not None for gate in gates)
+
+    def evaluate(self, inputs: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Run the circuit on many basis states at once.
+
+        :param inputs:    indices of the input basis states (qubit 0 is the most significant bit), as an integer array
+        :return:          the index of the output basis state for every input, and the phase step *k* of its
+                          amplitude ``e^(i pi k / 4)``
+        """
+        if self.num_qubits > ReversibleCircuit.MAX_VECTORIZED_QUBITS:
+            raise ValueError(f"Indices of {self.num_qubits} qubits do not fit in a numpy integer, use evaluate_index() instead")
+
+        states = np.array(inputs, dtype=np.int64)
+        phases = np.zeros(states.shape, dtype=np.int64)
+        for shifts, flip, (phase_0, phase_1) in self.steps:
+            if flip is None:
+                a, b = shifts
+                differ = ((states >> a) ^ (states >> b)) & 1
+                states ^= (differ << a) | (differ << b)
+                continue
+
+            target = shifts[-1]
+            bits = (states >> target) & 1
+            # a controlled gate only acts where its control is 1
+            active = (states >> shifts[0]) & 1 if len(shifts) == 2 else np.ones_like(states)
+            phases += active * np.where(bits == 1, phase_1, phase_0)
+            if flip:
+                states ^= active << target
+        return states, phases % PHASE_STEPS
+
+    def evaluate_index(self, index: int) -> tuple[int, int]:
+        """:func:`evaluate` for a single input, with Python integers so that it works for any number of qubits"""
+        phase = 0
+        for step in self.steps:
+            index, step_phase = apply_step(step, index)
+            phase += step_phase
+        return index, phase % PHASE_STEPS
+
+    def truth_table(self) -> tuple[np.ndarray, np.ndarray]:
+        """The output and phase step of every one of the 2^n inputs, in the order of the input index"""
+        return self.evaluate(np.arange(2 ** self.num_qubits, dtype=np.int64))
+
+    @staticmethod
+    def phase(steps: np.ndarray | int) -> np.ndarray | complex:
+        """The amplitudes ``e^(i pi k / 4)`` of phase steps *k*"""
+        return PHASES[steps]
+
+
+class BasisState:
+    """
+    A state that is a single computational basis state times an amplitude, for as long as only gates that map
+    basis states to basis states are applied (see :class:`ReversibleCircuit`). This takes no memory beyond
+    the index, so the amplitudes of all 2^n basis states are only needed from the first gate that branches (like H).
+    """
+
+    def __init__(self, num_qubits: int, index: int, amplitude: complex = 1) -> None:
+        self.num_qubits = num_qubits
+        self.index = index
+        self.amplitude = amplitude
+
+    def apply(self, gate: GateInstruction) -> bool:
+        """Apply *gate* if it keeps the state a basis state; ``False`` (and the state unchanged) if it does not"""
+        step = reversible_step(self.num_qubits, gate)
+        if step is None:
+            return False
+        self.index, phase = apply_step(step, self.index)
+        if phase:
+            self.amplitude *= ReversibleCircuit.phase(phase)
+        return True
+
+    def to_state_vector(self, real_dtype: type = np.float64) -> np.ndarray:
+        """The state as a state vector of length 2^n, of *real_dtype* if the amplitude is real"""
+        amplitude = complex(self.amplitude)
+        state = np.zeros(2 ** self.num_qubits, dtype=complex_dtype(real_dtype) if amplitude.imag else real_dtype)
+        state[self.index] = amplitude if amplitude.imag else amplitude.real
+        return state
@@ -0,0 +1,101 @@
+import numpy as np
+
+try:
+    from scipy import sparse
+except ImportError:
+    # scipy is only needed for the sparse backend
+    sparse = None
+
+from base.cache import LRUCache
+from base.kernels import GateInstruction, MatrixInstruction, PhaseInstruction
+
+
+# a step operator is a product of gates; stop multiplying in more gates once a row of the product
+# would hold more than this many non-zeros, as the operator would be getting too dense to be worth it
+MAX_NON_ZEROS_PER_ROW = 8
+
+
+def is_available() -> bool:
+    return sparse is not None
+
+
+def gate_operator(gate: GateInstruction, num_qubits: int):
+    """
+    Build the CSR operator of *gate* acting on the full state vector of *num_qubits* qubits.
+
+    The operator is built directly from the index arithmetic of the gate's qubits, so a CNOT or SWAP step is a
+    permutation with exactly one non-zero per row and a diagonal gate is a diagonal matrix.
+    """
+    dimension = 2 ** num_qubits
+    if isinstance(gate, PhaseInstruction):
+        return sparse.diags(gate.phases.reshape(-1), format="csr")
+
+    matrix = gate.matrix
+    columns = np.arange(dimension)
+    # qubit 0 is the most significant bit of a basis state index
+    bits = [num_qubits - 1 - qubit for qubit in gate.qubits]
+    qubits_mask = sum(1 << bit for bit in bits)
+
+    local_columns = np.zeros(dimension, dtype=np.int64)
+    for bit in bits:
+        local_columns = (local_columns << 1) | ((columns >> bit) & 1)
+
+    rows, cols, data = [], [], []
+    for local_row in range(matrix.shape[0]):
+        values = matrix[local_row, local_columns]
+        non_zero = values != 0
+        row_bits = sum(((local_row >> (len(bits) - 1 - i)) & 1) << bit for i, bit in enumerate(bits))
+        rows.append(((columns & ~qubits_mask) | row_bits)[non_zero])
+        cols.append(columns[non_zero])
+        data.append(values[non_zero])
+
+    return sparse.csr_matrix(
+        (np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))),
+        shape=(dimension, dimension),
+        dtype=complex
+    )
+
+
+def step_operators(gates: list[GateInstruction], num_qubits: int, cache: LRUCache | None = None) -> list:
+    """
+    Multiply consecutive *gates* together into CSR step operators, each with at most
+    :data:`MAX_NON_ZEROS_PER_ROW` non-zeros per row.
+
+    Step operators are shared through *cache* (keyed by the number of qubits and the signatures of their gates)
+    when one is given.
+    """
+    groups: list[list[GateInstruction]] = []
+    group_non_zeros = 0
+    for gate in gates:
+        non_zeros = _non_zeros_per_row(gate)
+        if not groups or group_non_zeros * non_zeros > MAX_NON_ZEROS_PER_ROW:
+            groups.append([])
+            group_non_zeros = 1
+        groups[-1].append(gate)
+        group_non_zeros *= non_zeros
+
+    return [_group_operator(group, num_qubits, cache) for group in groups]
+
+
+def _group_operator(gates: list[GateInstruction], num_qubits: int, cache: LRUCache | None):
+    key = (num_qubits, "csr", tuple(gate.signature for gate in gates))
+    if cache is not None:
+        operator = cache.get(key)
+        if operator is not None:
+            return operator
+
+    operator = gate_operator(gates[0], num_qubits)
+    for gate in gates[1:]:
+        operator = gate_operator(gate, num_qubits) @ operator
+    operator = operator.tocsr()
+
+    if cache is not None:
+        cache.put(key, operator, operator.data.nbytes + operator.indices.nbytes + operator.indptr.nbytes)
+    return operator
+
+
+def _non_zeros_per_row(gate: GateInstruction) -> int:
+    if not isinstance(gate, MatrixInstruction):
+        # phase vectors are diagonal
+        return 1
+    return int(np.max(np.count_nonzero(gate.matrix, axis=1)))
@@ -0,0 +1,136 @@
+import numpy as np
+
+from base.kernels import GateInstruction, MatrixInstruction, complex_dtype
+from base.reversible import ReversibleCircuit, reversible_step
+
+
+class SparseState:
+    """
+    A state vector that only stores its non-zero amplitudes, as an ascending array of basis state indices
+    (qubit 0 is the most significant bit) and the matching array of amplitudes. Oracle and arithmetic circuits often
+    keep only a few basis states occupied, even on many qubits, and then every gate costs O(k log k)
+    for k non-zero amplitudes instead of O(2^n).
+
+    Amplitudes whose probability drops to *prune_threshold* or below are removed after every gate; their total
+    probability is reported by :attr:`discarded_weight`. Amplitudes that cancel to a rounding error are always removed.
+    """
+
+    # amplitudes this small are what is left of an exact cancellation, like H H, and are removed even without pruning
+    ROUNDING_ERROR = 1e-14
+
+    def __init__(self, num_qubits: int, indices: np.ndarray, amplitudes: np.ndarray, prune_threshold: float = 0.0) -> None:
+        """
+        :param num_qubits:         number of qubits of the state
+        :param indices:            the ascending indices of the non-zero amplitudes
+        :param amplitudes:         the amplitudes at those indices
+        :param prune_threshold:    largest probability of an amplitude that is dropped after a gate
+        """
+        if num_qubits > ReversibleCircuit.MAX_VECTORIZED_QUBITS:
+            raise ValueError(f"Indices of {num_qubits} qubits do not fit in a numpy integer")
+        self.num_qubits = num_qubits
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.amplitudes = np.asarray(amplitudes, dtype=complex)
+        self.prune_threshold = prune_threshold
+        self.discarded_weight = 0.0
+
+    @staticmethod
+    def from_basis_state(num_qubits: int, index: int, amplitude: complex = 1, prune_threshold: float = 0.0) -> 'SparseState':
+        return SparseState(num_qubits, np.array([index]), np.array([amplitude]), prune_threshold)
+
+    @staticmethod
+    def from_state_vector(state: np.ndarray, prune_threshold: float = 0.0) -> 'SparseState':
+        state = np.asarray(state, dtype=complex).reshape(-1)
+        indices = np.flatnonzero(state)
+        state = SparseState(int(np.log2(len(state))), indices, state[indices], prune_threshold)
+        state._prune()
+        return state
+
+    def __len__(self) -> int:
+        """The number of non-zero amplitudes"""
+        return len(self.indices)
+
+    @property
+    def fill_ratio(self) -> float:
+        """The fraction of the 2^n amplitudes that is non-zero"""
+        return len(self.indices) / 2 ** self.num_qubits
+
+    def apply(self, gate: GateInstruction) -> None:
+        """Apply a gate with a matrix (see :class:`base.kernels.MatrixInstruction`)"""
+        if not isinstance(gate, MatrixInstruction):
+            raise ValueError(f"Gate {gate} cannot be applied to a sparse state")
+
+        shifts = [self.num_qubits - 1 - qubit for qubit in gate.qubits]
+        # the position of every amplitude in the basis of the gate's qubits (the first qubit is the high bit)
+        local = np.zeros(len(self.indices), dtype=np.int64)
+        for shift in shifts:
+            local = (local << 1) | ((self.indices >> shift) & 1)
+
+        if gate.is_diagonal:
+            # phases only: the indices stay the same
+            self.amplitudes = self.amplitudes * np.diagonal(gate.matrix)[local]
+        elif reversible_step(self.num_qubits, gate) is not None:
+            # X, Y, CNOT and SWAP only move the amplitudes to other indices
+            indices, phases = ReversibleCircuit(self.num_qubits, [gate]).evaluate(self.indices)
+            order = np.argsort(indices, kind="stable")
+            self.indices = indices[order]
+            self.amplitudes = (self.amplitudes * ReversibleCircuit.phase(phases))[order]
+        else:
+            self._apply_matrix(gate.matrix, shifts, local)
+        self._prune()
+
+    def to_state_vector(self, real_dtype: type = np.float64) -> np.ndarray:
+        """The state as a dense state vector of length 2^n, of *real_dtype* if all amplitudes are real"""
+        if np.any(self.amplitudes.imag):
+            state = np.zeros(2 ** self.num_qubits, dtype=complex_dtype(real_dtype))
+            state[self.indices] = self.amplitudes
+        else:
+            state = np.zeros(2 ** self.num_qubits, dtype=real_dtype)
+            state[self.indices] = self.amplitudes.real
+        return state
+
+    def measurement_probabilities(self, qubits: list[int]) -> dict[str, float]:
+        """
+        The probability of every outcome of measuring *qubits* (ascending), keyed by its bit string (lowest qubit
+        first); outcomes that cannot occur are left out
+        """
+        outcomes = np.zeros(len(self.indices), dtype=np.int64)
+        for qubit in qubits:
+            outcomes = (outcomes << 1) | ((self.indices >> (self.num_qubits - 1 - qubit)) & 1)
+        unique, inverse = np.unique(outcomes, return_inverse=True)
+        probabilities = np.bincount(inverse, weights=np.abs(self.amplitudes) ** 2, minlength=len(unique))
+        return {
+            format(int(outcome), f"0{len(qubits)}b"): float(probability)
+            for outcome, probability in zip(unique, probabilities)
+        }
+
+    def _apply_matrix(self, matrix: np.ndarray, shifts: list[int], local: np.ndarray) -> None:
+        """Apply a branching gate: every amplitude contributes to every row of its column of *matrix*"""
+        mask = sum(1 << shift for shift in shifts)
+        base = self.indices & ~mask
+        indices, amplitudes = [], []
+        for row in range(len(matrix)):
+            weights = matrix[row, local]
+            # leave out the contributions of the zeros of the matrix, such as those of a controlled gate
+            contributing = weights != 0
+            row_index = base[contributing]
+            for position, shift in enumerate(shifts):
+                row_index = row_index | (((row >> (len(shifts) - 1 - position)) & 1) << shift)
+            indices.append(row_index)
+            amplitudes.append(weights[contributing] * self.amplitudes[contributing])
+
+        indices = np.concatenate(indices)
+        amplitudes = np.concatenate(amplitudes)
+        # add up the contributions to the same index
+        order = np.argsort(indices, kind="stable")
+        indices, amplitudes = indices[order], amplitudes[order]
+        self.indices, starts = np.unique(indices, return_index=True)
+        self.amplitudes = np.add.reduceat(amplitudes, starts) if len(amplitudes) else amplitudes
+
+    def _prune(self) -> None:
+        probabilities = np.abs(self.amplitudes) ** 2
+        kept = probabilities > max(self.prune_threshold, SparseState.ROUNDING_ERROR ** 2)
+        if np.all(kept):
+            return
+        self.discarded_weight += float(np.sum(probabilities[~kept]))
+        self.indices = self.indices[kept]
+        self.amplitudes = self.amplitudes[kept]
@@ -0,0 +1,272 @@
+import numpy as np
+
+from base.kernels import GateInstruction, MultiQubitInstruction, SingleQubitInstruction
+from base.models import MultiOperationType, OperationType
+
+
+CLIFFORD_SINGLE_GATES = {
+    OperationType.MEASURE, OperationType.X, OperationType.Y, OperationType.Z, OperationType.H, OperationType.S
+}
+CLIFFORD_MULTI_GATES = {MultiOperationType.CNOT, MultiOperationType.CZ, MultiOperationType.SWAP}
+
+
+def is_clifford(gates: list[GateInstruction]) -> bool:
+    """Whether all *gates* (as lowered from a circuit, before fusion) are Clifford gates"""
+    for gate in gates:
+        if isinstance(gate, SingleQubitInstruction):
+            if gate.operation_type not in CLIFFORD_SINGLE_GATES:
+                return False
+        elif isinstance(gate, MultiQubitInstruction):
+            if gate.operation_type not in CLIFFORD_MULTI_GATES:
+                return False
+        else:
+            return False
+    return True
+
+
+def _phase_exponents(x1: np.ndarray, z1: np.ndarray, x2: np.ndarray, z2: np.ndarray) -> np.ndarray:
+    """
+    The exponent of ``i`` picked up when multiplying the Pauli ``(x1, z1)`` by ``(x2, z2)``, per qubit
+    (the function ``g`` of Aaronson and Gottesman)
+    """
+    x1, z1, x2, z2 = (array.astype(np.int8) for array in (x1, z1, x2, z2))
+    return (x1 * z1 * (z2 - x2)
+            + x1 * (1 - z1) * z2 * (2 * x2 - 1)
+            + (1 - x1) * z1 * x2 * (1 - 2 * z2))
+
+
+class StabilizerTableau:
+    """
+    A stabilizer state of *num_qubits* qubits, stored as the tableau of Aaronson and Gottesman
+    ("Improved simulation of stabilizer circuits", 2004).
+
+    Rows ``0..n-1`` hold the destabilizers and rows ``n..2n-1`` the stabilizers, each as the bits of its X and Z
+    parts and a sign bit. Every Clifford gate updates the tableau in ``O(n)`` time, so circuits that only use
+    Clifford gates can be simulated on hundreds of qubits without ever building the state vector.
+    """
+
+    def __init__(self, num_qubits: int) -> None:
+        """Create the tableau of the all-zero state ``|0...0>``"""
+        self.num_qubits = num_qubits
+        identity = np.eye(num_qubits, dtype=bool)
+        zeros = np.zeros((num_qubits, num_qubits), dtype=bool)
+        self.x = np.vstack([identity, zeros])
+        self.z = np.vstack([zeros, identity])
+        self.r = np.zeros(2 * num_qubits, dtype=bool)
+
+    @staticmethod
+    def from_basis_state(num_qubits: int, index: int) -> 'StabilizerTableau':
+        """Create the tableau of the computational basis state with the given *index* (qubit 0 is the most significant bit)"""
+        tableau = StabilizerTableau(num_qubits)
+        for qubit in range(num_qubits):
+            if (index >> (num_qubits - 1 - qubit)) & 1:
+                tableau.apply_x(qubit)
+        return tableau
+
+    def apply(self, gate: GateInstruction) -> None:
+        if isinstance(gate, SingleQubitInstruction):
+            StabilizerTableau._SINGLE_GATES[gate.operation_type](self, gate.qubit)
+        elif isinstance(gate, MultiQubitInstruction):
+            StabilizerTableau._MULTI_GATES[gate.operation_type](self, gate.control, gate.target)
+        else:
+            raise ValueError(f"Gate {gate} cannot be applied to a stabilizer tableau")
+
+    def apply_h(self, qubit: int) -> None:
+        self.r ^= self.x[:, qubit] & self.z[:, qubit]
+        self.x[:, qubit], self.z[:, qubit] = self.z[:, qubit].copy(), self.x[:, qubit].copy()
+
+    def apply_s(self, qubit: int) -> None:
+        self.r ^= self.x[:, qubit] & self.z[:, qubit]
+        self.z[:, qubit] ^= self.x[:, qubit]
+
+    def apply_x(self, qubit: int) -> None:
+        self.r ^= self.z[:, qubit]
+
+    def apply_y(self, qubit: int) -> None:
+        self.r ^= self.x[:, qubit] ^ self.z[:, qubit]
+
+    def apply_z(self, qubit: int) -> None:
+        self.r ^= self.x[:, qubit]
+
+    def apply_identity(self, qubit: int) -> None:
+        pass
+
+    def apply_cnot(self, control: int, target: int) -> None:
+        x_c, z_c, x_t, z_t = self.x[:, control], self.z[:, control], self.x[:, target], self.z[:, target]
+        self.r ^= x_c & z_t & ~(x_t ^ z_c)
+        self.x[:, target] ^= x_c
+        self.z[:, control] ^= z_t
+
+    def apply_cz(self, control: int, target: int) -> None:
+        self.apply_h(target)
+        self.apply_cnot(control, target)
+        self.apply_h(target)
+
+    def apply_swap(self, qubit_a: int, qubit_b: int) -> None:
+        self.x[:, [qubit_a, qubit_b]] = self.x[:, [qubit_b, qubit_a]]
+        self.z[:, [qubit_a, qubit_b]] = self.z[:, [qubit_b, qubit_a]]
+
+    def measurement_distribution(self, qubits: list[int]) -> 'OutcomeDistribution':
+        """
+        The joint distribution of measuring *qubits* in the computational basis.
+
+        The outcomes of measuring a stabilizer state are uniformly distributed over an affine subspace of bit strings,
+        fixed by the stabilizers that are a product of Z operators on *qubits* only: a stabilizer ``(-1)^s Z^a`` only
+        allows outcomes ``b`` with ``a . b = s (mod 2)``. Those stabilizers are found by Gaussian elimination
+        of the stabilizer rows on their X bits and the Z bits of all other qubits.
+        """
+        n = self.num_qubits
+        x = self.x[n:].copy()
+        z = self.z[n:].copy()
+        r = self.r[n:].copy()
+
+        measured = set(qubits)
+        others = [qubit for qubit in range(n) if qubit not in measured]
+        eliminate = np.hstack([x, z[:, others]])
+        used = np.zeros(n, dtype=bool)
+        for column in range(eliminate.shape[1]):
+            candidates = np.flatnonzero(eliminate[:, column] & ~used)
+            if len(candidates) == 0:
+                continue
+            pivot = candidates[0]
+            used[pivot] = True
+            rows = np.flatnonzero(eliminate[:, column])
+            rows = rows[rows != pivot]
+            if len(rows) == 0:
+                continue
+
+            # multiply the pivot row into every other row that has this column set, keeping track of the signs
+            exponents = (2 * r[rows].astype(np.int64) + 2 * int(r[pivot])
+                         + _phase_exponents(x[pivot], z[pivot], x[rows], z[rows]).sum(axis=1))
+            r[rows] = (exponents % 4) == 2
+            x[rows] ^= x[pivot]
+            z[rows] ^= z[pivot]
+            eliminate[rows] ^= eliminate[pivot]
+
+        constraints = z[~used][:, qubits]
+        return OutcomeDistribution.solve(constraints, r[~used])
+
+    _SINGLE_GATES = {
+        OperationType.MEASURE: apply_identity,
+        OperationType.X: apply_x,
+        OperationType.Y: apply_y,
+        OperationType.Z: apply_z,
+        OperationType.H: apply_h,
+        OperationType.S: apply_s,
+    }
+    _MULTI_GATES = {
+        MultiOperationType.CNOT: apply_cnot,
+        MultiOperationType.CZ: apply_cz,
+        MultiOperationType.SWAP: apply_swap,
+    }
+
+
+class OutcomeDistribution:
+    """
+    A uniform distribution over the bit strings ``offset ^ (c . basis)`` for every choice of bits ``c``,
+    which is what measuring some of the qubits of a stabilizer state produces
+    """
+
+    # enumerating all outcomes is refused beyond this many random bits
+    MAX_ENUMERATED_BITS = 20
+
+    def __init__(self, offset: np.ndarray, basis: np.ndarray) -> None:
+        """
+        :param offset:    one possible outcome, as a bool array with one entry per measured qubit
+        :param basis:     the directions of the subspace, one bool row per random bit
+        """
+        self.offset = offset
+        self.basis = basis
+
+    @staticmethod
+    def solve(constraints: np.ndarray, signs: np.ndarray) -> 'OutcomeDistribution':
+        """The distribution over all bit strings ``b`` with ``constraints . b = signs (mod 2)``"""
+        num_bits = constraints.shape[1]
+        rows = np.hstack([constraints, signs.reshape(-1, 1)]).astype(bool)
+        pivots = []
+        for column in range(num_bits):
+            candidates = [row for row in range(len(pivots), len(rows)) if rows[row, column]]
+            if not candidates:
+                continue
+            pivot_row = len(pivots)
+            rows[[pivot_row, candidates[0]]] = rows[[candidates[0], pivot_row]]
+            others = np.flatnonzero(rows[:, column])
+            others = others[others != pivot_row]
+            rows[others] ^= rows[pivot_row]
+            pivots.append(column)
+
+        offset = np.zeros(num_bits, dtype=bool)
+        for pivot_row, column in enumerate(pivots):
+            offset[column] = rows[pivot_row, -1]
+
+        pivot_columns = set(pivots)
+        free = [column for column in range(num_bits) if column not in pivot_columns]
+        basis = np.zeros((len(free), num_bits), dtype=bool)
+        for i, column in enumerate(free):
+            basis[i, column] = True
+            for pivot_row, pivot_column in enumerate(pivots):
+                basis[i, pivot_column] = rows[pivot_row, column]
+
+        return OutcomeDistribution(offset, basis)
+
+    @property
+    def num_random_bits(self) -> int:
+        return len(self.basis)
+
+    def probabilities(self) -> dict[str, float]:
+        """The probability of every possible outcome, keyed by its bit string"""
+        if self.num_random_bits > OutcomeDistribution.MAX_ENUMERATED_BITS:
+            raise ValueError(f"The measurement has 2^{self.num_random_bits} equally likely outcomes, which is too many to list")
+
+        probability = 1 / 2 ** self.num_random_bits
+        return {outcome: probability for outcome in self._bit_strings(self._outcomes(self._all_choices()))}
+
+    def outcomes(self) -> np.ndarray:
+        """Every possible outcome, as a bool array with one row per outcome"""
+        packed = self._outcomes(self._all_choices())
+        return np.unpackbits(packed, axis=1, count=len(self.offset)).astype(bool)
+
+    def sample(self, shots: int, rng: np.random.Generator) -> dict[str, int]:
+        """Draw *shots* outcomes, returning how often each outcome was drawn keyed by its bit string"""
+        # the random bits are drawn 8 at a time, as the bytes that :func:`_outcomes` takes
+        choices = rng.integers(0, 256, size=(shots, -(-self.num_random_bits // 8)), dtype=np.uint8)
+        if self.num_random_bits % 8:
+            choices[:, -1] &= (1 << self.num_random_bits % 8) - 1
+        outcomes, counts = np.unique(self._outcomes(choices), axis=0, return_counts=True)
+        return {outcome: int(count) for outcome, count in zip(self._bit_strings(outcomes), counts)}
+
+    def _all_choices(self) -> np.ndarray:
+        """Every choice of the random bits, packed as for :func:`_outcomes`"""
+        choices = (np.arange(2 ** self.num_random_bits)[:, None] >> np.arange(self.num_random_bits)) & 1
+        return np.packbits(choices.astype(bool), axis=1, bitorder="little")
+
+    def _outcomes(self, choices: np.ndarray) -> np.ndarray:
+        """
+        ``offset ^ (c . basis)`` over GF(2) for every row *c* of *choices*.
+
+        :param choices:    the random bits of every outcome, 8 per byte with random bit ``8 k + i`` in bit ``i``
+                           of byte ``k``, as ``np.packbits(..., bitorder="little")`` gives them
+        :return:           the outcomes packed 8 bits per byte as by ``np.packbits``, one row per outcome
+        """
+        basis = np.packbits(self.basis, axis=1)
+        outcomes = np.tile(np.packbits(self.offset), (len(choices), 1))
+        # every byte of choices selects a combination of 8 rows of the basis: XOR all 256 combinations of them
+        # up front, so that each byte costs one lookup instead of 8 row operations
+        for byte, start in enumerate(range(0, self.num_random_bits, 8)):
+            rows = basis[start:start + 8]
+            table = np.zeros((2 ** len(rows), basis.shape[1]), dtype=np.uint8)
+            for i, row in enumerate(rows):
+                table[1 << i:2 << i] = table[:1 << i] ^ row
+            outcomes ^= table[choices[:, byte]]
+        return outcomes
+
+    def _bit_strings(self, packed: np.ndarray) -> list[str]:
+        return bit_strings(np.unpackbits(packed, axis=1, count=len(self.offset)))
+
+
+def bit_strings(bits: np.ndarray) -> list[str]:
+    """The rows of the 0/1 (or bool) array *bits* as strings of '0' and '1', converted a whole row at a time"""
+    if bits.shape[1] == 0:
+        return [''] * len(bits)
+    characters = np.where(bits, np.uint8(ord('1')), np.uint8(ord('0')))
+    return [row.decode() for row in np.ascontiguousarray(characters).view(f"S{bits.shape[1]}").reshape(-1)]
@@ -0,0 +1,150 @@
+import heapq
+from itertools import count
+
+import numpy as np
+
+from base.kernels import GateInstruction, MatrixInstruction
+
+
+class ContractionPlan:
+    """
+    The order in which to contract the tensors of a :class:`TensorNetwork`, as pairs of positions in its list of
+    tensors; the result of every contraction is appended to that list.
+
+    *width* is the contraction width: the log2 of the size of the largest tensor that comes up while contracting,
+    which bounds the memory the contraction needs.
+    """
+
+    def __init__(self, steps: list[tuple[int, int]], width: int) -> None:
+        self.steps = steps
+        self.width = width
+
+
+class TensorNetwork:
+    """
+    The network of tensors of ``<x|U|y>`` for a circuit ``U`` on the computational basis states *x* and *y*:
+    every gate is a tensor with an axis for each qubit it acts on before and after it, connected along the wires
+    of the circuit, and the wires are closed off by the basis vectors of *y* at the start and *x* at the end.
+
+    Contracting it produces a single amplitude without ever holding a state of 2^n amplitudes: the memory that is
+    needed is bounded by the contraction width of the order that the tensors are contracted in (see :func:`plan`).
+    """
+
+    def __init__(self, num_qubits: int, gates: list[GateInstruction]) -> None:
+        """
+        :param num_qubits:    number of qubits of the circuit
+        :param gates:         the gates of the circuit, which must have a matrix (see :class:`base.kernels.MatrixInstruction`)
+        """
+        self.num_qubits = num_qubits
+        # every tensor is stored as its array and the labels of its axes; a label that appears on two tensors joins them
+        self.tensors: list[np.ndarray] = []
+        self.labels: list[list[int]] = []
+
+        labels = count()
+        wires = [next(labels) for _ in range(num_qubits)]
+        self.input_labels = list(wires)
+        for gate in gates:
+            if not isinstance(gate, MatrixInstruction):
+                raise ValueError(f"Gate {gate} cannot be turned into a tensor")
+            outputs = [next(labels) for _ in gate.qubits]
+            inputs = [wires[qubit] for qubit in gate.qubits]
+            # the matrix maps its inputs (columns) to its outputs (rows); split both into one axis per qubit
+            self.tensors.append(gate.matrix.reshape((2,) * (2 * len(gate.qubits))))
+            self.labels.append(outputs + inputs)
+            for qubit, label in zip(gate.qubits, outputs):
+                wires[qubit] = label
+        self.output_labels = wires
+
+    def plan(self) -> ContractionPlan:
+        """
+        Find a contraction order with a greedy heuristic: always contract the pair of connected tensors for which
+        the result is smallest compared to the two tensors it replaces (the basis vectors at the ends included).
+        """
+        labels = [set(labels) for labels in self._closed_labels()]
+        sizes = [len(labels) for labels in labels]
+        holders: dict[int, set[int]] = {}
+        for position, tensor_labels in enumerate(labels):
+            for label in tensor_labels:
+                holders.setdefault(label, set()).add(position)
+
+        def candidate(a: int, b: int) -> tuple[int, int, int, int]:
+            result = len(labels[a] ^ labels[b])
+            # compare sizes as powers of two, so a contraction that shrinks the network is always preferred
+            return 2 ** result - 2 ** sizes[a] - 2 ** sizes[b], result, a, b
+
+        queue = [candidate(a, b) for positions in holders.values() for a, b in [sorted(positions)]]
+        heapq.heapify(queue)
+        alive = set(range(len(labels)))
+        steps = []
+        width = max(sizes)
+        while queue:
+            _, result, a, b = heapq.heappop(queue)
+            if a not in alive or b not in alive:
+                continue
+
+            new = len(labels)
+            labels.append(labels[a] ^ labels[b])
+            sizes.append(result)
+            width = max(width, result)
+            steps.append((a, b))
+            alive -= {a, b}
+            alive.add(new)
+
+            neighbours = set()
+            for label in labels[a] | labels[b]:
+                holders[label] -= {a, b}
+                if label in labels[new]:
+                    holders[label].add(new)
+                    neighbours |= holders[label] - {new}
+            for neighbour in neighbours:
+                heapq.heappush(queue, candidate(min(neighbour, new), max(neighbour, new)))
+
+        # parts of the circuit that are not connected to each other (e.g. qubits without two-qubit gates)
+        # are left over as separate scalars, which are multiplied together at the end
+        return ContractionPlan(steps, width)
+
+    def amplitude(self, output: int, start: int, plan: ContractionPlan | None = None) -> complex:
+        """
+        Contract the network into the amplitude ``<output|U|start>``.
+
+        :param output:    index of the computational basis state *x* at the end (qubit 0 is the most significant bit)
+        :param start:     index of the computational basis state *y* at the start
+        :param plan:      the contraction order to use, defaults to a new :func:`plan`. A plan can be reused for all
+                          amplitudes of the same network, as it does not depend on the basis states
+        """
+        if plan is None:
+            plan = self.plan()
+
+        tensors = self.tensors + [TensorNetwork._basis_vector(start, qubit, self.num_qubits) for qubit in range(self.num_qubits)] \
+            + [TensorNetwork._basis_vector(output, qubit, self.num_qubits) for qubit in range(self.num_qubits)]
+        labels = self._closed_labels()
+        alive = set(range(len(tensors)))
+        for a, b in plan.steps:
+            shared = [label for label in labels[a] if label in labels[b]]
+            tensors.append(np.tensordot(tensors[a], tensors[b], axes=(
+                [labels[a].index(label) for label in shared],
+                [labels[b].index(label) for label in shared]
+            )))
+            labels.append([label for label in labels[a] if label not in shared]
+                          + [label for label in labels[b] if label not in shared])
+            # drop the inputs of the contraction, so only the tensors that are still needed are kept in memory
+            tensors[a] = tensors[b] = None
+            alive -= {a, b}
+            alive.add(len(tensors) - 1)
+
+        result = 1 + 0j
+        for position in alive:
+            result *= complex(tensors[position])
+        return result
+
+    def _closed_labels(self) -> list[list[int]]:
+        """The labels of the gate tensors, followed by those of the basis vectors at the start and at the end"""
+        return [list(labels) for labels in self.labels] \
+            + [[label] for label in self.input_labels] \
+            + [[label] for label in self.output_labels]
+
+    @staticmethod
+    def _basis_vector(index: int, qubit: int, num_qubits: int) -> np.ndarray:
+        vector = np.zeros(2, dtype=complex)
+        vector[(index >> (num_qubits - 1 - qubit)) & 1] = 1
+        return vector
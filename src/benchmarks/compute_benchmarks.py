@@ -0,0 +1,160 @@
+"""
+Rough timings of the simulation backends on generated circuits.
+
+Run from the `src` directory with:
+
+```shell
+python -m benchmarks.compute_benchmarks
+```
+"""
+import time
+
+import numpy as np
+
+from base.compute import QuantumComputer, SimulationBackend
+from base.models import CircuitDefinition, OperationType, MultiOperationType
+
+
+def build_layered_circuit(num_qubits: int, layers: int, seed: int = 0) -> CircuitDefinition:
+    """
+    A circuit in the style of the designer's examples: layers of single-qubit gates
+    followed by a ladder of controlled gates between neighbouring qubits
+    """
+    rng = np.random.default_rng(seed)
+    single = [OperationType.H, OperationType.X, OperationType.T, OperationType.S, OperationType.Z]
+    multi = [MultiOperationType.CNOT, MultiOperationType.CZ, MultiOperationType.CS]
+
+    d = CircuitDefinition(num_qubits)
+    time_step = 0
+    for _ in range(layers):
+        for qubit in range(num_qubits):
+            d.set_operation(qubit, time_step, single[rng.integers(len(single))])
+        time_step += 1
+        for offset in [0, 1]:
+            for qubit in range(offset, num_qubits - 1, 2):
+                d.set_multi_operation(qubit + 1, qubit, time_step, multi[rng.integers(len(multi))])
+            time_step += 1
+
+    for qubit in range(num_qubits):
+        d.set_operation(qubit, time_step, OperationType.MEASURE)
+    return d
+
+
+def build_near_clifford_circuit(num_qubits: int,
+                                non_clifford: int,
+                                layers: int = 10,
+                                seed: int = 0,
+                                superposed: int = 1) -> CircuitDefinition:
+    """
+    Layers of S, X and Z gates (H on the first *superposed* qubits) followed by a ladder of CNOT and CZ gates,
+    with *non_clifford* of the other single-qubit gates replaced by T. Few H gates keep the number of possible outcomes
+    small, as in circuits that compute classical functions with a few qubits in superposition; with H on every qubit
+    almost all basis states can occur.
+    """
+    rng = np.random.default_rng(seed)
+    single = [OperationType.S, OperationType.X, OperationType.Z]
+    multi = [MultiOperationType.CNOT, MultiOperationType.CZ]
+    slots = [(layer, qubit) for layer in range(layers) for qubit in range(superposed, num_qubits)]
+    t_slots = {slots[i] for i in rng.choice(len(slots), size=non_clifford, replace=False)}
+
+    d = CircuitDefinition(num_qubits)
+    time_step = 0
+    for layer in range(layers):
+        for qubit in range(superposed):
+            d.set_operation(qubit, time_step, OperationType.H)
+        for qubit in range(superposed, num_qubits):
+            gate = OperationType.T if (layer, qubit) in t_slots else single[rng.integers(len(single))]
+            d.set_operation(qubit, time_step, gate)
+        time_step += 1
+        for offset in [0, 1]:
+            for qubit in range(offset, num_qubits - 1, 2):
+                d.set_multi_operation(qubit + 1, qubit, time_step, multi[rng.integers(len(multi))])
+            time_step += 1
+
+    for qubit in range(num_qubits):
+        d.set_operation(qubit, time_step, OperationType.MEASURE)
+    return d
+
+
+def time_probabilities(circuit: CircuitDefinition, backend: SimulationBackend, repeats: int = 3) -> float:
+    """Best wall-clock time in seconds of computing the measurement probabilities for the |0...0> input"""
+    best = float("inf")
+    for _ in range(repeats):
+        QuantumComputer.clear_caches()
+        computer = QuantumComputer(circuit, backend=backend)
+        start = time.perf_counter()
+        computer.probabilities(0)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def time_backend(circuit: CircuitDefinition, backend: SimulationBackend, repeats: int = 3, warm: bool = False) -> float:
+    """
+    Best wall-clock time in seconds of simulating *circuit* on the |0...0> input.
+    With *warm* the shared caches are kept between repeats, as for repeated Play clicks.
+    """
+    best = float("inf")
+    QuantumComputer.clear_caches()
+    for _ in range(repeats):
+        if not warm:
+            QuantumComputer.clear_caches()
+        computer = QuantumComputer(circuit, backend=backend)
+        start = time.perf_counter()
+        computer.compute_batch([0])
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    print(f"{'qubits':>6} {'dense [s]':>10} {'sparse [s]':>11} {'sparse, cached [s]':>19}")
+    for num_qubits in [10, 12, 14, 16]:
+        circuit = build_layered_circuit(num_qubits, layers=10)
+        dense = time_backend(circuit, SimulationBackend.DENSE)
+        sparse = time_backend(circuit, SimulationBackend.SPARSE)
+        sparse_cached = time_backend(circuit, SimulationBackend.SPARSE, warm=True)
+        print(f"{num_qubits:>6} {dense:>10.4f} {sparse:>11.4f} {sparse_cached:>19.4f}")
+
+    # crossover of the near-Clifford stabilizer sum against the dense state vector, which AUTO should follow.
+    # The sum is only timed where it has few enough basis states to list, as it gets very slow beyond that
+    print()
+    print(f"{'qubits':>6} {'H qubits':>8} {'T gates':>7} {'dense [s]':>10} {'near-Clifford [s]':>18} {'auto [s]':>9}")
+    for num_qubits in [12, 16, 20]:
+        for superposed in [1, num_qubits // 2, num_qubits - 1]:
+            for non_clifford in [2, 5, 8]:
+                circuit = build_near_clifford_circuit(num_qubits, non_clifford, superposed=superposed)
+                dense = time_probabilities(circuit, SimulationBackend.DENSE)
+                near_clifford = time_probabilities(circuit, SimulationBackend.NEAR_CLIFFORD) \
+                    if superposed + non_clifford <= 12 else float("nan")
+                auto = time_probabilities(circuit, SimulationBackend.AUTO)
+                print(f"{num_qubits:>6} {superposed:>8} {non_clifford:>7} {dense:>10.4f} {near_clifford:>18.4f} {auto:>9.4f}")
+
+    # sparse states on circuits that keep only the first qubits in superposition, and how AUTO follows them
+    print()
+    print(f"{'qubits':>6} {'H qubits':>8} {'dense [s]':>10} {'sparse state [s]':>17} {'auto [s]':>9}")
+    for num_qubits in [16, 20, 22]:
+        for superposed in [2, 6, num_qubits]:
+            circuit = build_near_clifford_circuit(num_qubits, 0, superposed=superposed)
+            timings = []
+            for backend in [SimulationBackend.DENSE, SimulationBackend.SPARSE_STATE, SimulationBackend.AUTO]:
+                QuantumComputer.clear_caches()
+                computer = QuantumComputer(circuit, backend=backend)
+                start = time.perf_counter()
+                computer.compute(0)
+                timings.append(time.perf_counter() - start)
+            print(f"{num_qubits:>6} {superposed:>8} {timings[0]:>10.4f} {timings[1]:>17.4f} {timings[2]:>9.4f}")
+
+    # matrix product states on circuits that are too wide for the state vector, trading accuracy for memory
+    print()
+    print(f"{'qubits':>6} {'max bond':>8} {'MPS, 1000 shots [s]':>20} {'discarded weight':>17}")
+    for num_qubits in [30, 60]:
+        circuit = build_layered_circuit(num_qubits, layers=12)
+        for max_bond_dimension in [8, 32]:
+            computer = QuantumComputer(circuit, backend=SimulationBackend.MPS, max_bond_dimension=max_bond_dimension)
+            start = time.perf_counter()
+            computer.sample(0, 1000, seed=0)
+            elapsed = time.perf_counter() - start
+            print(f"{num_qubits:>6} {max_bond_dimension:>8} {elapsed:>20.4f} {computer.last_discarded_weight:>17.4f}")
+
+
+if __name__ == "__main__":
+    main()
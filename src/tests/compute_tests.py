@@ -0,0 +1,845 @@
+import unittest
+
+import numpy as np
+from parameterized import parameterized
+
+from base import sparse
+from base.cache import LRUCache
+from base.compute import QuantumComputer, SimulationBackend
+from base.kernels import PhaseInstruction, SingleQubitInstruction
+from base.models import CircuitDefinition, OperationType, MultiOperationType, QuBitOperationSingleParam, \
+    QuBitOperationMultiParam
+
+
+SINGLE_GATES = [OperationType.H, OperationType.X, OperationType.Y, OperationType.Z,
+                OperationType.S, OperationType.T, OperationType.T_dg]
+MULTI_GATES = [MultiOperationType.CNOT, MultiOperationType.CZ, MultiOperationType.CS, MultiOperationType.SWAP]
+
+
+def build_random_circuit(num_qubits: int, depth: int, seed: int,
+                         single_gates: list[OperationType] = SINGLE_GATES,
+                         multi_gates: list[MultiOperationType] = MULTI_GATES,
+                         multi_probability: float = 0.3) -> CircuitDefinition:
+    rng = np.random.default_rng(seed)
+    d = CircuitDefinition(num_qubits)
+
+    for time in range(depth):
+        free = list(range(num_qubits))
+        rng.shuffle(free)
+        while free:
+            qubit = free.pop()
+            roll = rng.random()
+            if multi_gates and free and roll < multi_probability:
+                other = free.pop()
+                d.set_multi_operation(qubit, other, time, multi_gates[rng.integers(len(multi_gates))])
+            elif roll < 0.8:
+                d.set_operation(qubit, time, single_gates[rng.integers(len(single_gates))])
+
+    for qubit in range(num_qubits):
+        d.set_operation(qubit, depth, OperationType.MEASURE)
+
+    return d
+
+
+def reference_unitary(circuit: CircuitDefinition) -> np.ndarray:
+    """Builds the full circuit unitary from dense kronecker products, one time step at a time"""
+    n = circuit.num_qubits
+    ket_0 = np.array([[1, 0], [0, 0]], dtype=complex)
+    ket_1 = np.array([[0, 0], [0, 1]], dtype=complex)
+
+    def controlled(gate, control, target):
+        m0 = np.array([[1]], dtype=complex)
+        m1 = np.array([[1]], dtype=complex)
+        for i in range(n):
+            if i == control:
+                m0, m1 = np.kron(m0, ket_0), np.kron(m1, ket_1)
+            elif i == target:
+                m0, m1 = np.kron(m0, np.eye(2)), np.kron(m1, gate)
+            else:
+                m0, m1 = np.kron(m0, np.eye(2)), np.kron(m1, np.eye(2))
+        return m0 + m1
+
+    def multi(operation_type, control, target):
+        if operation_type == MultiOperationType.SWAP:
+            x = QuantumComputer.SINGLE_MAPPINGS[OperationType.X]
+            return controlled(x, control, target) @ controlled(x, target, control) @ controlled(x, control, target)
+        single = {
+            MultiOperationType.CNOT: OperationType.X,
+            MultiOperationType.CZ: OperationType.Z,
+            MultiOperationType.CS: OperationType.S,
+        }[operation_type]
+        return controlled(QuantumComputer.SINGLE_MAPPINGS[single], control, target)
+
+    columns: dict[int, list] = {}
+    for qubit, schedule in enumerate(circuit.operation_schedules):
+        for time, op in schedule.operations.items():
+            columns.setdefault(time, []).append((qubit, op))
+
+    unitary = np.eye(2 ** n, dtype=complex)
+    for time in sorted(columns)[:-1]:
+        step = np.eye(2 ** n, dtype=complex)
+        for qubit, op in columns[time]:
+            if isinstance(op, QuBitOperationSingleParam):
+                single = np.array([[1]], dtype=complex)
+                for i in range(n):
+                    single = np.kron(single, QuantumComputer.SINGLE_MAPPINGS[op.get_type()] if i == qubit else np.eye(2))
+                step = single @ step
+            elif isinstance(op, QuBitOperationMultiParam):
+                step = multi(op.get_type(), op.get_applies_to(), op.get_applied_by()) @ step
+        unitary = step @ unitary
+    return unitary
+
+
+def basis_vector(num_qubits: int, index: int) -> list[int]:
+    vector = [0 for _ in range(2 ** num_qubits)]
+    vector[index] = 1
+    return vector
+
+
+def build_ghz_circuit(num_qubits: int, chain: bool = False) -> CircuitDefinition:
+    """
+    H on qubit 0, then CNOT gates that copy it onto every other qubit, and a measurement of every qubit.
+
+    :param chain:   copy each qubit from its neighbour, instead of copying every qubit from qubit 0 (most of which
+                    are then not neighbours)
+    """
+    d = CircuitDefinition(num_qubits)
+    d.set_operation(0, 0, OperationType.H)
+    for qubit in range(1, num_qubits):
+        d.set_multi_operation(qubit, qubit - 1 if chain else 0, qubit, MultiOperationType.CNOT)
+    for qubit in range(num_qubits):
+        d.set_operation(qubit, num_qubits, OperationType.MEASURE)
+    return d
+
+
+class QuantumComputerTest(unittest.TestCase):
+
+    def test_bell_state(self):
+        d = CircuitDefinition(2)
+        d.next_operation(0, OperationType.H)
+        d.next_nop(1)
+        d.next_multi_operation(1, 0, MultiOperationType.CNOT)
+        d.next_operation(0, OperationType.MEASURE)
+        d.next_operation(1, OperationType.MEASURE)
+
+        result = QuantumComputer(d).compute(basis_vector(2, 0))
+
+        np.testing.assert_allclose(result, np.array([1, 0, 0, 1]) / np.sqrt(2), atol=1e-12)
+
+    def test_last_time_step_is_not_applied(self):
+        d = CircuitDefinition(2)
+        d.set_operation(0, 0, OperationType.X)
+        d.set_operation(1, 1, OperationType.X)
+
+        result = QuantumComputer(d).compute(basis_vector(2, 0))
+
+        np.testing.assert_allclose(result, basis_vector(2, 0b10), atol=1e-12)
+
+    @parameterized.expand([
+        (2, 6, 0),
+        (3, 8, 1),
+        (4, 10, 2),
+        (5, 12, 3),
+    ])
+    def test_matches_dense_reference(self, num_qubits: int, depth: int, seed: int):
+        d = build_random_circuit(num_qubits, depth, seed)
+        unitary = reference_unitary(d)
+
+        for index in [0, 1, 2 ** num_qubits - 1]:
+            result = QuantumComputer(d).compute(basis_vector(num_qubits, index))
+            np.testing.assert_allclose(result, unitary[:, index], atol=1e-10)
+
+    @parameterized.expand([
+        (operation_type, qubit, other)
+        for operation_type in MULTI_GATES
+        for qubit, other in [(0, 2), (2, 0), (1, 2)]
+    ])
+    def test_multi_gate_kernels(self, operation_type: MultiOperationType, qubit: int, other: int):
+        d = CircuitDefinition(3)
+        d.set_operation(0, 0, OperationType.H)
+        d.set_operation(1, 0, OperationType.H)
+        d.set_operation(2, 0, OperationType.T)
+        d.set_multi_operation(qubit, other, 1, operation_type)
+        d.set_operation(0, 2, OperationType.MEASURE)
+        unitary = reference_unitary(d)
+
+        for index in range(8):
+            result = QuantumComputer(d).compute(basis_vector(3, index))
+            np.testing.assert_allclose(result, unitary[:, index], atol=1e-12)
+
+    def test_batch_of_basis_indices(self):
+        d = build_random_circuit(5, 12, 4)
+        unitary = reference_unitary(d)
+        indices = [0, 3, 7, 31, 3]
+
+        result = QuantumComputer(d).compute_batch(indices)
+
+        self.assertEqual((5, 32), result.shape)
+        np.testing.assert_allclose(result, unitary[:, indices].T, atol=1e-10)
+
+    def test_batch_of_state_vectors(self):
+        d = build_random_circuit(4, 10, 5)
+        unitary = reference_unitary(d)
+        rng = np.random.default_rng(5)
+        inputs = rng.normal(size=(3, 16)) + 1j * rng.normal(size=(3, 16))
+
+        result = QuantumComputer(d).compute_batch(inputs)
+
+        np.testing.assert_allclose(result, (unitary @ inputs.T).T, atol=1e-10)
+        np.testing.assert_allclose(result[1], QuantumComputer(d).compute(inputs[1]), atol=1e-10)
+
+    def test_batch_rejects_wrong_shape(self):
+        d = build_random_circuit(3, 4, 6)
+
+        with self.assertRaises(ValueError):
+            QuantumComputer(d).compute_batch(np.zeros((2, 4)))
+
+    def test_lower_circuit(self):
+        columns = QuantumComputer.lower_circuit(build_ghz_circuit(4, chain=True))
+
+        # one column per time step, without the measure step
+        self.assertEqual(["H(q0)"] + [f"CNOT(control=q{qubit},target=q{qubit + 1})" for qubit in range(3)],
+                         [str(gate) for column in columns for gate in column])
+        self.assertEqual([1, 1, 1, 1], [len(column) for column in columns])
+
+
+class UnitaryTest(unittest.TestCase):
+
+    def setUp(self):
+        QuantumComputer.clear_caches()
+
+    @parameterized.expand([
+        (2, 5, 30),
+        (4, 12, 31),
+        (6, 16, 32),
+    ])
+    def test_unitary_matches_reference(self, num_qubits: int, depth: int, seed: int):
+        d = build_random_circuit(num_qubits, depth, seed)
+
+        np.testing.assert_allclose(QuantumComputer(d).unitary(), reference_unitary(d), atol=1e-10)
+
+    def test_unitary_is_built_in_blocks(self):
+        d = build_random_circuit(5, 12, 33)
+        original_block = QuantumComputer.UNITARY_BLOCK_AMPLITUDES
+        try:
+            QuantumComputer.UNITARY_BLOCK_AMPLITUDES = 3 * 32
+            unitary = QuantumComputer(d).unitary()
+        finally:
+            QuantumComputer.UNITARY_BLOCK_AMPLITUDES = original_block
+
+        np.testing.assert_allclose(unitary, reference_unitary(d), atol=1e-10)
+
+    def test_unitary_is_cached_by_content(self):
+        d = build_random_circuit(4, 8, 34)
+        same = build_random_circuit(4, 8, 34)
+        # moving everything one time step further along does not change the circuit
+        shifted = CircuitDefinition(4)
+        for qubit, schedule in enumerate(d.operation_schedules):
+            for time, op in schedule.operations.items():
+                shifted.add_some_operation(qubit, time + 1, op)
+
+        first = QuantumComputer(d).unitary()
+
+        self.assertIs(first, QuantumComputer(same).unitary())
+        self.assertIs(first, QuantumComputer(shifted).unitary())
+        self.assertEqual(2, QuantumComputer.UNITARY_CACHE.hits)
+        self.assertFalse(first.flags.writeable)
+
+    def test_compute_builds_unitary_once_circuit_repeats(self):
+        d = build_random_circuit(4, 8, 35)
+        key = QuantumComputer.circuit_key(d)
+
+        first = QuantumComputer(d).compute(basis_vector(4, 3))
+        self.assertNotIn(key, QuantumComputer.UNITARY_CACHE)
+        second = QuantumComputer(d).compute(basis_vector(4, 5))
+
+        self.assertIn(key, QuantumComputer.UNITARY_CACHE)
+        np.testing.assert_allclose(first, reference_unitary(d)[:, 3], atol=1e-10)
+        np.testing.assert_allclose(second, reference_unitary(d)[:, 5], atol=1e-10)
+
+    def test_dense_backend_never_builds_unitary(self):
+        d = build_random_circuit(4, 8, 36)
+        key = QuantumComputer.circuit_key(d)
+
+        for index in [3, 5, 3]:
+            result = QuantumComputer(d, backend=SimulationBackend.DENSE).compute(index)
+            np.testing.assert_allclose(result, reference_unitary(d)[:, index], atol=1e-10)
+
+        self.assertNotIn(key, QuantumComputer.UNITARY_CACHE)
+
+    def test_different_circuits_get_different_keys(self):
+        d = CircuitDefinition(2)
+        d.set_multi_operation(0, 1, 0, MultiOperationType.CNOT)
+        d.set_operation(0, 1, OperationType.MEASURE)
+        other = CircuitDefinition(2)
+        other.set_multi_operation(1, 0, 0, MultiOperationType.CNOT)
+        other.set_operation(0, 1, OperationType.MEASURE)
+
+        self.assertNotEqual(QuantumComputer.circuit_key(d), QuantumComputer.circuit_key(other))
+
+    def test_cache_evicts_least_recently_used(self):
+        original_cache = QuantumComputer.UNITARY_CACHE
+        try:
+            QuantumComputer.UNITARY_CACHE = LRUCache(max_entries=2)
+            circuits = [build_random_circuit(3, 6, seed) for seed in [40, 41, 42]]
+            keys = [QuantumComputer.circuit_key(d) for d in circuits]
+
+            QuantumComputer(circuits[0]).unitary()
+            QuantumComputer(circuits[1]).unitary()
+            QuantumComputer(circuits[0]).unitary()
+            QuantumComputer(circuits[2]).unitary()
+
+            self.assertIn(keys[0], QuantumComputer.UNITARY_CACHE)
+            self.assertNotIn(keys[1], QuantumComputer.UNITARY_CACHE)
+            self.assertIn(keys[2], QuantumComputer.UNITARY_CACHE)
+        finally:
+            QuantumComputer.UNITARY_CACHE = original_cache
+
+
+class GateFusionTest(unittest.TestCase):
+
+    def test_fuses_single_qubit_run(self):
+        d = CircuitDefinition(2)
+        for operation in [OperationType.H, OperationType.T, OperationType.H, OperationType.S]:
+            d.next_operation(0, operation)
+        d.next_operation(1, OperationType.X)
+        d.next_operation(0, OperationType.MEASURE)
+
+        result = QuantumComputer(d, accumulate_phases=False).compile()
+
+        self.assertEqual(5, result.original_count)
+        self.assertEqual(2, len(result.gates))
+        self.assertEqual(3, result.removed_count)
+
+    def test_drops_gates_that_cancel(self):
+        d = CircuitDefinition(2)
+        d.next_operation(0, OperationType.H)
+        d.next_operation(0, OperationType.H)
+        d.next_operation(0, OperationType.MEASURE)
+
+        result = QuantumComputer(d).compile()
+
+        self.assertEqual(0, len(result.gates))
+        np.testing.assert_allclose(QuantumComputer(d).compute(basis_vector(2, 3)), basis_vector(2, 3), atol=1e-12)
+
+    def test_absorbs_single_qubit_gates_into_two_qubit_block(self):
+        d = CircuitDefinition(3)
+        d.set_operation(0, 0, OperationType.H)
+        d.set_operation(1, 0, OperationType.T)
+        d.set_multi_operation(1, 0, 1, MultiOperationType.CNOT)
+        d.set_operation(2, 1, OperationType.X)
+        d.set_operation(0, 2, OperationType.S)
+        d.set_multi_operation(0, 1, 3, MultiOperationType.CZ)
+        d.set_operation(0, 4, OperationType.MEASURE)
+
+        result = QuantumComputer(d, accumulate_phases=False).compile()
+
+        self.assertEqual(2, len(result.gates))
+        self.assertEqual(4, result.removed_count)
+        unitary = reference_unitary(d)
+        for index in range(8):
+            np.testing.assert_allclose(QuantumComputer(d).compute(basis_vector(3, index)), unitary[:, index], atol=1e-12)
+
+    @parameterized.expand([
+        (3, 20, 10),
+        (4, 20, 11),
+        (6, 30, 12),
+    ])
+    def test_fused_circuit_gives_same_state(self, num_qubits: int, depth: int, seed: int):
+        d = build_random_circuit(num_qubits, depth, seed)
+        start = [basis_vector(num_qubits, 1)]
+
+        fused = QuantumComputer(d).compute_batch(start)
+        unfused = QuantumComputer(d, fuse_gates=False, accumulate_phases=False).compute_batch(start)
+
+        self.assertGreater(QuantumComputer(d).compile().removed_count, 0)
+        np.testing.assert_allclose(fused, unfused, atol=1e-10)
+
+
+class DiagonalAccumulationTest(unittest.TestCase):
+
+    def _build_phase_circuit(self):
+        d = CircuitDefinition(4)
+        d.set_operation(0, 0, OperationType.H)
+        d.set_operation(1, 0, OperationType.H)
+        d.set_operation(2, 0, OperationType.H)
+        d.set_operation(3, 0, OperationType.H)
+        d.set_operation(0, 1, OperationType.T)
+        d.set_multi_operation(2, 1, 1, MultiOperationType.CS)
+        d.set_operation(3, 1, OperationType.Z)
+        d.set_multi_operation(0, 3, 2, MultiOperationType.CZ)
+        d.set_operation(1, 2, OperationType.X)
+        d.set_operation(2, 2, OperationType.S)
+        d.set_operation(2, 3, OperationType.T_dg)
+        d.set_operation(1, 3, OperationType.T)
+        d.set_operation(0, 4, OperationType.MEASURE)
+        return d
+
+    def test_collects_diagonal_gates_across_time_steps(self):
+        d = self._build_phase_circuit()
+
+        gates = QuantumComputer(d, fuse_gates=False).compile().gates
+
+        # the X on q1 splits the T on q1 off from the first run of phases, which starts a new run that is too short
+        # for a phase vector (see DiagonalAccumulator.MIN_GATES_PER_PHASE_VECTOR)
+        self.assertEqual(["H", "H", "H", "H", "PHASES", "X", "T", "T_dg"], [str(gate).split("(")[0].split("[")[0] for gate in gates])
+        self.assertEqual(5, gates[4].gate_count)
+
+    def test_phase_vector_gives_same_state(self):
+        d = self._build_phase_circuit()
+        unitary = reference_unitary(d)
+
+        for fuse in [True, False]:
+            result = QuantumComputer(d, fuse_gates=fuse).compute_batch([0, 5, 15])
+            np.testing.assert_allclose(result, unitary[:, [0, 5, 15]].T, atol=1e-12)
+
+    @parameterized.expand([
+        (5, 30, 20),
+        (7, 30, 21),
+    ])
+    def test_random_phase_heavy_circuits(self, num_qubits: int, depth: int, seed: int):
+        d = build_random_circuit(num_qubits, depth, seed, single_gates=[OperationType.H, OperationType.Z, OperationType.S,
+                                                                         OperationType.T, OperationType.T_dg])
+        unitary = reference_unitary(d)
+
+        result = QuantumComputer(d).compute_batch([3])
+
+        np.testing.assert_allclose(result[0], unitary[:, 3], atol=1e-10)
+
+
+class StepCacheTest(unittest.TestCase):
+
+    def _build_repeated_layers(self, num_qubits: int, repetitions: int) -> CircuitDefinition:
+        d = CircuitDefinition(num_qubits)
+        time = 0
+        for _ in range(repetitions):
+            for qubit in range(num_qubits):
+                d.set_operation(qubit, time, OperationType.H)
+            d.set_multi_operation(0, 1, time + 1, MultiOperationType.CZ)
+            d.set_multi_operation(2, 3, time + 1, MultiOperationType.CS)
+            d.set_operation(1, time + 2, OperationType.T)
+            d.set_operation(3, time + 2, OperationType.S)
+            time += 3
+        d.set_operation(0, time, OperationType.MEASURE)
+        return d
+
+    def test_repeated_layers_share_phase_vectors(self):
+        d = self._build_repeated_layers(4, 5)
+        cache = LRUCache(max_bytes=1024 * 1024)
+
+        result = QuantumComputer(d, fuse_gates=False, step_cache=cache).compute_batch([0])
+
+        self.assertEqual(1, cache.misses)
+        self.assertEqual(4, cache.hits)
+        self.assertEqual(1, len(cache))
+        np.testing.assert_allclose(result[0], reference_unitary(d)[:, 0], atol=1e-12)
+
+    def test_cache_is_shared_across_circuits(self):
+        cache = LRUCache(max_bytes=1024 * 1024)
+
+        QuantumComputer(self._build_repeated_layers(4, 2), fuse_gates=False, step_cache=cache).compute_batch([0])
+        QuantumComputer(self._build_repeated_layers(4, 3), fuse_gates=False, step_cache=cache).compute_batch([0])
+
+        self.assertEqual(1, cache.misses)
+        self.assertEqual(4, cache.hits)
+
+    def test_memory_budget_is_respected(self):
+        d = self._build_repeated_layers(6, 3)
+        # a phase vector for 6 qubits takes 64 * 16 bytes, which does not fit
+        cache = LRUCache(max_bytes=512)
+
+        result = QuantumComputer(d, fuse_gates=False, step_cache=cache).compute_batch([5])
+
+        self.assertEqual(0, len(cache))
+        self.assertLessEqual(cache.nbytes, 512)
+        np.testing.assert_allclose(result[0], reference_unitary(d)[:, 5], atol=1e-12)
+
+
+class IncrementalComputeTest(unittest.TestCase):
+    NUM_QUBITS = QuantumComputer.UNITARY_CACHE_MAX_QUBITS + 1
+    DEPTH = 24
+
+    def _expected(self, d: CircuitDefinition, index: int):
+        return QuantumComputer(d).compute_batch([index])[0]
+
+    def test_unchanged_circuit_reuses_result(self):
+        d = build_random_circuit(self.NUM_QUBITS, self.DEPTH, 60)
+        computer = QuantumComputer(d, track_prefix_states=True)
+        start = basis_vector(self.NUM_QUBITS, 5)
+
+        first = computer.compute(start)
+        self.assertEqual(0, computer.last_resume_column)
+        second = computer.compute(start)
+
+        self.assertIsNone(computer.last_resume_column)
+        np.testing.assert_allclose(first, self._expected(d, 5), atol=1e-10)
+        np.testing.assert_allclose(second, first, atol=0)
+
+    def test_edit_resumes_from_earliest_changed_column(self):
+        d = build_random_circuit(self.NUM_QUBITS, self.DEPTH, 61)
+        computer = QuantumComputer(d, track_prefix_states=True)
+        start = basis_vector(self.NUM_QUBITS, 0)
+        computer.compute(start)
+
+        edited_time = 18
+        if not d.is_nop(0, edited_time):
+            d.drop_operation(0, edited_time)
+        d.set_operation(0, edited_time, OperationType.Y)
+        result = computer.compute(start)
+
+        self.assertGreater(computer.last_resume_column, 0)
+        self.assertLessEqual(computer.last_resume_column, edited_time)
+        np.testing.assert_allclose(result, self._expected(d, 0), atol=1e-10)
+
+    def test_changed_input_starts_over(self):
+        d = build_random_circuit(self.NUM_QUBITS, self.DEPTH, 62)
+        computer = QuantumComputer(d, track_prefix_states=True)
+        computer.compute(basis_vector(self.NUM_QUBITS, 0))
+
+        result = computer.compute(basis_vector(self.NUM_QUBITS, 3))
+
+        self.assertEqual(0, computer.last_resume_column)
+        np.testing.assert_allclose(result, self._expected(d, 3), atol=1e-10)
+
+    def test_adding_and_removing_qubits_invalidates_states(self):
+        d = build_random_circuit(self.NUM_QUBITS, self.DEPTH, 63)
+        computer = QuantumComputer(d, track_prefix_states=True)
+        computer.compute(basis_vector(self.NUM_QUBITS, 0))
+
+        d.add_qubit()
+        result = computer.compute(basis_vector(self.NUM_QUBITS + 1, 0))
+        self.assertEqual(0, computer.last_resume_column)
+        np.testing.assert_allclose(result, self._expected(d, 0), atol=1e-10)
+
+        d.remove_qubit(2)
+        result = computer.compute(basis_vector(self.NUM_QUBITS, 0))
+        self.assertEqual(0, computer.last_resume_column)
+        np.testing.assert_allclose(result, self._expected(d, 0), atol=1e-10)
+
+    def test_small_circuit_resumes_without_unitary(self):
+        d = build_random_circuit(4, self.DEPTH, 65)
+        computer = QuantumComputer(d, track_prefix_states=True)
+        computer.compute(basis_vector(4, 0))
+
+        d.set_operation(0, self.DEPTH + 1, OperationType.H)
+        d.set_operation(0, self.DEPTH + 2, OperationType.MEASURE)
+        result = computer.compute(basis_vector(4, 0))
+
+        self.assertGreater(computer.last_resume_column, 0)
+        self.assertNotIn(QuantumComputer.circuit_key(d), QuantumComputer.UNITARY_CACHE)
+        np.testing.assert_allclose(result, reference_unitary(d)[:, 0], atol=1e-10)
+
+    def test_checkpoints_stay_within_budget(self):
+        d = build_random_circuit(self.NUM_QUBITS, self.DEPTH, 64)
+        state_bytes = 2 ** self.NUM_QUBITS * 16
+        original_budget = QuantumComputer.PREFIX_STATES_MAX_BYTES
+        try:
+            QuantumComputer.PREFIX_STATES_MAX_BYTES = 3 * state_bytes
+            computer = QuantumComputer(d, track_prefix_states=True)
+        finally:
+            QuantumComputer.PREFIX_STATES_MAX_BYTES = original_budget
+
+        result = computer.compute(basis_vector(self.NUM_QUBITS, 1))
+
+        self.assertEqual(3, len(computer._prefix_states.checkpoints))
+        self.assertLessEqual(computer._prefix_states.nbytes, 3 * state_bytes)
+        np.testing.assert_allclose(result, self._expected(d, 1), atol=1e-10)
+
+
+class BasisInputTest(unittest.TestCase):
+
+    @staticmethod
+    def build_late_branching_circuit(num_qubits: int) -> CircuitDefinition:
+        """X, CNOT and phase gates for a few time steps, then H on every qubit"""
+        d = CircuitDefinition(num_qubits)
+        d.set_operation(0, 0, OperationType.X)
+        d.set_operation(1, 0, OperationType.T)
+        d.set_multi_operation(1, 0, 1, MultiOperationType.CNOT)
+        d.set_multi_operation(num_qubits - 1, 1, 2, MultiOperationType.CZ)
+        d.set_operation(0, 2, OperationType.S)
+        for qubit in range(num_qubits):
+            d.set_operation(qubit, 3, OperationType.H)
+            d.set_operation(qubit, 4, OperationType.MEASURE)
+        return d
+
+    @parameterized.expand([
+        (SimulationBackend.AUTO, 3, 0),
+        (SimulationBackend.AUTO, 5, 1),
+        (SimulationBackend.DENSE, 4, 2),
+        (SimulationBackend.SPARSE, 4, 3),
+        (SimulationBackend.MPS, 4, 4),
+        (SimulationBackend.DECISION_DIAGRAM, 4, 5),
+    ])
+    def test_index_input_matches_state_vector(self, backend: SimulationBackend, num_qubits: int, seed: int):
+        d = build_random_circuit(num_qubits, 8, seed)
+        index = 2 ** num_qubits - 3
+
+        result = QuantumComputer(d, backend=backend).compute(index)
+
+        np.testing.assert_allclose(reference_unitary(d)[:, index], result, atol=1e-10)
+
+    def test_basis_state_is_tracked_until_first_branching_gate(self):
+        d = self.build_late_branching_circuit(4)
+        computer = QuantumComputer(d)
+
+        column, state = computer._basis_prefix(0b0100, computer._convert_operations_list()[:-1])
+
+        self.assertEqual(3, column)
+        self.assertEqual(0b1000, state.index)
+        np.testing.assert_allclose(reference_unitary(d)[:, 0b0100], computer.compute(0b0100), atol=1e-10)
+
+    def test_global_phase_of_input_is_kept(self):
+        d = self.build_late_branching_circuit(3)
+        start = np.zeros(8, dtype=complex)
+        start[0b010] = 1j
+
+        np.testing.assert_allclose(reference_unitary(d) @ start, QuantumComputer(d).compute(start), atol=1e-10)
+
+    def test_incremental_computer_takes_index(self):
+        d = self.build_late_branching_circuit(4)
+        computer = QuantumComputer(d, track_prefix_states=True)
+
+        first = computer.compute(0b0011)
+        d.set_operation(2, 4, OperationType.T)
+        d.set_operation(2, 5, OperationType.MEASURE)
+        second = computer.compute(0b0011)
+
+        np.testing.assert_allclose(reference_unitary(d)[:, 0b0011], second, atol=1e-10)
+        self.assertFalse(np.allclose(first, second))
+
+
+class RealStateTest(unittest.TestCase):
+
+    REAL_GATES = [OperationType.H, OperationType.X, OperationType.Z]
+    REAL_MULTI_GATES = [MultiOperationType.CNOT, MultiOperationType.CZ, MultiOperationType.SWAP]
+
+    @parameterized.expand([
+        (3, 8, 0, True, True),
+        (5, 12, 1, True, False),
+        (6, 12, 2, False, True),
+        (6, 16, 3, False, False),
+    ])
+    def test_real_circuit_runs_in_float64(self, num_qubits: int, depth: int, seed: int, fuse: bool, accumulate: bool):
+        d = build_random_circuit(num_qubits, depth, seed, single_gates=self.REAL_GATES, multi_gates=self.REAL_MULTI_GATES)
+        computer = QuantumComputer(d, fuse_gates=fuse, accumulate_phases=accumulate, backend=SimulationBackend.DENSE)
+
+        result = computer.compute(basis_vector(num_qubits, 3))
+        batch = computer.compute_batch([0, 3])
+
+        self.assertEqual(np.float64, result.dtype)
+        self.assertEqual(np.float64, batch.dtype)
+        np.testing.assert_allclose(reference_unitary(d)[:, 3], result, atol=1e-10)
+        np.testing.assert_allclose(result, batch[1], atol=1e-10)
+
+    @parameterized.expand([
+        (OperationType.Y,),
+        (OperationType.S,),
+        (OperationType.T,),
+        (OperationType.T_dg,),
+    ])
+    def test_switches_to_complex_at_first_complex_gate(self, operation_type: OperationType):
+        d = build_random_circuit(4, 10, 4, single_gates=self.REAL_GATES, multi_gates=self.REAL_MULTI_GATES)
+        d.drop_operation(2, 5)
+        d.set_operation(2, 5, operation_type)
+
+        result = QuantumComputer(d, backend=SimulationBackend.DENSE).compute(0b0110)
+
+        self.assertEqual(np.complex128, result.dtype)
+        np.testing.assert_allclose(reference_unitary(d)[:, 0b0110], result, atol=1e-10)
+
+    def test_controlled_s_switches_to_complex(self):
+        d = CircuitDefinition(2)
+        d.set_operation(0, 0, OperationType.H)
+        d.set_operation(1, 0, OperationType.H)
+        d.set_multi_operation(1, 0, 1, MultiOperationType.CS)
+        d.set_operation(0, 2, OperationType.MEASURE)
+
+        result = QuantumComputer(d, fuse_gates=False, accumulate_phases=False, backend=SimulationBackend.DENSE).compute(0)
+
+        np.testing.assert_allclose(reference_unitary(d)[:, 0], result, atol=1e-10)
+        self.assertEqual(np.complex128, result.dtype)
+
+    def test_complex_input_stays_complex(self):
+        d = build_random_circuit(3, 6, 5, single_gates=self.REAL_GATES, multi_gates=self.REAL_MULTI_GATES)
+        computer = QuantumComputer(d, backend=SimulationBackend.DENSE)
+        start = np.full(8, 1 / np.sqrt(8), dtype=complex)
+
+        self.assertEqual(np.float64, computer.compute(start).dtype)
+        start[1] *= 1j
+        result = computer.compute(start)
+        self.assertEqual(np.complex128, result.dtype)
+        np.testing.assert_allclose(reference_unitary(d) @ start, result, atol=1e-10)
+
+
+class SinglePrecisionTest(unittest.TestCase):
+
+    @parameterized.expand([
+        (3, 8, 0, True),
+        (5, 12, 1, False),
+        (6, 16, 2, True),
+    ])
+    def test_matches_reference_unitary(self, num_qubits: int, depth: int, seed: int, fuse: bool):
+        d = build_random_circuit(num_qubits, depth, seed)
+        computer = QuantumComputer(d, fuse_gates=fuse, precision="single")
+
+        result = computer.compute(5)
+
+        self.assertIn(result.dtype, (np.complex64, np.float32))
+        np.testing.assert_allclose(reference_unitary(d)[:, 5], result, atol=1e-5)
+        self.assertLess(computer.last_norm_drift, 1e-5)
+
+    def test_real_circuit_runs_in_float32(self):
+        d = build_random_circuit(5, 12, 3, single_gates=RealStateTest.REAL_GATES, multi_gates=RealStateTest.REAL_MULTI_GATES)
+        computer = QuantumComputer(d, backend=SimulationBackend.DENSE, precision="single")
+
+        self.assertEqual(np.float32, computer.compute(3).dtype)
+        self.assertEqual(np.float32, computer.compute_batch([0, 3]).dtype)
+
+    def test_batch_and_measurement(self):
+        d = build_random_circuit(4, 10, 4)
+        double = QuantumComputer(d)
+        single = QuantumComputer(d, precision="single")
+
+        np.testing.assert_allclose(double.compute_batch([0, 6]), single.compute_batch([0, 6]), atol=1e-5)
+        self.assertLess(single.last_norm_drift, 1e-5)
+        expected = double.probabilities(6)
+        actual = single.probabilities(6)
+        self.assertEqual(set(expected), set(actual))
+        for outcome, probability in expected.items():
+            self.assertAlmostEqual(probability, actual[outcome], places=5)
+        self.assertEqual(50, sum(single.sample(6, 50, seed=2).values()))
+
+    def test_phase_vectors_in_state_precision(self):
+        cache = LRUCache()
+        gates = [SingleQubitInstruction(qubit, QuantumComputer.SINGLE_MAPPINGS[operation_type], operation_type)
+                 for qubit, operation_type in [(0, OperationType.T), (1, OperationType.S), (2, OperationType.Z)]]
+        instruction = PhaseInstruction(3, gates, cache)
+        state = np.full((2, 2, 2), 1 / np.sqrt(8))
+
+        single = instruction.apply(state.astype(np.complex64))
+        double = instruction.apply(state.astype(np.complex128))
+
+        self.assertEqual(np.complex64, single.dtype)
+        np.testing.assert_allclose(double, single, atol=1e-6)
+        # the vectors of both precisions are kept apart, so neither run gets the other's
+        self.assertEqual(2, len(cache))
+        self.assertEqual(np.complex128, instruction.phases.dtype)
+
+    def test_double_precision_has_no_norm_drift(self):
+        computer = QuantumComputer(build_random_circuit(3, 6, 5))
+
+        self.assertIn(computer.compute(1).dtype, (np.complex128, np.float64))
+        self.assertIsNone(computer.last_norm_drift)
+
+    def test_invalid_precision(self):
+        d = build_random_circuit(3, 6, 6)
+
+        self.assertRaises(ValueError, lambda: QuantumComputer(d, precision="half"))
+        self.assertRaises(ValueError, lambda: QuantumComputer(d, backend=SimulationBackend.MPS, precision="single"))
+
+
+class SamplingTest(unittest.TestCase):
+
+    @staticmethod
+    def _bell_circuit(measured: list[int]) -> CircuitDefinition:
+        d = CircuitDefinition(3)
+        d.set_operation(0, 0, OperationType.H)
+        d.set_multi_operation(1, 0, 1, MultiOperationType.CNOT)
+        d.set_operation(2, 1, OperationType.X)
+        for qubit in measured:
+            d.set_operation(qubit, 2, OperationType.MEASURE)
+        return d
+
+    def test_measured_qubits_come_from_last_time_step(self):
+        computer = QuantumComputer(self._bell_circuit([2, 0]))
+
+        self.assertEqual([0, 2], computer.measured_qubits())
+
+    def test_counts_cover_all_shots(self):
+        computer = QuantumComputer(self._bell_circuit([0, 1, 2]))
+
+        counts = computer.sample(basis_vector(3, 0), 10000, seed=1)
+
+        self.assertEqual({"001", "111"}, set(counts))
+        self.assertEqual(10000, sum(counts.values()))
+        self.assertAlmostEqual(0.5, counts["001"] / 10000, delta=0.03)
+
+    def test_only_measured_qubits_are_sampled(self):
+        computer = QuantumComputer(self._bell_circuit([1, 2]))
+
+        counts = computer.sample(basis_vector(3, 0), 1000, seed=2)
+
+        self.assertEqual({"01", "11"}, set(counts))
+
+    def test_same_seed_gives_same_samples(self):
+        d = build_random_circuit(5, 10, 70)
+        computer = QuantumComputer(d)
+
+        first = computer.sample(basis_vector(5, 0), 5000, seed=3)
+        second = computer.sample(basis_vector(5, 0), 5000, seed=3)
+
+        self.assertEqual(first, second)
+
+    def test_samples_follow_probabilities(self):
+        d = build_random_circuit(4, 10, 71)
+        computer = QuantumComputer(d)
+        shots = 200000
+
+        counts = computer.sample(basis_vector(4, 0), shots, seed=4)
+
+        probabilities = np.abs(computer.compute(basis_vector(4, 0))) ** 2
+        frequencies = np.array([counts.get(format(i, "04b"), 0) for i in range(16)]) / shots
+        np.testing.assert_allclose(frequencies, probabilities, atol=0.01)
+
+    def test_no_measure_gates_throws(self):
+        d = CircuitDefinition(2)
+        d.set_operation(0, 0, OperationType.H)
+        d.set_operation(1, 1, OperationType.X)
+
+        self.assertRaises(ValueError, lambda: QuantumComputer(d).sample(basis_vector(2, 0), 10))
+
+
+@unittest.skipUnless(sparse.is_available(), "scipy is not installed")
+class SparseBackendTest(unittest.TestCase):
+
+    @parameterized.expand([
+        (3, 10, 50, True),
+        (5, 14, 51, True),
+        (5, 14, 51, False),
+        (7, 16, 52, False),
+    ])
+    def test_matches_dense_reference(self, num_qubits: int, depth: int, seed: int, fuse: bool):
+        d = build_random_circuit(num_qubits, depth, seed)
+        unitary = reference_unitary(d)
+        computer = QuantumComputer(d, fuse_gates=fuse, backend=SimulationBackend.SPARSE)
+
+        np.testing.assert_allclose(computer.compute(basis_vector(num_qubits, 2)), unitary[:, 2], atol=1e-10)
+        np.testing.assert_allclose(computer.compute_batch([0, 1]), unitary[:, [0, 1]].T, atol=1e-10)
+
+    def test_cnot_step_has_one_non_zero_per_row(self):
+        d = CircuitDefinition(6)
+        d.set_multi_operation(4, 1, 0, MultiOperationType.CNOT)
+        d.set_operation(0, 1, OperationType.MEASURE)
+        gates = QuantumComputer(d).compile().gates
+
+        operators = sparse.step_operators(gates, 6)
+
+        self.assertEqual(1, len(operators))
+        self.assertEqual(64, operators[0].nnz)
+
+    def test_step_operators_stay_sparse(self):
+        d = CircuitDefinition(5)
+        for qubit in range(5):
+            d.set_operation(qubit, 0, OperationType.H)
+        d.set_operation(0, 1, OperationType.MEASURE)
+        gates = QuantumComputer(d, fuse_gates=False).compile().gates
+
+        operators = sparse.step_operators(gates, 5)
+
+        self.assertEqual(2, len(operators))
+        for operator in operators:
+            self.assertLessEqual(operator.nnz, 32 * sparse.MAX_NON_ZEROS_PER_ROW)
+
+
+if __name__ == '__main__':
+    unittest.main()
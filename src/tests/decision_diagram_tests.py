@@ -0,0 +1,91 @@
+import unittest
+
+import numpy as np
+from parameterized import parameterized
+
+from base.compute import QuantumComputer, SimulationBackend
+from base.decision_diagram import DecisionDiagram
+from base.models import CircuitDefinition, OperationType, MultiOperationType
+from tests.compute_tests import build_random_circuit
+
+
+class DecisionDiagramBackendTest(unittest.TestCase):
+
+    @parameterized.expand([
+        (2, 6, 0),
+        (3, 8, 1),
+        (4, 10, 2),
+        (5, 12, 3),
+        (6, 12, 4),
+    ])
+    def test_matches_dense(self, num_qubits: int, depth: int, seed: int):
+        d = build_random_circuit(num_qubits, depth, seed)
+        rng = np.random.default_rng(seed)
+        start = rng.normal(size=2 ** num_qubits) + 1j * rng.normal(size=2 ** num_qubits)
+        start /= np.linalg.norm(start)
+
+        expected = QuantumComputer(d, backend=SimulationBackend.DENSE).compute(start)
+        actual = QuantumComputer(d, backend=SimulationBackend.DECISION_DIAGRAM).compute(start)
+
+        np.testing.assert_allclose(expected, actual, atol=1e-10)
+
+    @parameterized.expand([
+        (3, 8, 10, [0, 2], 3),
+        (5, 8, 11, [1, 2, 4], 20),
+        (6, 10, 12, [0, 1, 2, 3, 4, 5], 33),
+    ])
+    def test_matches_dense_probabilities(self, num_qubits: int, depth: int, seed: int, measured: list[int], index: int):
+        d = build_random_circuit(num_qubits, depth, seed)
+        for qubit in range(num_qubits):
+            if qubit not in measured:
+                d.drop_operation(qubit, depth)
+
+        expected = QuantumComputer(d, backend=SimulationBackend.DENSE).probabilities(index)
+        actual = QuantumComputer(d, backend=SimulationBackend.DECISION_DIAGRAM).probabilities(index)
+
+        self.assertEqual(set(expected), set(actual))
+        for outcome, probability in expected.items():
+            self.assertAlmostEqual(probability, actual[outcome], places=10)
+            self.assertIs(float, type(actual[outcome]))
+
+    def test_uniform_superposition_has_one_node_per_qubit(self):
+        num_qubits = 100
+        d = CircuitDefinition(num_qubits)
+        for qubit in range(num_qubits):
+            d.set_operation(qubit, 0, OperationType.H)
+        d.set_operation(0, 1, OperationType.MEASURE)
+
+        computer = QuantumComputer(d, backend=SimulationBackend.DECISION_DIAGRAM)
+        probabilities = computer.probabilities(0)
+
+        self.assertEqual(num_qubits, computer.last_node_count)
+        self.assertAlmostEqual(0.5, probabilities["0"], places=10)
+        self.assertAlmostEqual(0.5, probabilities["1"], places=10)
+
+    def test_ghz_state_on_many_qubits(self):
+        num_qubits = 100
+        d = CircuitDefinition(num_qubits)
+        d.set_operation(0, 0, OperationType.H)
+        for qubit in range(1, num_qubits):
+            d.set_multi_operation(qubit, qubit - 1, qubit, MultiOperationType.CNOT)
+        for qubit in range(num_qubits):
+            d.set_operation(qubit, num_qubits, OperationType.MEASURE)
+
+        computer = QuantumComputer(d, backend=SimulationBackend.DECISION_DIAGRAM)
+        probabilities = computer.probabilities(0)
+        counts = computer.sample(0, 1000, seed=1)
+
+        # the two branches of the GHZ state only share the terminal
+        self.assertEqual(1 + 2 * (num_qubits - 1), computer.last_node_count)
+        self.assertEqual({"0" * num_qubits, "1" * num_qubits}, set(probabilities))
+        self.assertAlmostEqual(0.5, probabilities["1" * num_qubits], places=10)
+        self.assertEqual(1000, sum(counts.values()))
+
+    def test_equal_sub_states_share_nodes(self):
+        state = np.array([1, 1j, 2, 2j, 0, 0, -1, -1j], dtype=complex)
+
+        diagram = DecisionDiagram.from_state_vector(state)
+
+        # the pairs (1, i), (2, 2i) and (-1, -i) are all the same node
+        self.assertEqual(4, diagram.node_count)
+        np.testing.assert_allclose(state, diagram.to_state_vector())
@@ -0,0 +1,152 @@
+import unittest
+
+import numpy as np
+from parameterized import parameterized
+
+from base.compute import QuantumComputer, SimulationBackend
+from base.factorization import ProductDistribution, SubsystemState, interaction_groups
+from base.models import CircuitDefinition, OperationType, MultiOperationType
+from tests.compute_tests import build_random_circuit
+
+
+def build_block_circuit(num_blocks: int, block_size: int, layers: int, seed: int) -> CircuitDefinition:
+    """Random single-qubit gates and CNOT chains within blocks of neighbouring qubits, but never between blocks"""
+    rng = np.random.default_rng(seed)
+    single = [OperationType.H, OperationType.T, OperationType.S, OperationType.X]
+    d = CircuitDefinition(num_blocks * block_size)
+    for layer in range(layers):
+        for qubit in range(num_blocks * block_size):
+            d.set_operation(qubit, 3 * layer, single[rng.integers(len(single))])
+        for block in range(num_blocks):
+            for offset in [0, 1]:
+                for qubit in range(block * block_size + offset, (block + 1) * block_size - 1, 2):
+                    d.set_multi_operation(qubit + 1, qubit, 3 * layer + 1 + offset, MultiOperationType.CNOT)
+    for qubit in range(num_blocks * block_size):
+        d.set_operation(qubit, 3 * layers, OperationType.MEASURE)
+    return d
+
+
+class FactorizationTest(unittest.TestCase):
+
+    def test_groups_follow_multi_qubit_gates(self):
+        d = CircuitDefinition(6)
+        d.set_multi_operation(0, 3, 0, MultiOperationType.CNOT)
+        d.set_multi_operation(3, 5, 1, MultiOperationType.CZ)
+        d.set_multi_operation(1, 2, 1, MultiOperationType.SWAP)
+        d.set_operation(4, 0, OperationType.H)
+        computer = QuantumComputer(d)
+
+        groups = interaction_groups(6, computer._lower_operations(computer._convert_operations_list()))
+
+        self.assertEqual([[0, 3, 5], [1, 2], [4]], groups)
+
+    @parameterized.expand([
+        (2, 3, 3, 0, [0, 1, 2, 3, 4, 5], 0),
+        (3, 2, 4, 1, [1, 2, 5], 9),
+        (2, 4, 3, 2, [0, 7], 200),
+    ])
+    def test_matches_dense_probabilities(self, num_blocks: int, block_size: int, layers: int, seed: int, measured: list[int], index: int):
+        d = build_block_circuit(num_blocks, block_size, layers, seed)
+        for qubit in range(num_blocks * block_size):
+            if qubit not in measured:
+                d.drop_operation(qubit, 3 * layers)
+
+        expected = QuantumComputer(d, backend=SimulationBackend.DENSE).probabilities(index)
+        actual = QuantumComputer(d).probabilities(index)
+
+        self.assertEqual(set(expected), set(actual))
+        for outcome, probability in expected.items():
+            self.assertAlmostEqual(probability, actual[outcome], places=10)
+
+    def test_circuit_without_multi_qubit_gates(self):
+        d = build_random_circuit(5, 8, 3, multi_probability=0)
+        distribution = QuantumComputer(d).factorized_probabilities(6)
+        expected = QuantumComputer(d, backend=SimulationBackend.DENSE).probabilities(6)
+
+        self.assertEqual(5, len(distribution.factors))
+        for outcome, probability in expected.items():
+            self.assertAlmostEqual(probability, distribution.probability(outcome), places=10)
+
+    def test_independent_blocks_on_many_qubits(self):
+        d = build_block_circuit(10, 4, 4, 5)
+        computer = QuantumComputer(d)
+
+        distribution = computer.factorized_probabilities(0)
+        counts = computer.sample(0, 1000, seed=2)
+
+        self.assertEqual(10, len(distribution.factors))
+        self.assertGreater(len(distribution), ProductDistribution.MAX_LISTED_OUTCOMES)
+        self.assertAlmostEqual(1, sum(probability for _, probability in distribution.factors[0][1]), places=10)
+        self.assertEqual(1000, sum(counts.values()))
+        for outcome in counts:
+            self.assertGreater(distribution.probability(outcome), 0)
+        self.assertRaises(ValueError, lambda: computer.probabilities(0))
+
+    def test_unmeasured_groups_are_left_out(self):
+        d = build_block_circuit(3, 2, 2, 6)
+        for qubit in [0, 1, 4, 5]:
+            d.drop_operation(qubit, 6)
+
+        distribution = QuantumComputer(d).factorized_probabilities(0)
+
+        self.assertEqual(1, len(distribution.factors))
+        self.assertEqual([0, 1], distribution.factors[0][0])
+
+
+class SubsystemStateTest(unittest.TestCase):
+
+    @parameterized.expand([
+        (2, 6, 0, 0),
+        (3, 8, 1, 5),
+        (5, 10, 2, 17),
+        (6, 12, 3, 40),
+    ])
+    def test_matches_dense(self, num_qubits: int, depth: int, seed: int, index: int):
+        d = build_random_circuit(num_qubits, depth, seed)
+        computer = QuantumComputer(d)
+        start = np.zeros(2 ** num_qubits, dtype=complex)
+        start[index] = 1
+
+        state = computer.simulate_subsystems(index)
+
+        np.testing.assert_allclose(QuantumComputer(d, backend=SimulationBackend.DENSE).compute(start), state.to_state_vector(), atol=1e-10)
+
+    @parameterized.expand([
+        (4, 8, 4, [0, 3], 5),
+        (5, 10, 5, [4, 1, 2], 20),
+        (6, 8, 6, [5, 0, 3, 2], 33),
+    ])
+    def test_marginals_match_dense(self, num_qubits: int, depth: int, seed: int, measured: list[int], index: int):
+        d = build_random_circuit(num_qubits, depth, seed, multi_probability=0.15)
+        for qubit in range(num_qubits):
+            if qubit not in measured:
+                d.drop_operation(qubit, depth)
+
+        expected = QuantumComputer(d, backend=SimulationBackend.DENSE).probabilities(index)
+        distribution = QuantumComputer(d).factorized_probabilities(index)
+
+        self.assertAlmostEqual(1, sum(probability for _, probability in distribution.items()), places=10)
+        for outcome, probability in expected.items():
+            self.assertAlmostEqual(probability, distribution.probability(outcome), places=10)
+
+    def test_subsystems_merge_at_first_interaction(self):
+        d = build_block_circuit(3, 4, 3, 7)
+        # a single gate at the end joins the first two blocks
+        d.drop_operation(3, 9)
+        d.drop_operation(4, 9)
+        d.set_multi_operation(4, 3, 9, MultiOperationType.CZ)
+        d.set_operation(0, 10, OperationType.MEASURE)
+        computer = QuantumComputer(d)
+
+        state = computer.simulate_subsystems(0)
+
+        self.assertEqual(8, computer.last_peak_subsystem_size)
+        self.assertEqual([list(range(8)), list(range(8, 12))], sorted(sorted(qubits) for qubits, _ in state.subsystems))
+        self.assertEqual(2 ** 12, len(state.to_state_vector()))
+
+    def test_idle_qubits_stay_separate(self):
+        state = SubsystemState(3, 0b101)
+
+        self.assertEqual(1, state.peak_size)
+        self.assertEqual(3, len(state.subsystems))
+        np.testing.assert_allclose(np.eye(8)[0b101], state.to_state_vector())
@@ -0,0 +1,100 @@
+import unittest
+
+import numpy as np
+from parameterized import parameterized
+
+from base.compute import QuantumComputer
+from base.hybrid import HybridCircuit, fuse_within_blocks, split_gate
+from base.kernels import SWAP_MATRIX, controlled_matrix
+from base.models import CircuitDefinition, OperationType, MultiOperationType
+from tests.compute_tests import build_random_circuit, reference_unitary
+
+
+class HybridCircuitTest(unittest.TestCase):
+
+    @parameterized.expand([
+        (2, 6, 0, 1, True),
+        (3, 8, 1, 1, False),
+        (4, 8, 2, 2, True),
+        (5, 6, 3, 3, False),
+        (6, 6, 4, None, True),
+    ])
+    def test_matches_unitary(self, num_qubits: int, depth: int, seed: int, cut: int | None, fuse: bool):
+        d = build_random_circuit(num_qubits, depth, seed)
+        unitary = reference_unitary(d)
+        start = seed % 2 ** num_qubits
+        outputs = list(range(2 ** num_qubits))
+
+        amplitudes = QuantumComputer(d, fuse_gates=fuse).hybrid_amplitudes(outputs, start, cut=cut, workers=1)
+
+        np.testing.assert_allclose(unitary[:, start], amplitudes, atol=1e-10)
+
+    @parameterized.expand([
+        ("cnot", controlled_matrix(QuantumComputer.SINGLE_MAPPINGS[OperationType.X]), 2),
+        ("cs", controlled_matrix(QuantumComputer.SINGLE_MAPPINGS[OperationType.S]), 2),
+        ("swap", SWAP_MATRIX, 4),
+    ])
+    def test_split_gate(self, _, matrix: np.ndarray, terms: int):
+        split = split_gate(matrix)
+
+        self.assertEqual(terms, len(split))
+        np.testing.assert_allclose(matrix, sum(np.kron(left, right) for left, right in split), atol=1e-12)
+
+    def test_parallel_paths_match_serial_paths(self):
+        # 16 paths across the cut after qubit 3
+        d = build_random_circuit(6, 8, 7, multi_probability=0.1)
+        computer = QuantumComputer(d)
+        outputs = list(range(0, 64, 5))
+        serial = computer.hybrid_amplitudes(outputs, 3, cut=3, workers=1)
+
+        original_min_paths = HybridCircuit.PARALLEL_MIN_PATHS
+        try:
+            HybridCircuit.PARALLEL_MIN_PATHS = 2
+            parallel = computer.hybrid_amplitudes(outputs, 3, cut=3, workers=2)
+        finally:
+            HybridCircuit.PARALLEL_MIN_PATHS = original_min_paths
+
+        np.testing.assert_allclose(serial, parallel, atol=1e-12)
+
+    def test_best_cut_avoids_entangling_gates(self):
+        # two separate GHZ states on qubits 0-4 and 5-9, joined by a single CNOT
+        d = CircuitDefinition(10)
+        d.set_operation(0, 0, OperationType.H)
+        d.set_operation(5, 0, OperationType.H)
+        for qubit in range(1, 10):
+            if qubit != 5:
+                d.set_multi_operation(qubit, qubit - 1, qubit, MultiOperationType.CNOT)
+        d.set_multi_operation(5, 4, 10, MultiOperationType.CNOT)
+        d.set_operation(0, 11, OperationType.MEASURE)
+        computer = QuantumComputer(d)
+        gates = computer._lower_operations(computer._convert_operations_list()[:-1])
+
+        circuit = HybridCircuit(10, gates)
+
+        self.assertEqual(5, circuit.cut)
+        self.assertEqual(2, circuit.num_paths)
+        unitary = reference_unitary(d)
+        outputs = [0, 0b1111100000, 0b0000011111, 0b1111111111, 0b1111000000]
+        np.testing.assert_allclose(unitary[outputs, 0], circuit.amplitudes(outputs, 0, workers=1), atol=1e-12)
+
+    def test_fusion_keeps_gates_across_the_cut(self):
+        d = CircuitDefinition(2)
+        d.set_operation(0, 0, OperationType.H)
+        d.set_operation(1, 0, OperationType.T)
+        d.set_multi_operation(1, 0, 1, MultiOperationType.CNOT)
+        d.set_multi_operation(1, 0, 2, MultiOperationType.CZ)
+        d.set_operation(0, 3, OperationType.MEASURE)
+        computer = QuantumComputer(d)
+        gates = computer._lower_operations(computer._convert_operations_list()[:-1])
+
+        fused = fuse_within_blocks(gates, 1)
+
+        # a CNOT and CZ fused into one block would have 4 terms
+        self.assertEqual(4, HybridCircuit(2, fused, 1).num_paths)
+        np.testing.assert_allclose(reference_unitary(d)[:, 0], computer.hybrid_amplitudes(range(4), 0, workers=1), atol=1e-12)
+
+    def test_rejects_empty_block(self):
+        d = build_random_circuit(3, 4, 6)
+        computer = QuantumComputer(d)
+
+        self.assertRaises(ValueError, lambda: computer.hybrid_amplitudes([0], 0, cut=3))
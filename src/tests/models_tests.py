@@ -222,6 +222,22 @@ class BuildDefinitionTest(unittest.TestCase):
         d = CircuitDefinition(5)
         self.assertRaises(ValueError, lambda: d.next_nop(0, time_slots))
 
+    def test_version_changes_on_every_edit(self):
+        d = CircuitDefinition(3)
+        versions = [d.version]
+        d.next_operation(0, OperationType.H)
+        versions.append(d.version)
+        d.set_multi_operation(1, 0, 1, MultiOperationType.CNOT)
+        versions.append(d.version)
+        d.drop_operation(1, 1)
+        versions.append(d.version)
+        d.add_qubit()
+        versions.append(d.version)
+        d.remove_qubit(3)
+        versions.append(d.version)
+
+        self.assertEqual(len(versions), len(set(versions)))
+
 
 class QBitOperationsTest(unittest.TestCase):
     def test_to_string(self):
@@ -0,0 +1,90 @@
+import unittest
+
+import numpy as np
+from parameterized import parameterized
+
+from base.compute import QuantumComputer, SimulationBackend
+from base.mps import MatrixProductState
+from tests.compute_tests import build_ghz_circuit, build_random_circuit
+
+
+class MPSBackendTest(unittest.TestCase):
+
+    @parameterized.expand([
+        (2, 6, 0, True),
+        (3, 8, 1, False),
+        (4, 10, 2, True),
+        (5, 12, 3, False),
+        (6, 12, 4, True),
+        (7, 10, 5, True),
+    ])
+    def test_matches_dense(self, num_qubits: int, depth: int, seed: int, fuse: bool):
+        d = build_random_circuit(num_qubits, depth, seed)
+        rng = np.random.default_rng(seed)
+        start = rng.normal(size=2 ** num_qubits) + 1j * rng.normal(size=2 ** num_qubits)
+        start /= np.linalg.norm(start)
+
+        expected = QuantumComputer(d, backend=SimulationBackend.DENSE).compute(start)
+        computer = QuantumComputer(d, fuse_gates=fuse, backend=SimulationBackend.MPS)
+
+        np.testing.assert_allclose(expected, computer.compute(start), atol=1e-10)
+        self.assertAlmostEqual(0, computer.last_discarded_weight, places=10)
+
+    @parameterized.expand([
+        (3, 8, 10, [0, 2], 3),
+        (5, 8, 11, [1, 2, 4], 20),
+        (6, 10, 12, [0, 1, 2, 3, 4, 5], 33),
+    ])
+    def test_matches_dense_probabilities(self, num_qubits: int, depth: int, seed: int, measured: list[int], index: int):
+        d = build_random_circuit(num_qubits, depth, seed)
+        for qubit in range(num_qubits):
+            if qubit not in measured:
+                d.drop_operation(qubit, depth)
+
+        expected = QuantumComputer(d, backend=SimulationBackend.DENSE).probabilities(index)
+        actual = QuantumComputer(d, backend=SimulationBackend.MPS).probabilities(index)
+
+        self.assertEqual(set(expected), set(actual))
+        for outcome, probability in expected.items():
+            self.assertAlmostEqual(probability, actual[outcome], places=10)
+
+    def test_ghz_state_on_many_qubits(self):
+        num_qubits = 50
+        d = build_ghz_circuit(num_qubits)
+
+        computer = QuantumComputer(d, backend=SimulationBackend.MPS)
+        probabilities = computer.probabilities(0)
+        counts = computer.sample(0, 1000, seed=1)
+
+        self.assertEqual({"0" * num_qubits, "1" * num_qubits}, set(probabilities))
+        self.assertAlmostEqual(0.5, probabilities["0" * num_qubits], places=10)
+        self.assertEqual({"0" * num_qubits, "1" * num_qubits}, set(counts))
+        self.assertEqual(1000, sum(counts.values()))
+        self.assertAlmostEqual(0, computer.last_discarded_weight, places=10)
+
+    def test_max_bond_dimension_truncates(self):
+        d = build_ghz_circuit(4)
+
+        computer = QuantumComputer(d, backend=SimulationBackend.MPS, max_bond_dimension=1)
+        probabilities = computer.probabilities(0)
+
+        # cutting the first CNOT of the GHZ state to a product state drops half of the weight
+        self.assertAlmostEqual(0.5, computer.last_discarded_weight, places=10)
+        self.assertEqual(1, len(probabilities))
+        self.assertAlmostEqual(1, sum(probabilities.values()), places=10)
+
+    def test_truncation_threshold_drops_small_weights(self):
+        state = MatrixProductState.from_basis_state(2, 0, truncation_threshold=0.1)
+        angle = 0.2
+        rotation = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]], dtype=complex)
+        state.apply_single_qubit_gate(rotation, 0)
+        controlled_not = np.array([[1, 0, 0, 0], [0, 1, 0, 0], [0, 0, 0, 1], [0, 0, 1, 0]], dtype=complex)
+
+        state.apply_two_qubit_gate(controlled_not, 0, 1)
+
+        self.assertEqual([1], state.bond_dimensions)
+        self.assertAlmostEqual(np.sin(angle) ** 2, state.discarded_weight, places=10)
+        np.testing.assert_allclose([1, 0, 0, 0], np.abs(state.to_state_vector()), atol=1e-10)
+
+    def test_rejects_invalid_bond_dimension(self):
+        self.assertRaises(ValueError, lambda: MatrixProductState.from_basis_state(2, 0, max_bond_dimension=0))
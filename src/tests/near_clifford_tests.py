@@ -0,0 +1,150 @@
+import itertools
+import unittest
+
+import numpy as np
+from parameterized import parameterized
+
+from base.compute import QuantumComputer, SimulationBackend
+from base.models import CircuitDefinition, OperationType, MultiOperationType
+from base.near_clifford import StabilizerSum, count_non_clifford, superposition_size
+from tests.compute_tests import build_random_circuit
+
+
+def build_wide_circuit(num_qubits: int) -> CircuitDefinition:
+    """H T H on qubit 0, copied onto all other qubits by a chain of CNOT gates"""
+    d = CircuitDefinition(num_qubits)
+    d.set_operation(0, 0, OperationType.H)
+    d.set_operation(0, 1, OperationType.T)
+    d.set_operation(0, 2, OperationType.H)
+    for qubit in range(1, num_qubits):
+        d.set_multi_operation(qubit, qubit - 1, qubit + 2, MultiOperationType.CNOT)
+    for qubit in range(num_qubits):
+        d.set_operation(qubit, num_qubits + 2, OperationType.MEASURE)
+    return d
+
+
+def build_superposed_circuit(num_qubits: int, non_clifford: int) -> CircuitDefinition:
+    """H on every qubit, then layers of CNOT ladders with *non_clifford* T gates on the first qubits in between"""
+    d = CircuitDefinition(num_qubits)
+    for qubit in range(num_qubits):
+        d.set_operation(qubit, 0, OperationType.H)
+    for layer in range(3):
+        for qubit in range(1, num_qubits):
+            d.set_multi_operation(qubit, qubit - 1, 1 + 2 * layer, MultiOperationType.CNOT)
+    for qubit in range(non_clifford):
+        d.set_operation(qubit, 2, OperationType.T)
+    for qubit in range(num_qubits):
+        d.set_operation(qubit, 7, OperationType.MEASURE)
+    return d
+
+
+class NearCliffordBackendTest(unittest.TestCase):
+
+    @parameterized.expand([
+        (2, 6, 0, 0),
+        (3, 8, 1, 5),
+        (4, 8, 2, 9),
+        (5, 6, 3, 17),
+        (6, 6, 4, 40),
+    ])
+    def test_amplitudes_match_state_vector(self, num_qubits: int, depth: int, seed: int, index: int):
+        d = build_random_circuit(num_qubits, depth, seed)
+        computer = QuantumComputer(d, backend=SimulationBackend.DENSE)
+        start = np.zeros(2 ** num_qubits, dtype=complex)
+        start[index] = 1
+
+        stabilizer_sum = StabilizerSum(num_qubits, index)
+        for gate in computer._lower_operations(computer._convert_operations_list()[:-1]):
+            stabilizer_sum.apply(gate)
+        bits = np.array(list(itertools.product([False, True], repeat=num_qubits)))
+
+        np.testing.assert_allclose(computer.compute(start), stabilizer_sum.amplitudes(bits), atol=1e-10)
+
+    @parameterized.expand([
+        (3, 8, 10, [0, 1, 2], 3),
+        (4, 10, 11, [1, 3], 6),
+        (5, 8, 12, [0, 2, 4], 20),
+        (6, 6, 13, [5], 33),
+    ])
+    def test_matches_state_vector_probabilities(self, num_qubits: int, depth: int, seed: int, measured: list[int], index: int):
+        d = build_random_circuit(num_qubits, depth, seed)
+        for qubit in range(num_qubits):
+            if qubit not in measured:
+                d.drop_operation(qubit, depth)
+
+        expected = QuantumComputer(d, backend=SimulationBackend.DENSE).probabilities(index)
+        actual = QuantumComputer(d, backend=SimulationBackend.NEAR_CLIFFORD).probabilities(index)
+
+        self.assertEqual(set(expected), set(actual))
+        for outcome, probability in expected.items():
+            self.assertAlmostEqual(probability, actual[outcome], places=10)
+
+    def test_auto_backend_on_many_qubits(self):
+        num_qubits = 60
+        d = build_wide_circuit(num_qubits)
+
+        computer = QuantumComputer(d)
+        probabilities = computer.probabilities(0)
+        counts = computer.sample(0, 1000, seed=1)
+
+        self.assertEqual({"0" * num_qubits, "1" * num_qubits}, set(probabilities))
+        self.assertAlmostEqual((2 + np.sqrt(2)) / 4, probabilities["0" * num_qubits], places=10)
+        self.assertAlmostEqual((2 - np.sqrt(2)) / 4, probabilities["1" * num_qubits], places=10)
+        self.assertEqual({"0" * num_qubits, "1" * num_qubits}, set(counts))
+        self.assertEqual(1000, sum(counts.values()))
+
+    def test_counts_non_clifford_gates(self):
+        d = build_wide_circuit(3)
+        d.set_multi_operation(2, 0, 5, MultiOperationType.CS)
+        d.set_operation(1, 6, OperationType.T_dg)
+        computer = QuantumComputer(d)
+
+        self.assertEqual(3, count_non_clifford(computer._lower_operations(computer._convert_operations_list())))
+
+    def test_rejects_superposition_input(self):
+        d = build_wide_circuit(2)
+
+        computer = QuantumComputer(d, backend=SimulationBackend.NEAR_CLIFFORD)
+
+        self.assertRaises(ValueError, lambda: computer.probabilities([1 / np.sqrt(2), 1 / np.sqrt(2), 0, 0]))
+
+    def test_does_not_compute_state_vectors(self):
+        d = build_wide_circuit(2)
+
+        computer = QuantumComputer(d, backend=SimulationBackend.NEAR_CLIFFORD)
+
+        self.assertRaises(ValueError, lambda: computer.compute([1, 0, 0, 0]))
+
+    def test_superposition_size_of_clifford_part(self):
+        wide = QuantumComputer(build_wide_circuit(20))
+        superposed = QuantumComputer(build_superposed_circuit(8, 3))
+
+        # without the T gate, H H on qubit 0 cancels out
+        self.assertEqual(0, superposition_size(20, 0, wide._lower_operations(wide._convert_operations_list()[:-1])))
+        self.assertEqual(8, superposition_size(8, 0, superposed._lower_operations(superposed._convert_operations_list()[:-1])))
+
+    def test_supports_covering_every_basis_state(self):
+        d = build_superposed_circuit(6, 4)
+
+        expected = QuantumComputer(d, backend=SimulationBackend.DENSE).probabilities(5)
+        actual = QuantumComputer(d, backend=SimulationBackend.NEAR_CLIFFORD).probabilities(5)
+
+        self.assertEqual(set(expected), set(actual))
+        for outcome, probability in expected.items():
+            self.assertAlmostEqual(probability, actual[outcome], places=10)
+
+    def test_auto_backend_uses_state_vector_in_broad_superposition(self):
+        d = build_superposed_circuit(14, 3)
+
+        def refuse(*_):
+            raise AssertionError("The stabilizer sum should not be simulated")
+
+        original_apply = StabilizerSum.apply
+        try:
+            StabilizerSum.apply = refuse
+            probabilities = QuantumComputer(d).probabilities(0)
+        finally:
+            StabilizerSum.apply = original_apply
+
+        self.assertEqual(2 ** 14, len(probabilities))
+        self.assertAlmostEqual(1, sum(probabilities.values()), places=10)
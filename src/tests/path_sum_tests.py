@@ -0,0 +1,67 @@
+import unittest
+
+import numpy as np
+from parameterized import parameterized
+
+from base.compute import QuantumComputer
+from base.models import CircuitDefinition, OperationType, MultiOperationType, QuBitOperationSingleParam
+from base.path_sum import PathSum
+from tests.compute_tests import build_random_circuit, reference_unitary
+
+
+class PathSumTest(unittest.TestCase):
+
+    @parameterized.expand([
+        (2, 6, 0),
+        (3, 8, 1),
+        (4, 10, 2),
+        (5, 8, 3),
+        (6, 6, 4),
+    ])
+    def test_matches_unitary(self, num_qubits: int, depth: int, seed: int):
+        d = build_random_circuit(num_qubits, depth, seed)
+        unitary = reference_unitary(d)
+        start = seed % 2 ** num_qubits
+        computer = QuantumComputer(d)
+
+        amplitudes = [computer.amplitude(start, output, workers=1) for output in range(2 ** num_qubits)]
+
+        np.testing.assert_allclose(unitary[:, start], amplitudes, atol=1e-10)
+
+    def test_parallel_sum_matches_serial_sum(self):
+        d = build_random_circuit(6, 16, 3, single_gates=[OperationType.H, OperationType.T, OperationType.S])
+        computer = QuantumComputer(d)
+        serial = [computer.amplitude(5, output, workers=1) for output in range(4)]
+
+        original_min_paths = PathSum.PARALLEL_MIN_PATHS
+        try:
+            PathSum.PARALLEL_MIN_PATHS = 2
+            parallel = [computer.amplitude(5, output, workers=2) for output in range(4)]
+        finally:
+            PathSum.PARALLEL_MIN_PATHS = original_min_paths
+
+        np.testing.assert_allclose(serial, parallel, atol=1e-12)
+
+    def test_wide_circuit(self):
+        num_qubits = 200
+        d = CircuitDefinition(num_qubits)
+        d.set_operation(0, 0, OperationType.H)
+        for qubit in range(1, num_qubits):
+            d.set_multi_operation(qubit, qubit - 1, qubit, MultiOperationType.CNOT)
+        d.set_operation(0, num_qubits, OperationType.T)
+        d.set_operation(0, num_qubits + 1, OperationType.MEASURE)
+        computer = QuantumComputer(d)
+        all_ones = 2 ** num_qubits - 1
+
+        self.assertAlmostEqual(1 / np.sqrt(2), computer.amplitude(0, 0), places=12)
+        self.assertAlmostEqual(np.exp(np.pi * 1j / 4) / np.sqrt(2), computer.amplitude(0, all_ones), places=12)
+        self.assertEqual(0, computer.amplitude(0, 1))
+
+    def test_only_h_gates_branch(self):
+        d = build_random_circuit(4, 10, 7)
+        computer = QuantumComputer(d)
+        gates = computer._lower_operations(computer._convert_operations_list()[:-1])
+        h_gates = sum(1 for qubit in range(4) for operation in d.operation_schedules[qubit].operations.values()
+                      if isinstance(operation, QuBitOperationSingleParam) and operation.get_type() == OperationType.H)
+
+        self.assertEqual(h_gates, PathSum(4, gates).num_branches)
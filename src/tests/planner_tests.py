@@ -0,0 +1,158 @@
+import tracemalloc
+import unittest
+
+from parameterized import parameterized
+
+from base.compute import QuantumComputer, SimulationBackend
+from base.models import CircuitDefinition, OperationType, MultiOperationType
+from base.planner import CircuitProfile, ExecutionPlanner
+from tests.compute_tests import build_ghz_circuit, build_random_circuit
+from tests.reversible_tests import build_copy_circuit
+from ui.util.validator import UIExecutionValidator
+
+
+class CircuitProfileTest(unittest.TestCase):
+
+    def test_gate_mix(self):
+        profile = CircuitProfile(build_ghz_circuit(5, chain=True))
+
+        self.assertEqual(5, profile.num_qubits)
+        self.assertEqual(5, profile.depth)
+        self.assertEqual(5, profile.num_gates)
+        self.assertEqual(4, profile.num_two_qubit_gates)
+        self.assertFalse(profile.is_reversible)
+        self.assertTrue(profile.is_real)
+        self.assertTrue(CircuitProfile(build_copy_circuit(6)).is_reversible)
+
+    def test_bond_dimensions(self):
+        bonds, gate_bonds = CircuitProfile(build_ghz_circuit(6, chain=True)).bond_dimensions()
+        swaps = CircuitDefinition(4)
+        for time in range(3):
+            swaps.set_multi_operation(3, 0, time, MultiOperationType.SWAP)
+        swaps.set_operation(0, 3, OperationType.MEASURE)
+
+        # every CNOT of the chain crosses one cut once
+        self.assertEqual([2] * 5, bonds)
+        self.assertEqual([2] * 5, gate_bonds)
+        # a bond is never larger than the smaller side of its cut, or than the given limit
+        self.assertEqual([2, 4, 2], CircuitProfile(swaps).bond_dimensions()[0])
+        self.assertEqual([2, 3, 2], CircuitProfile(swaps).bond_dimensions(max_bond_dimension=3)[0])
+
+
+class ExecutionPlannerTest(unittest.TestCase):
+
+    @parameterized.expand([
+        (12, 10, 0, SimulationBackend.DENSE, False),
+        (14, 12, 1, SimulationBackend.DENSE, False),
+        (14, 12, 2, SimulationBackend.AUTO, True),
+    ])
+    def test_dense_estimate_matches_measured_peak(self, num_qubits: int, depth: int, seed: int,
+                                                  backend: SimulationBackend, track_prefix_states: bool):
+        d = build_random_circuit(num_qubits, depth, seed)
+        estimate = ExecutionPlanner().estimate(d, backend, track_prefix_states=track_prefix_states)
+        QuantumComputer.clear_caches()
+        computer = QuantumComputer(d, backend=backend, track_prefix_states=track_prefix_states)
+
+        tracemalloc.start()
+        computer.compute(3)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        self.assertLess(peak / 2, estimate.peak_bytes)
+        self.assertLess(estimate.peak_bytes, 2 * peak)
+
+    def test_estimates_grow_with_the_state(self):
+        planner = ExecutionPlanner()
+        small = planner.estimate(build_ghz_circuit(20, chain=True), SimulationBackend.DENSE)
+        large = planner.estimate(build_ghz_circuit(21, chain=True), SimulationBackend.DENSE)
+        single = planner.estimate(build_ghz_circuit(21, chain=True), SimulationBackend.DENSE, precision="single")
+
+        self.assertAlmostEqual(2, large.peak_bytes / small.peak_bytes, delta=0.1)
+        self.assertGreater(large.seconds, small.seconds)
+        self.assertAlmostEqual(0.5, single.peak_bytes / large.peak_bytes, delta=0.1)
+        self.assertLess(single.seconds, large.seconds)
+
+    def test_unsupported_backends(self):
+        planner = ExecutionPlanner()
+        d = build_ghz_circuit(4, chain=True)
+
+        self.assertFalse(planner.estimate(d, SimulationBackend.STABILIZER).supported)
+        self.assertFalse(planner.estimate(d, SimulationBackend.MPS, precision="single").supported)
+        self.assertTrue(planner.estimate(d, SimulationBackend.MPS).supported)
+        self.assertEqual(len(SimulationBackend) + 2, len(planner.estimates(d)))
+        self.assertRaises(ValueError, lambda: planner.estimate(d, precision="half"))
+        self.assertRaises(ValueError, lambda: ExecutionPlanner(max_bytes=0))
+
+    def test_reversible_circuit_only_needs_the_result(self):
+        estimate = ExecutionPlanner().estimate(build_copy_circuit(24))
+
+        self.assertEqual(2 ** 24 * 8, estimate.peak_bytes)
+
+    def test_plan_within_budget(self):
+        plan = ExecutionPlanner().plan(build_ghz_circuit(10, chain=True))
+
+        self.assertTrue(plan.allowed)
+        self.assertFalse(plan.downgraded)
+        self.assertEqual(SimulationBackend.AUTO, plan.backend)
+        self.assertEqual("double", plan.precision)
+        self.assertTrue(plan.message.startswith("Estimated auto (double)"))
+
+    def test_plan_downgrades_to_single_precision(self):
+        d = build_random_circuit(20, 6, 3)
+        planner = ExecutionPlanner()
+        double = planner.estimate(d, SimulationBackend.DENSE)
+        single = planner.estimate(d, SimulationBackend.DENSE, precision="single")
+
+        plan = ExecutionPlanner(max_bytes=(double.peak_bytes + single.peak_bytes) // 2).plan(d, SimulationBackend.DENSE)
+
+        self.assertTrue(plan.downgraded)
+        self.assertEqual(SimulationBackend.DENSE, plan.backend)
+        self.assertEqual("single", plan.precision)
+        self.assertIn("instead", plan.message)
+
+    def test_downgraded_plan_drops_prefix_states(self):
+        d = build_random_circuit(20, 6, 3)
+        planner = ExecutionPlanner()
+        tracked = planner.estimate(d, SimulationBackend.AUTO, track_prefix_states=True)
+        untracked = planner.estimate(d, SimulationBackend.AUTO)
+
+        plan = ExecutionPlanner(max_bytes=(tracked.peak_bytes + untracked.peak_bytes) // 2).plan(d, track_prefix_states=True)
+
+        self.assertTrue(plan.downgraded)
+        self.assertFalse(plan.track_prefix_states)
+        self.assertEqual((SimulationBackend.AUTO, "double"), (plan.backend, plan.precision))
+        self.assertIn("without keeping intermediate states", plan.message)
+        self.assertTrue(ExecutionPlanner().plan(d, track_prefix_states=True).track_prefix_states)
+
+    def test_plan_refuses_over_budget(self):
+        d = build_ghz_circuit(30, chain=True)
+
+        plan = ExecutionPlanner().plan(d)
+        strict = ExecutionPlanner(max_bytes=10 * 2 ** 22, allow_downgrade=False).plan(build_random_circuit(20, 6, 3))
+
+        self.assertFalse(plan.allowed)
+        self.assertIsNone(plan.backend)
+        self.assertTrue(plan.message.startswith("Refused to simulate"))
+        self.assertFalse(strict.allowed)
+
+
+class UIExecutionValidatorTest(unittest.TestCase):
+
+    def test_shows_the_estimate(self):
+        result = UIExecutionValidator.can_evaluate(build_ghz_circuit(8, chain=True), ExecutionPlanner())
+
+        self.assertTrue(result.success)
+        self.assertTrue(result.plan.allowed)
+        self.assertEqual(result.plan.message, result.message)
+
+    def test_refuses_over_budget(self):
+        result = UIExecutionValidator.can_evaluate(build_ghz_circuit(30, chain=True), ExecutionPlanner())
+
+        self.assertFalse(result.success)
+        self.assertTrue(result.message.startswith("Refused to simulate"))
+
+    def test_without_planner(self):
+        result = UIExecutionValidator.can_evaluate(build_ghz_circuit(30, chain=True))
+
+        self.assertTrue(result.success)
+        self.assertIsNone(result.plan)
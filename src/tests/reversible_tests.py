@@ -0,0 +1,87 @@
+import unittest
+
+import numpy as np
+from parameterized import parameterized
+
+from base.compute import QuantumComputer, SimulationBackend
+from base.models import CircuitDefinition, OperationType, MultiOperationType
+from base.reversible import ReversibleCircuit
+from tests.compute_tests import build_random_circuit, reference_unitary
+
+REVERSIBLE_GATES = [OperationType.X, OperationType.Y, OperationType.Z, OperationType.S, OperationType.T, OperationType.T_dg]
+
+
+def build_copy_circuit(num_qubits: int) -> CircuitDefinition:
+    """X on every even qubit, copied onto the next qubit by a CNOT, so that every qubit ends up as 1"""
+    d = CircuitDefinition(num_qubits)
+    for qubit in range(0, num_qubits - 1, 2):
+        d.set_operation(qubit, 0, OperationType.X)
+        d.set_multi_operation(qubit + 1, qubit, 1, MultiOperationType.CNOT)
+    for qubit in range(num_qubits):
+        d.set_operation(qubit, 2, OperationType.MEASURE)
+    return d
+
+
+class ReversibleCircuitTest(unittest.TestCase):
+
+    @parameterized.expand([
+        (2, 6, 0),
+        (3, 10, 1),
+        (5, 12, 2),
+        (6, 16, 3),
+    ])
+    def test_truth_table_matches_reference_unitary(self, num_qubits: int, depth: int, seed: int):
+        d = build_random_circuit(num_qubits, depth, seed, single_gates=REVERSIBLE_GATES, multi_probability=0.4)
+        unitary = reference_unitary(d)
+
+        outputs, phases = QuantumComputer(d).truth_table()
+
+        expected = np.zeros((2 ** num_qubits, 2 ** num_qubits), dtype=complex)
+        expected[outputs, np.arange(2 ** num_qubits)] = phases
+        np.testing.assert_allclose(unitary, expected, atol=1e-10)
+
+    @parameterized.expand([
+        (3, 8, 4, 5),
+        (6, 12, 5, 41),
+    ])
+    def test_matches_dense_backend(self, num_qubits: int, depth: int, seed: int, index: int):
+        d = build_random_circuit(num_qubits, depth, seed, single_gates=REVERSIBLE_GATES, multi_probability=0.4)
+        start = np.zeros(2 ** num_qubits, dtype=complex)
+        start[index] = 1j
+        dense = QuantumComputer(d, backend=SimulationBackend.DENSE)
+        computer = QuantumComputer(d)
+
+        np.testing.assert_allclose(dense.compute(start), computer.compute(start), atol=1e-10)
+        np.testing.assert_allclose(dense.compute_batch([0, index, 3]), computer.compute_batch([0, index, 3]), atol=1e-10)
+        self.assertEqual(dense.probabilities(index).keys(), computer.probabilities(index).keys())
+        self.assertEqual(computer.probabilities(index), {outcome: float(count) / 10 for outcome, count in computer.sample(index, 10).items()})
+
+    def test_wide_circuit(self):
+        computer = QuantumComputer(build_copy_circuit(80))
+
+        self.assertEqual({'1' * 80: 1.0}, computer.probabilities(0))
+        self.assertEqual({'1' * 80: 7}, computer.sample(0, 7))
+        self.assertRaises(ValueError, lambda: computer.truth_table())
+
+    def test_superposition_is_not_reversible(self):
+        d = build_random_circuit(3, 6, 7)
+        d.set_operation(0, 0, OperationType.H)
+        computer = QuantumComputer(d)
+
+        self.assertFalse(ReversibleCircuit.is_reversible(computer._lower_operations(computer._convert_operations_list())))
+        self.assertRaises(ValueError, lambda: computer.truth_table())
+
+    def test_phase_steps(self):
+        d = CircuitDefinition(2)
+        d.set_operation(0, 0, OperationType.X)
+        d.set_operation(0, 1, OperationType.T)
+        d.set_multi_operation(1, 0, 2, MultiOperationType.CS)
+        d.set_operation(1, 3, OperationType.Y)
+        computer = QuantumComputer(d)
+        circuit = ReversibleCircuit(2, computer._lower_operations(computer._convert_operations_list()))
+
+        # X gives |10>, T adds e^(i pi/4), CS adds nothing while its target (qubit 1) is 0, and Y gives i|11>
+        self.assertEqual((0b11, 3), circuit.evaluate_index(0b00))
+        outputs, phases = circuit.evaluate(np.array([0b00, 0b01]))
+        np.testing.assert_array_equal([0b11, 0b10], outputs)
+        np.testing.assert_array_equal([3, (1 + 2 + 6) % 8], phases)
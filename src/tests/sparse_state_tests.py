@@ -0,0 +1,157 @@
+import unittest
+
+import numpy as np
+from parameterized import parameterized
+
+from base.compute import QuantumComputer, SimulationBackend
+from base.fusion import fuse_gates
+from base.models import CircuitDefinition, OperationType, MultiOperationType
+from base.sparse_state import SparseState
+from tests.compute_tests import build_random_circuit, reference_unitary
+
+
+def build_oracle_circuit(num_qubits: int, superposed: int, depth: int, seed: int) -> CircuitDefinition:
+    """H on the first *superposed* qubits, random X, T, S, CNOT, CZ and SWAP gates, then H on those qubits again"""
+    rng = np.random.default_rng(seed)
+    d = CircuitDefinition(num_qubits)
+    for qubit in range(superposed):
+        d.set_operation(qubit, 0, OperationType.H)
+    for time in range(1, depth + 1):
+        free = list(range(num_qubits))
+        rng.shuffle(free)
+        while len(free) > 1:
+            qubit, other = free.pop(), free.pop()
+            roll = rng.random()
+            if roll < 0.4:
+                d.set_multi_operation(qubit, other, time, [MultiOperationType.CNOT, MultiOperationType.CZ, MultiOperationType.SWAP][rng.integers(3)])
+            elif roll < 0.7:
+                d.set_operation(qubit, time, [OperationType.X, OperationType.T, OperationType.S][rng.integers(3)])
+    for qubit in range(superposed):
+        d.set_operation(qubit, depth + 1, OperationType.H)
+    for qubit in range(num_qubits):
+        d.set_operation(qubit, depth + 2, OperationType.MEASURE)
+    return d
+
+
+class SparseStateTest(unittest.TestCase):
+
+    @parameterized.expand([
+        (2, 6, 0, False),
+        (3, 10, 1, False),
+        (5, 12, 2, True),
+        (6, 16, 3, True),
+    ])
+    def test_matches_reference_unitary(self, num_qubits: int, depth: int, seed: int, fuse: bool):
+        d = build_random_circuit(num_qubits, depth, seed)
+        computer = QuantumComputer(d)
+        gates = computer._lower_operations(computer._convert_operations_list()[:-1])
+        if fuse:
+            gates = fuse_gates(gates).gates
+        state = SparseState.from_basis_state(num_qubits, 1)
+
+        for gate in gates:
+            state.apply(gate)
+
+        np.testing.assert_allclose(reference_unitary(d)[:, 1], state.to_state_vector(), atol=1e-10)
+        self.assertTrue(np.all(np.diff(state.indices) > 0))
+
+    def test_cancelled_amplitudes_are_removed(self):
+        d = CircuitDefinition(3)
+        d.set_operation(1, 0, OperationType.H)
+        d.set_operation(1, 1, OperationType.H)
+        d.set_operation(1, 2, OperationType.MEASURE)
+        computer = QuantumComputer(d)
+        state = SparseState.from_basis_state(3, 0)
+
+        for gate in computer._lower_operations(computer._convert_operations_list()[:-1]):
+            state.apply(gate)
+
+        self.assertEqual([0], list(state.indices))
+        self.assertEqual(0.0, state.discarded_weight)
+
+    def test_pruning_reports_discarded_weight(self):
+        amplitudes = np.array([np.sqrt(0.9), np.sqrt(0.09), np.sqrt(0.01)])
+        state = SparseState.from_state_vector(np.array([amplitudes[0], 0, amplitudes[1], 0, 0, 0, 0, amplitudes[2]]), prune_threshold=0.05)
+
+        self.assertEqual([0, 2], list(state.indices))
+        self.assertAlmostEqual(0.01, state.discarded_weight)
+
+    def test_measurement_probabilities(self):
+        d = build_random_circuit(5, 10, 4)
+        computer = QuantumComputer(d)
+        state = SparseState.from_basis_state(5, 3)
+        for gate in computer._lower_operations(computer._convert_operations_list()[:-1]):
+            state.apply(gate)
+
+        expected = QuantumComputer(d, backend=SimulationBackend.DENSE).probabilities(3)
+        actual = state.measurement_probabilities([0, 1, 2, 3, 4])
+
+        self.assertEqual(set(expected), {outcome for outcome, probability in actual.items() if probability > 1e-12})
+        for outcome, probability in expected.items():
+            self.assertAlmostEqual(probability, actual[outcome], places=10)
+
+
+class SparseStateBackendTest(unittest.TestCase):
+
+    @parameterized.expand([
+        (4, 2, 8, 0),
+        (6, 3, 10, 1),
+        (8, 8, 6, 2),
+    ])
+    def test_matches_dense_backend(self, num_qubits: int, superposed: int, depth: int, seed: int):
+        d = build_oracle_circuit(num_qubits, superposed, depth, seed)
+        dense = QuantumComputer(d, backend=SimulationBackend.DENSE)
+        computer = QuantumComputer(d, backend=SimulationBackend.SPARSE_STATE)
+
+        np.testing.assert_allclose(dense.compute(6), computer.compute(6), atol=1e-10)
+        expected = dense.probabilities(6)
+        actual = computer.probabilities(6)
+        self.assertEqual(set(expected), set(actual))
+        for outcome, probability in expected.items():
+            self.assertAlmostEqual(probability, actual[outcome], places=10)
+        self.assertEqual(100, sum(computer.sample(6, 100, seed=1).values()))
+
+    def test_switches_to_dense_and_back(self):
+        d = build_oracle_circuit(6, 6, 0, 5)
+        computer = QuantumComputer(d, backend=SimulationBackend.SPARSE_STATE, sparse_fill_ratio=1 / 4)
+        columns = computer._convert_operations_list()[:-1]
+
+        column, state = computer._evolve_sparse_state(SparseState.from_basis_state(6, 0), columns, 0, switch_back=False)
+        final_state = computer._simulate_sparse_state(0)
+
+        self.assertEqual(1, column)
+        self.assertIsInstance(state, np.ndarray)
+        # the second layer of H gates takes the state back to a single basis state
+        self.assertIsInstance(final_state, SparseState)
+        self.assertEqual(1, len(final_state))
+
+    def test_fill_ratio_is_configurable(self):
+        d = build_oracle_circuit(5, 5, 4, 6)
+        computer = QuantumComputer(d, backend=SimulationBackend.SPARSE_STATE, sparse_fill_ratio=1.0)
+        columns = computer._convert_operations_list()[:-1]
+
+        column, state = computer._evolve_sparse_state(SparseState.from_basis_state(5, 0), columns, 0, switch_back=False)
+
+        self.assertEqual(len(columns), column)
+        self.assertIsInstance(state, SparseState)
+
+    def test_pruning_threshold(self):
+        d = CircuitDefinition(2)
+        d.set_operation(0, 0, OperationType.H)
+        d.set_operation(0, 1, OperationType.T)
+        d.set_operation(0, 2, OperationType.H)
+        d.set_operation(0, 3, OperationType.MEASURE)
+        computer = QuantumComputer(d, backend=SimulationBackend.SPARSE_STATE, sparse_fill_ratio=1.0, prune_threshold=0.2)
+
+        result = computer.compute(0)
+
+        # H T H leaves |1> with probability sin(pi/8)^2 = 0.146, which is pruned
+        self.assertEqual(1, np.count_nonzero(result))
+        self.assertAlmostEqual(np.sin(np.pi / 8) ** 2, computer.last_discarded_weight)
+
+    def test_auto_starts_sparse_on_many_qubits(self):
+        d = build_oracle_circuit(QuantumComputer.SPARSE_STATE_MIN_QUBITS, 4, 12, 7)
+
+        result = QuantumComputer(d).compute(9)
+
+        np.testing.assert_allclose(QuantumComputer(d, backend=SimulationBackend.DENSE).compute(9), result, atol=1e-10)
@@ -0,0 +1,115 @@
+import unittest
+
+import numpy as np
+from parameterized import parameterized
+
+from base.compute import QuantumComputer, SimulationBackend
+from base.models import CircuitDefinition, OperationType, MultiOperationType
+from base.stabilizer import OutcomeDistribution, StabilizerTableau
+from tests.compute_tests import build_random_circuit
+
+
+CLIFFORD_SINGLE_GATES = [OperationType.H, OperationType.S, OperationType.X, OperationType.Y, OperationType.Z]
+CLIFFORD_MULTI_GATES = [MultiOperationType.CNOT, MultiOperationType.CZ, MultiOperationType.SWAP]
+
+
+def build_clifford_circuit(num_qubits: int, depth: int, seed: int, measured: list[int]) -> CircuitDefinition:
+    d = build_random_circuit(num_qubits, depth, seed, CLIFFORD_SINGLE_GATES, CLIFFORD_MULTI_GATES)
+    for qubit in range(num_qubits):
+        if qubit not in measured:
+            d.drop_operation(qubit, depth)
+    return d
+
+
+class StabilizerBackendTest(unittest.TestCase):
+
+    @parameterized.expand([
+        (2, 6, 0, [0, 1], 0),
+        (3, 8, 1, [0, 1, 2], 5),
+        (4, 10, 2, [1, 3], 9),
+        (5, 12, 3, [0, 2, 4], 17),
+        (6, 14, 4, [5], 40),
+        (7, 20, 5, [0, 1, 2, 3, 4, 5, 6], 100),
+    ])
+    def test_matches_state_vector_probabilities(self, num_qubits: int, depth: int, seed: int, measured: list[int], index: int):
+        d = build_clifford_circuit(num_qubits, depth, seed, measured)
+
+        expected = QuantumComputer(d, backend=SimulationBackend.DENSE).probabilities(index)
+        actual = QuantumComputer(d, backend=SimulationBackend.STABILIZER).probabilities(index)
+
+        self.assertEqual(set(expected), set(actual))
+        for outcome, probability in expected.items():
+            self.assertAlmostEqual(probability, actual[outcome], places=10)
+
+    def test_ghz_state_on_hundreds_of_qubits(self):
+        num_qubits = 300
+        d = CircuitDefinition(num_qubits)
+        d.set_operation(0, 0, OperationType.H)
+        for qubit in range(1, num_qubits):
+            d.set_multi_operation(qubit, qubit - 1, qubit, MultiOperationType.CNOT)
+        for qubit in range(num_qubits):
+            d.set_operation(qubit, num_qubits, OperationType.MEASURE)
+
+        computer = QuantumComputer(d)
+        probabilities = computer.probabilities(0)
+        counts = computer.sample(0, 1000, seed=1)
+
+        self.assertEqual({"0" * num_qubits: 0.5, "1" * num_qubits: 0.5}, probabilities)
+        self.assertEqual({"0" * num_qubits, "1" * num_qubits}, set(counts))
+        self.assertEqual(1000, sum(counts.values()))
+
+    def test_state_vector_input_that_is_a_basis_state(self):
+        d = build_clifford_circuit(3, 6, 10, [0, 2])
+        start = np.zeros(8, dtype=complex)
+        start[6] = 1j
+
+        expected = QuantumComputer(d, backend=SimulationBackend.DENSE).probabilities(start)
+        actual = QuantumComputer(d, backend=SimulationBackend.STABILIZER).probabilities(start)
+
+        self.assertEqual(set(expected), set(actual))
+
+    def test_rejects_non_clifford_circuit(self):
+        d = CircuitDefinition(2)
+        d.set_operation(0, 0, OperationType.T)
+        d.set_operation(0, 1, OperationType.MEASURE)
+
+        computer = QuantumComputer(d, backend=SimulationBackend.STABILIZER)
+
+        self.assertRaises(ValueError, lambda: computer.probabilities(0))
+
+    def test_does_not_compute_state_vectors(self):
+        d = build_clifford_circuit(2, 4, 11, [0, 1])
+
+        computer = QuantumComputer(d, backend=SimulationBackend.STABILIZER)
+
+        self.assertRaises(ValueError, lambda: computer.compute([1, 0, 0, 0]))
+
+    def test_too_many_outcomes_to_list(self):
+        num_qubits = OutcomeDistribution.MAX_ENUMERATED_BITS + 1
+        tableau = StabilizerTableau(num_qubits)
+        for qubit in range(num_qubits):
+            tableau.apply_h(qubit)
+
+        distribution = tableau.measurement_distribution(list(range(num_qubits)))
+
+        self.assertEqual(num_qubits, distribution.num_random_bits)
+        self.assertRaises(ValueError, distribution.probabilities)
+
+    def test_auto_lists_too_many_outcomes_from_state_vector(self):
+        d = CircuitDefinition(5)
+        for qubit in range(5):
+            d.set_operation(qubit, 0, OperationType.H)
+            d.set_operation(qubit, 1, OperationType.MEASURE)
+
+        original_bits = OutcomeDistribution.MAX_ENUMERATED_BITS
+        try:
+            OutcomeDistribution.MAX_ENUMERATED_BITS = 3
+            probabilities = QuantumComputer(d).probabilities(0)
+            stabilizer_computer = QuantumComputer(d, backend=SimulationBackend.STABILIZER)
+            self.assertRaises(ValueError, lambda: stabilizer_computer.probabilities(0))
+        finally:
+            OutcomeDistribution.MAX_ENUMERATED_BITS = original_bits
+
+        self.assertEqual(32, len(probabilities))
+        for probability in probabilities.values():
+            self.assertAlmostEqual(1 / 32, probability, places=12)
@@ -0,0 +1,56 @@
+import unittest
+
+import numpy as np
+from parameterized import parameterized
+
+from base.compute import QuantumComputer
+from base.models import CircuitDefinition, OperationType, MultiOperationType
+from tests.compute_tests import build_random_circuit, reference_unitary
+
+
+class TensorNetworkTest(unittest.TestCase):
+
+    @parameterized.expand([
+        (2, 6, 0, True),
+        (3, 8, 1, False),
+        (4, 10, 2, True),
+        (5, 12, 3, False),
+        (7, 12, 4, True),
+    ])
+    def test_matches_unitary(self, num_qubits: int, depth: int, seed: int, fuse: bool):
+        d = build_random_circuit(num_qubits, depth, seed)
+        unitary = reference_unitary(d)
+        start = seed % 2 ** num_qubits
+        outputs = list(range(2 ** num_qubits))
+
+        amplitudes = QuantumComputer(d, fuse_gates=fuse).amplitudes(outputs, start)
+
+        np.testing.assert_allclose(unitary[:, start], amplitudes, atol=1e-10)
+
+    def test_amplitudes_of_wide_circuit(self):
+        num_qubits = 80
+        d = CircuitDefinition(num_qubits)
+        d.set_operation(0, 0, OperationType.H)
+        for qubit in range(1, num_qubits):
+            d.set_multi_operation(qubit, qubit - 1, qubit, MultiOperationType.CNOT)
+        d.set_operation(num_qubits - 1, num_qubits, OperationType.T)
+        for qubit in range(num_qubits):
+            d.set_operation(qubit, num_qubits + 1, OperationType.MEASURE)
+
+        computer = QuantumComputer(d)
+        amplitudes = computer.amplitudes([0, 2 ** num_qubits - 1, 1], 0)
+
+        np.testing.assert_allclose([1 / np.sqrt(2), np.exp(np.pi * 1j / 4) / np.sqrt(2), 0], amplitudes, atol=1e-12)
+        self.assertLessEqual(computer.last_contraction_width, 4)
+
+    def test_rejects_wide_contraction(self):
+        d = build_random_circuit(6, 20, 5)
+        original_width = QuantumComputer.MAX_CONTRACTION_WIDTH
+        try:
+            QuantumComputer.MAX_CONTRACTION_WIDTH = 2
+            computer = QuantumComputer(d)
+            self.assertRaises(ValueError, lambda: computer.amplitudes([0], 0))
+        finally:
+            QuantumComputer.MAX_CONTRACTION_WIDTH = original_width
+
+        self.assertGreater(computer.last_contraction_width, 2)
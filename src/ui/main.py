@@ -9,8 +9,9 @@ import uuid
 import ghostscript
 
 
-from base.compute import QuantumComputer
+from base.compute import QuantumComputer, SimulationBackend
 from base.models import CircuitDefinition, OperationType, MultiOperationType
+from base.planner import ExecutionPlan, ExecutionPlanner
 from base.serialization import JsonSerializer, JsonParsingError, JsonDeserializer
 from ui.alerts import AlertManager
 from ui.draw.canvas import ModelingCanvas
@@ -44,10 +45,29 @@ def get_example_circuit():
 
 
 class CanvasDetails:
-    def __init__(self, canvas: ModelingCanvas, name: str, last_save_name: str = None):
+    def __init__(self, canvas: ModelingCanvas, name: str, last_save_name: str = None, precision: str = "double"):
         self.canvas = canvas
         self.name = name
         self.last_save_name = last_save_name
+        # kept between runs, per backend, precision and whether they keep their intermediate states, so that after
+        # an edit only the changed part of the circuit is simulated again
+        self._computers: dict[tuple[SimulationBackend, str, bool], QuantumComputer] = {}
+        self.set_precision(precision)
+
+    def set_precision(self, precision: str):
+        # the intermediate states of the other precision would only take up memory until it is switched back
+        self._computers.clear()
+        self.precision = precision
+
+    def computer_for(self, plan: ExecutionPlan) -> QuantumComputer:
+        """The kept computer to run *plan* on, with the backend, precision and prefix tracking that the plan chose"""
+        key = (plan.backend, plan.precision, plan.track_prefix_states)
+        if key not in self._computers:
+            self._computers[key] = QuantumComputer(
+                self.canvas.get_circuit(), backend=plan.backend, track_prefix_states=plan.track_prefix_states,
+                precision=plan.precision
+            )
+        return self._computers[key]
 
 
 class App(tk.Tk):
@@ -66,6 +86,10 @@ class App(tk.Tk):
 
         self._used_new_pages: int = 0
         self._canvases: list[CanvasDetails] = []
+        # "double" or "single", see QuantumComputer.PRECISIONS
+        self._precision: str = "double"
+        # runs that would need more memory or time than this allows are refused or downgraded before they start
+        self._planner = ExecutionPlanner()
 
         self._is_ctrl: bool = False
 
@@ -214,12 +238,27 @@ class App(tk.Tk):
         file_menu.add_separator()
         file_menu.add_command(label="Exit", command=self.destroy)
 
+        simulation_menu = tk.Menu(menubar, tearoff=0)
+        self._single_precision = tk.BooleanVar(value=self._precision == "single")
+        simulation_menu.add_checkbutton(
+            label="Single Precision",
+            variable=self._single_precision,
+            command=self._handle_toggle_precision
+        )
+
         help_menu = tk.Menu(menubar, tearoff=0)
         help_menu.add_command(label="About", command=self._show_about)
 
         menubar.add_cascade(label="File", menu=file_menu)
+        menubar.add_cascade(label="Simulation", menu=simulation_menu)
         menubar.add_cascade(label="Help", menu=help_menu)
 
+    def _handle_toggle_precision(self):
+        # half the memory for large circuits, at the cost of accuracy (the sidebar shows the norm drift of every run)
+        self._precision = "single" if self._single_precision.get() else "double"
+        for details in self._canvases:
+            details.set_precision(self._precision)
+
     def _handle_load_circuit(self):
         filename = filedialog.askopenfilename(
             filetypes=[
@@ -313,7 +352,7 @@ class App(tk.Tk):
             callback_export_image=self._handle_export_image
         )
         canvas.pack(side=tk.BOTTOM, fill=tk.BOTH, expand=True)
-        self._canvases.append(CanvasDetails(canvas=canvas, name=title, last_save_name=current_file_name))
+        self._canvases.append(CanvasDetails(canvas=canvas, name=title, last_save_name=current_file_name, precision=self._precision))
 
         # show it
         self._tabs.show_tab(page_num)
@@ -325,25 +364,27 @@ class App(tk.Tk):
         circuit: CircuitDefinition = canvas.get_circuit()
 
         # validate
-        validate_result = UIExecutionValidator.can_evaluate(circuit)
+        validate_result = UIExecutionValidator.can_evaluate(circuit, self._planner, details.precision)
         if not validate_result.success:
             self._alerts.show(validate_result.message, 8000)
             return
+
+        # show the estimate before anything is allocated
+        self._alerts.show(validate_result.message, 8000 if validate_result.plan.downgraded else 3000)
+        self.update_idletasks()
+        computer = details.computer_for(validate_result.plan)
         
-        # determine the input standard basis state vector
-        num_qubits = circuit.num_qubits
-        input_vector = [0 for _ in range(2 ** num_qubits)]
+        # determine the input standard basis state; the computer takes its index, so no 2^n input list is built
         basis_vector_1_index = int(''.join(canvas.get_qubit_values()), 2) # this because this gives the standard basis vector e_{binary string}
-        input_vector[basis_vector_1_index] = 1
         # compute result vector
-        res = QuantumComputer(circuit).compute(input_vector)
+        res = computer.compute(basis_vector_1_index)
 
         # present results in the sidebar
         if not self._sidebar_shown:
             self._panes.add(self._sidebar)
             self._sidebar_shown = True
         
-        self._sidebar.show_new_results(res, circuit.num_qubits)
+        self._sidebar.show_new_results(res, circuit.num_qubits, computer.last_norm_drift)
 
     def _on_click_stop(self):
         self._alerts.show("Feature not implemented", 5000)
@@ -13,11 +13,18 @@ class Sidebar(ttk.Frame):
     SIDEBAR_INITIAL_WIDTH_ITEMS = 360
     SIDEBAR_INITIAL_HEIGHT_GRAPH = 240
     MAX_QUBITS_FOR_GRAPH = 4
+    # the table gets one row per outcome, and Tk slows down to a freeze long before 2^20 rows; only the most likely
+    # outcomes get a row, and the rest are summed up in one
+    MAX_RESULT_ROWS = 1024
 
     def __init__(self, parent):
         super().__init__(parent, padding=(0, 0, 0, 15))
 
         self._results: list[tuple[str, float]] = []
+        # the number and total probability of the outcomes that did not get a row, see MAX_RESULT_ROWS
+        self._hidden_results: tuple[int, float] = (0, 0.0)
+        # how far the norm of the last result drifted, for results computed in single precision
+        self._norm_drift: float | None = None
 
         self._recieved_results: bool = False
         self._graph_is_collapsed: bool = False
@@ -81,18 +88,35 @@ class Sidebar(ttk.Frame):
         self.grid_columnconfigure(0, weight=1)
 
 
-    def _interpret_results(self, results: list[float], qubits: int):
-        render_results : list[tuple[str, int]] = []
-        for index, res in enumerate(results):
+    def _interpret_results(self, results: np.ndarray, qubits: int):
+        render_results : list[tuple[str, float]] = []
+        # the results may be in single or double precision, real or complex; the probabilities are plain floats either way
+        probabilities = np.abs(np.asarray(results)) ** 2
+        indices = np.arange(len(probabilities))
+        if len(probabilities) > Sidebar.MAX_RESULT_ROWS:
+            # the most likely outcomes, still listed in the order of their states
+            indices = np.sort(np.argpartition(probabilities, -Sidebar.MAX_RESULT_ROWS)[-Sidebar.MAX_RESULT_ROWS:])
+        self._hidden_results = (
+            len(probabilities) - len(indices),
+            float(np.sum(probabilities) - np.sum(probabilities[indices]))
+        )
+        for index in indices:
             render_results.append((
                 format(index, f"0{qubits}b"), # this is the index AKA the binary string outcome the result is associated to
-                abs(res)**2 # this is the actual probability
+                float(probabilities[index]) # this is the actual probability
             ))
         return render_results
 
-    def show_new_results(self, results: list[float], qubits: int):
+    def show_new_results(self, results: np.ndarray, qubits: int, norm_drift: float | None = None):
+        """
+        :param results:       the final state vector, in either precision
+        :param qubits:        the number of qubits of the circuit
+        :param norm_drift:    for results computed in single precision, how far the norm drifted (see
+                              :attr:`base.compute.QuantumComputer.last_norm_drift`), shown below the results
+        """
         # extract bit combinations information
         self._results = self._interpret_results(results, qubits)
+        self._norm_drift = norm_drift
         self._refresh_results_table()
 
         if qubits <= Sidebar.MAX_QUBITS_FOR_GRAPH:
@@ -130,6 +154,11 @@ class Sidebar(ttk.Frame):
         # clear old result
         self._table_tree.delete(*self._table_tree.get_children())
         tree_data = [('', 1, "State", ["p"])] + [('', i + 2, f"|{state}〉", [p]) for i, (state, p) in enumerate(self._results)]
+        hidden, hidden_probability = self._hidden_results
+        if hidden:
+            tree_data.append(('', len(tree_data) + 1, f"{hidden} more states", [hidden_probability]))
+        if self._norm_drift is not None:
+            tree_data.append(('', len(tree_data) + 1, "Norm drift", [f"{self._norm_drift:.1e}"]))
 
         for i, item in enumerate(tree_data):
             parent, iid, text, values = item
@@ -1,11 +1,14 @@
 
 from base.models import CircuitDefinition, OperationType, QuBitOperationSingleParam
+from base.planner import ExecutionPlan, ExecutionPlanner
 
 
 class ValidationResult:
-    def __init__(self, success: bool, message: str | None) -> None:
+    def __init__(self, success: bool, message: str | None, plan: ExecutionPlan | None = None) -> None:
         self.success = success
         self.message = message
+        # how the circuit should be simulated within the budget, if it was checked against one
+        self.plan = plan
 
     @staticmethod
     def failure(message : str):
@@ -17,7 +20,14 @@ class ValidationResult:
 
 class UIExecutionValidator:
     @staticmethod
-    def can_evaluate(circuit : CircuitDefinition) -> ValidationResult:
+    def can_evaluate(circuit : CircuitDefinition, planner: ExecutionPlanner | None = None, precision: str = "double") -> ValidationResult:
+        """
+        :param circuit:      the circuit to evaluate
+        :param planner:      if given, the run is also checked against the budget of the planner before anything is
+                             allocated, for a computer that keeps its intermediate states (as the editor's computers do).
+                             The result then carries the plan, and the estimate as its message
+        :param precision:    the precision the run was requested in
+        """
         # the messages could be expanded to provide more details on what went wrong.
         # the main idea is that we could probably expand the UI to allow multiple measuring operations in the future, among other things
         # the current setup is actually a bit limiting. e.g. 
@@ -31,7 +41,13 @@ class UIExecutionValidator:
         
         if not UIExecutionValidator._validate_has_no_measure_before_last(circuit):
             return ValidationResult.failure("Only one computational basis measuring time is currently supported, and this measuring must take place at the very end of the circuit timeline. If multiple qubits must be measured, ensure their measure gates are placed at the same time")
-        
+
+        if planner is not None:
+            plan = planner.plan(circuit, precision=precision, track_prefix_states=True)
+            if not plan.allowed:
+                return ValidationResult.failure(plan.message)
+            return ValidationResult(True, plan.message, plan)
+
         return ValidationResult.ok()
     
     @staticmethod